@@ -1,10 +1,43 @@
 """
 Client and server using classes
+
+Requests and responses travel as frames: a 4 byte length (big endian) followed by
+that many bytes of UTF-8 text, so messages of any size survive TCP segmentation.
+GETALL streams the directory as a series of frames with up to PAGE_SIZE entries each,
+terminated by an empty frame. GETPAGE:<cursor>:<count> returns a single page and the
+cursor of the next one ("<cursor length>:<next cursor>|<entries>", see split_page). The cursor is
+the last name of the previous page (empty for the first page, and returned empty after the last
+page), so pages stay correct while entries are added or removed in between. It is length-prefixed
+in responses and the last field but one of requests, so names containing separators page correctly.
+MGET:<name>;<name>;... looks up many names at once ("<name>:<number>;...").
+PREFIX:<prefix> and RANGE:<start>:<stop> return the entries whose name starts with prefix or
+lies in [start, stop) (no upper limit if stop is empty), sorted by name. PUT:<name>:<number>
+adds or changes an entry, DELETE:<name> removes one. PUT rejects names containing the separators
+of the responses (":", ";" and "|") and numbers containing ";".
+
+The server answers the requests of a connection in order, so a client may send further
+requests before the responses of earlier ones arrive (pipelining) and match them by order.
+serve_concurrent stops reading the requests of a client while its responses pile up
+(MAX_PENDING of them queued or a full send buffer), so a client that does not read
+cannot make the server buffer without limit.
+
+PreforkServer runs several server processes on the same port (SO_REUSEPORT) to use more than
+one CPU core; the kernel distributes incoming connections among them.
 """
 
+import collections
+import itertools
 import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import selectors
+import signal
 import socket
+import struct
+import time
 import const_cs
+from directory_store import DirectoryStore
 from context import lab_logging
 
 lab_logging.setup(stream_level=logging.INFO)  # init loging channels for the lab
@@ -12,25 +45,109 @@ lab_logging.setup(stream_level=logging.INFO)  # init loging channels for the lab
 
 # pylint: disable=logging-not-lazy, line-too-long
 
+_LENGTH = struct.Struct('!I')
+
+# characters that would corrupt the entry lists of responses ("<name>:<number>;...")
+NAME_SEPARATORS = ":;|"
+NUMBER_SEPARATORS = ";"
+
+
+class FrameError(ValueError):
+    """ A frame violating the protocol (too large or not UTF-8) """
+
+
+# initial content of the telephone directory
+DIRECTORY = {
+    "Alpha": "1234567890",
+    "Bravo": "2345678901",
+    "Charlie": "3456789012",
+    "Ölaf": "3456789012"
+}
+
+
+def frame(text):
+    """Encode a message as a length-prefixed frame"""
+    data = text.encode('utf-8')
+    return _LENGTH.pack(len(data)) + data
+
+
+def recv_exactly(sock, size):
+    """Receive exactly size bytes (None if the connection closes first)"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def _check_size(size):
+    if size > const_cs.MAX_FRAME:
+        raise FrameError(f"frame of {size} bytes exceeds {const_cs.MAX_FRAME} bytes")
+
+
+def _decode(data):
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise FrameError("frame is not valid UTF-8") from e
+
+
+def recv_frame(sock):
+    """Receive a frame and return its message (None if the connection closed, FrameError if invalid)"""
+    header = recv_exactly(sock, _LENGTH.size)
+    if header is None:
+        return None
+    (size,) = _LENGTH.unpack(header)
+    _check_size(size)
+    data = recv_exactly(sock, size)
+    return None if data is None else _decode(data)
+
+
+def split_frames(buffer):
+    """Remove all complete frames from a receive buffer and return their messages (FrameError if invalid)"""
+    messages = []
+    while len(buffer) >= _LENGTH.size:
+        (size,) = _LENGTH.unpack_from(buffer)
+        _check_size(size)
+        if len(buffer) < _LENGTH.size + size:
+            break
+        messages.append(_decode(bytes(buffer[_LENGTH.size:_LENGTH.size + size])))
+        del buffer[:_LENGTH.size + size]
+    return messages
+
+
+def page_response(cursor, entries):
+    """Combine the cursor of the next page and the entries of a page into a GETPAGE response"""
+    return f"{len(cursor)}:{cursor}|{entries}"
+
+
+def split_page(response):
+    """Split a GETPAGE response into the cursor of the next page and the entries of the page"""
+    length, rest = response.split(":", 1)
+    length = int(length)
+    if rest[length:length + 1] != "|":
+        raise ValueError(f"invalid page response: {response[:80]}")
+    return rest[:length], rest[length + 1:]
+
+
 class Server:
     """ The server """
     _logger = logging.getLogger("vs2lab.lab1.clientserver.Server")
     _serving = True
 
-    def __init__(self):
+    def __init__(self, reuse_port=False):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # prevents errors due to "addresses in use"
+        if reuse_port:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)  # lets several servers share the port
         self.sock.bind((const_cs.HOST, const_cs.PORT))
         self.sock.settimeout(3)  # time out in order not to block forever
         self._logger.info("Server bound to socket " + str(self.sock))
 
         # In-memory telephone directory
-        self.directory = {
-            "Alpha": "1234567890",
-            "Bravo": "2345678901",
-            "Charlie": "3456789012",
-            "Ölaf": "3456789012"
-        }
+        self.directory = DirectoryStore(DIRECTORY)
 
     def close(self):
         self.sock.close()
@@ -46,21 +163,20 @@ class Server:
                 self._logger.info(f"Connection accepted from {address}")
                 while True:
                     try:
-                        data = connection.recv(1024).decode('utf-8')
-                        if not data:
+                        data = recv_frame(connection)
+                        if data is None:
                             self._logger.info("Client disconnected")
                             break  # Client has closed the connection
-                        if data.startswith("GETALL"):
-                            response = self.handle_getall()
-                        elif data.startswith("GET:"):
-                            name = data.split(":")[1]
-                            response = self.handle_get(name)
-                        else:
-                            response = "ERROR: Invalid command"
-                        connection.send(response.encode('utf-8'))
+                        for response in self.respond(data):
+                            connection.sendall(frame(response))
                     except BrokenPipeError:
                         self._logger.error("Broken pipe error - client may have disconnected.")
                         break  # Exit the loop if client has disconnected
+                    except FrameError as e:
+                        # the rest of the stream cannot be parsed anymore, so answer and drop the client
+                        self._logger.error(f"Invalid frame - dropping client: {e}")
+                        self._send_error(connection, e)
+                        break
             except socket.timeout:
                 continue
             finally:
@@ -70,15 +186,288 @@ class Server:
         self.sock.close()
         self._logger.info("Server down.")
 
+    def serve_concurrent(self):
+        """Start server to handle GET and GETALL requests of many clients at once (on one thread)"""
+        self.sock.listen(socket.SOMAXCONN)
+        self.sock.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
+        # receive buffer, send buffer and responses still to be sent (streams of frames) by client connection
+        clients = {}
+        while self._serving:
+            # wake up regularly to check whether to stop serving
+            for key, events in selector.select(timeout=1):
+                if key.fileobj is self.sock:
+                    self._accept(selector, clients)
+                    continue
+                connection = key.fileobj
+                if events & selectors.EVENT_READ:
+                    self._read(selector, clients, connection)
+                if events & selectors.EVENT_WRITE and connection in clients:
+                    self._write(selector, clients, connection)
+        for connection in clients:
+            selector.unregister(connection)
+            connection.close()
+        selector.close()
+        self.sock.close()
+        self._logger.info("Server down.")
+
+    def _accept(self, selector, clients):
+        """Accept all pending connections"""
+        while True:
+            try:
+                connection, address = self.sock.accept()
+            except BlockingIOError:
+                return
+            self._logger.info(f"Connection accepted from {address}")
+            connection.setblocking(False)
+            selector.register(connection, selectors.EVENT_READ)
+            clients[connection] = (bytearray(), bytearray(), collections.deque())
+
+    @staticmethod
+    def _send_error(connection, error):
+        """Tell a client about an invalid frame (as far as the connection takes it right away)"""
+        try:
+            connection.send(frame(f"ERROR: {error}"))
+        except OSError:
+            pass
+
+    def _drop(self, selector, clients, connection):
+        selector.unregister(connection)
+        del clients[connection]
+        connection.close()
+
+    def _read(self, selector, clients, connection):
+        """Receive data of a client and handle all complete requests"""
+        try:
+            data = connection.recv(const_cs.BUFFER_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except ConnectionError:
+            data = b''
+        if not data:
+            self._logger.info("Client disconnected")
+            self._drop(selector, clients, connection)
+            return
+        incoming, _, responses = clients[connection]
+        incoming += data
+        try:
+            requests = split_frames(incoming)
+        except FrameError as e:
+            self._logger.error(f"Invalid frame - dropping client: {e}")
+            self._send_error(connection, e)
+            self._drop(selector, clients, connection)
+            return
+        for request in requests:
+            responses.append(self.respond(request))
+        self._write(selector, clients, connection)
+
+    def _write(self, selector, clients, connection):
+        """Send as much of the pending responses as the connection takes without blocking"""
+        _, outgoing, responses = clients[connection]
+        while True:
+            # produce frames of streamed responses only as fast as they can be sent
+            while responses and len(outgoing) < const_cs.BUFFER_SIZE:
+                response = next(responses[0], None)
+                if response is None:
+                    responses.popleft()
+                else:
+                    outgoing += frame(response)
+            if not outgoing:
+                break
+            try:
+                sent = connection.send(outgoing)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionError:
+                self._logger.error("Broken pipe error - client may have disconnected.")
+                self._drop(selector, clients, connection)
+                return
+            del outgoing[:sent]
+        # wait for writability only while a response is pending, and stop reading further requests
+        # while the client does not take its responses (they are read once it catches up)
+        backlog = len(outgoing) >= const_cs.BUFFER_SIZE or len(responses) >= const_cs.MAX_PENDING
+        events = (0 if backlog else selectors.EVENT_READ) | (selectors.EVENT_WRITE if outgoing or responses else 0)
+        selector.modify(connection, events)
+
+    def respond(self, data):
+        """Handle a request and yield its response messages (several for GETALL)"""
+        if data == "GETALL":
+            # one pass over the directory, a page at a time
+            entries = iter(self.directory.items())
+            while True:
+                page = list(itertools.islice(entries, const_cs.PAGE_SIZE))
+                if page:
+                    yield self._format(page)
+                if len(page) < const_cs.PAGE_SIZE:
+                    break
+            yield ""  # end of stream
+        else:
+            yield self.handle_request(data)
+
+    def handle_request(self, data):
+        """Handle a GET, MGET, PREFIX, RANGE, GETPAGE, GETALL, PUT or DELETE request and return the response"""
+        try:
+            if data.startswith("GETALL"):
+                return self.handle_getall()
+            if data.startswith("MGET:"):
+                names = data[len("MGET:"):].split(";")
+                return self.handle_mget(names)
+            if data.startswith("GETPAGE:"):
+                # the cursor is a name and may contain ":" itself
+                cursor, count = data[len("GETPAGE:"):].rsplit(":", 1)
+                return page_response(*self.handle_getpage(cursor, int(count)))
+            if data.startswith("GET:"):
+                name = data.split(":")[1]
+                return self.handle_get(name)
+            if data.startswith("PREFIX:"):
+                return self.handle_prefix(data[len("PREFIX:"):])
+            if data.startswith("RANGE:"):
+                _, start, stop = data.split(":")
+                return self.handle_range(start, stop or None)
+            if data.startswith("PUT:"):
+                _, name, number = data.split(":", 2)
+                return self.handle_put(name, number)
+            if data.startswith("DELETE:"):
+                name = data.split(":")[1]
+                return self.handle_delete(name)
+        except ValueError:  # malformed arguments
+            pass
+        return "ERROR: Invalid command"
+
     def handle_get(self, name):
         """Handle GET request to retrieve a specific entry"""
         return f"{name}:{self.directory.get(name, 'NOT FOUND')}"
 
+    def handle_mget(self, names):
+        """Handle MGET request to retrieve many specific entries at once"""
+        return self._format((name, self.directory.get(name, 'NOT FOUND')) for name in names)
+
+    def handle_prefix(self, prefix):
+        """Handle PREFIX request to retrieve all entries whose name starts with prefix"""
+        return self._format(self.directory.prefix(prefix)) or "EMPTY"
+
+    def handle_range(self, start, stop):
+        """Handle RANGE request to retrieve all entries with start <= name < stop (None for no limit)"""
+        return self._format(self.directory.range(start, stop)) or "EMPTY"
+
+    def handle_put(self, name, number):
+        """Handle PUT request to add or change an entry"""
+        if not name or any(separator in name for separator in NAME_SEPARATORS):
+            return f"ERROR: Invalid name (empty or containing one of {NAME_SEPARATORS})"
+        if any(separator in number for separator in NUMBER_SEPARATORS):
+            return f"ERROR: Invalid number (containing {NUMBER_SEPARATORS})"
+        self.directory[name] = number
+        return f"{name}:{number}"
+
+    def handle_delete(self, name):
+        """Handle DELETE request to remove an entry"""
+        if self.directory.pop(name, None) is None:
+            return f"{name}:NOT FOUND"
+        return f"{name}:DELETED"
+
     def handle_getall(self):
         """Handle GETALL request to retrieve all entries"""
         if not self.directory:
             return "EMPTY"
-        return ";".join(f"{name}:{number}" for name, number in self.directory.items())
+        return self._format(self.directory.items())
+
+    def handle_getpage(self, cursor, count):
+        """Handle GETPAGE request to retrieve up to count entries following the name cursor ("" for the first page)"""
+        count = max(count, 1)
+        # one entry more tells whether another page follows
+        page = list(itertools.islice(self.directory.range(cursor, after=cursor != ""), count + 1))
+        next_cursor = page[count - 1][0] if len(page) > count else ""
+        return next_cursor, self._format(page[:count])
+
+    @staticmethod
+    def _format(entries):
+        return ";".join(f"{name}:{number}" for name, number in entries)
+
+
+class _Worker(Server):
+    """ A server process of a PreforkServer """
+
+    def __init__(self, directory, counters, index):
+        super().__init__(reuse_port=True)
+        self.directory = directory
+        self.counters = counters
+        self.index = index
+
+    def respond(self, data):
+        self.counters[self.index] += 1  # only this worker writes its counter
+        return super().respond(data)
+
+    def handle_request(self, data):
+        if data.startswith(("PUT:", "DELETE:")):
+            return "ERROR: Read-only directory"  # changes would only reach this worker's copy
+        return super().handle_request(data)
+
+
+def _run_worker(directory, counters, index):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor stops the workers
+    _Worker(directory, counters, index).serve_concurrent()
+
+
+class PreforkServer:
+    """ Supervisor of several server processes sharing one port """
+    _logger = logging.getLogger("vs2lab.lab1.clientserver.PreforkServer")
+    _serving = True
+
+    def __init__(self, workers=None, directory=None):
+        assert hasattr(socket, 'SO_REUSEPORT'), 'SO_REUSEPORT is not supported on this platform'
+        # forked workers share the snapshot copy-on-write instead of receiving a copy each (reading the few
+        # large objects of the store does not touch reference counts of per-entry objects spread over all pages)
+        self.context = multiprocessing.get_context('fork')
+        self.workers = workers or os.cpu_count()
+        self.directory = DirectoryStore(DIRECTORY if directory is None else directory)
+        # requests handled per worker, kept across restarts
+        self.counters = self.context.Array('Q', self.workers, lock=False)
+        self.processes = [None] * self.workers
+        self.started = [0.0] * self.workers
+        self.restarts = 0
+
+    def _start(self, index):
+        process = self.context.Process(target=_run_worker, name=f"Worker-{index}",
+                                       args=(self.directory, self.counters, index))
+        process.start()
+        self.processes[index] = process
+        self.started[index] = time.monotonic()
+
+    def stats(self):
+        """Return the number of requests handled in total and per worker and the number of restarts"""
+        per_worker = list(self.counters)
+        return {"requests": sum(per_worker), "per_worker": per_worker, "restarts": self.restarts}
+
+    def serve(self):
+        """Start the workers, restart those that exit and log their request counters regularly"""
+        for index in range(self.workers):
+            self._start(index)
+        self._logger.info(f"Server started {self.workers} workers on port {const_cs.PORT}")
+        reported = time.monotonic()
+        try:
+            while self._serving:
+                # wake up regularly to check whether to stop serving
+                exited = multiprocessing.connection.wait([p.sentinel for p in self.processes], timeout=1)
+                for index, process in enumerate(self.processes):
+                    if process.sentinel not in exited or not self._serving:
+                        continue
+                    process.join()
+                    self._logger.warning(f"{process.name} exited with code {process.exitcode} - restarting.")
+                    # do not restart a worker failing right away more than once a second
+                    time.sleep(max(0.0, self.started[index] + const_cs.RESTART_DELAY - time.monotonic()))
+                    self.restarts += 1
+                    self._start(index)
+                if time.monotonic() - reported >= const_cs.REPORT_INTERVAL:
+                    reported = time.monotonic()
+                    self._logger.info(f"Requests handled: {self.stats()}")
+        finally:
+            for process in self.processes:
+                process.terminate()
+            for process in self.processes:
+                process.join()
+            self._logger.info(f"Server down. Requests handled: {self.stats()}")
+
 
 class Client:
     """ The client """
@@ -89,20 +478,88 @@ class Client:
         self.sock.connect((const_cs.HOST, const_cs.PORT))
         self.logger.info("Client connected to socket " + str(self.sock))
 
+    def call(self, request):
+        """Send a request and return the (first) response"""
+        self.sock.sendall(frame(request))
+        return recv_frame(self.sock)
+
     def get(self, name):
         """Retrieve a specific entry by name"""
-        self.sock.send(f"GET:{name}".encode('utf-8'))
-        data = self.sock.recv(1024).decode('utf-8')
+        data = self.call(f"GET:{name}")
         print(data)
         return data
 
+    def pipeline(self, requests, depth=const_cs.PIPELINE_DEPTH):
+        """Send requests with up to depth of them awaiting a response and yield the responses in order"""
+        pending = 0
+        for request in requests:
+            assert request != "GETALL", 'GETALL responds with several frames, use stream_all'
+            if pending == depth:
+                yield recv_frame(self.sock)
+                pending -= 1
+            self.sock.sendall(frame(request))
+            pending += 1
+        for _ in range(pending):
+            yield recv_frame(self.sock)
+
+    def get_many(self, names, batch_size=const_cs.MGET_SIZE):
+        """Retrieve the numbers of many names with pipelined MGET requests (None for names not found)"""
+        names = list(names)
+        assert not any(";" in name for name in names), 'names must not contain ";"'
+        batches = (names[first:first + batch_size] for first in range(0, len(names), batch_size))
+        numbers = {}
+        for response in self.pipeline("MGET:" + ";".join(batch) for batch in batches):
+            for entry in response.split(";"):
+                name, number = entry.split(":", 1)
+                numbers[name] = None if number == 'NOT FOUND' else number
+        return numbers
+
     def get_all(self):
         """Retrieve all directory entries"""
-        self.sock.send("GETALL".encode('utf-8'))
-        data = self.sock.recv(1024).decode('utf-8')
+        data = ";".join(self.stream_all()) or "EMPTY"
+        print(data)
+        return data
+
+    def stream_all(self):
+        """Retrieve all directory entries as a stream of pages ("name:number;..." strings)"""
+        self.sock.sendall(frame("GETALL"))
+        while True:
+            page = recv_frame(self.sock)
+            if not page:  # end of stream (or connection closed)
+                return
+            yield page
+
+    def get_prefix(self, prefix):
+        """Retrieve all entries whose name starts with prefix"""
+        data = self.call(f"PREFIX:{prefix}")
         print(data)
         return data
 
+    def get_range(self, start, stop=""):
+        """Retrieve all entries with start <= name < stop (no upper limit if stop is empty)"""
+        data = self.call(f"RANGE:{start}:{stop}")
+        print(data)
+        return data
+
+    def put(self, name, number):
+        """Add or change an entry"""
+        data = self.call(f"PUT:{name}:{number}")
+        print(data)
+        return data
+
+    def delete(self, name):
+        """Remove an entry"""
+        data = self.call(f"DELETE:{name}")
+        print(data)
+        return data
+
+    def get_page(self, cursor="", count=const_cs.PAGE_SIZE):
+        """Retrieve a page of entries, returning the cursor of the next page ("" after the last) and the entries"""
+        response = self.call(f"GETPAGE:{cursor}:{count}")
+        if response.startswith("ERROR:"):
+            raise ValueError(response)
+        return split_page(response)
+
     def close(self):
         """Close the client socket"""
         self.sock.close()
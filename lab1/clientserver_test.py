@@ -1,6 +1,10 @@
 import random
+import socket
 import string
+import threading
+import time
 import unittest
+from unittest import mock
 import clientserver
 
 
@@ -9,12 +13,12 @@ import clientserver
 class TestServer(clientserver.Server):
     def __init__(self):
         # In-memory telephone directory
-        self.directory = {
+        self.directory = clientserver.DirectoryStore({
             "Alpha": "1234567890",
             "Bravo": "2345678901",
             "Charlie": "3456789012",
             "Ölaf": "3456789012"
-        }
+        })
 
 
 def generate_random_name():
@@ -57,6 +61,12 @@ class TestClientServer(unittest.TestCase):
         expected = "Alpha:1234567890;Bravo:2345678901;Charlie:3456789012;Ölaf:3456789012"
         self.assertEqual(response, expected)
 
+    def test_get_many(self):
+        """Test retrieving many entries in pipelined batches from the server."""
+        names = ["Alpha", "NonExistent", "Charlie"] * 1000
+        numbers = self.client.get_many(names, batch_size=7)
+        self.assertEqual(numbers, {"Alpha": "1234567890", "NonExistent": None, "Charlie": "3456789012"})
+
     def test_add_500_entries(self):
         """Stress test with 500 dynamically generated entries."""
         for _ in range(500):
@@ -88,6 +98,131 @@ class TestClientServer(unittest.TestCase):
         expected = "Alpha:1234567890;Bravo:2345678901;Charlie:3456789012;Ölaf:3456789012"
         self.assertEqual(response, expected, "Expected all directory entries in the specified format.")
 
+    def test_handle_request_get(self):
+        """Test dispatching a GET request using handle_request."""
+        response = self.server.handle_request("GET:Bravo")
+        self.assertEqual(response, "Bravo:2345678901", "Expected GET to be handled by handle_get.")
+
+    def test_handle_request_getall(self):
+        """Test dispatching a GETALL request using handle_request."""
+        response = self.server.handle_request("GETALL")
+        self.assertEqual(response, self.server.handle_getall(), "Expected GETALL to be handled by handle_getall.")
+
+    def test_handle_request_invalid(self):
+        """Test an unknown command using handle_request."""
+        response = self.server.handle_request("POST:Delta")
+        self.assertEqual(response, "ERROR: Invalid command", "Expected an error for an unknown command.")
+        response = self.server.handle_request("PUT:Delta")
+        self.assertEqual(response, "ERROR: Invalid command", "Expected an error for a malformed command.")
+
+    def test_handle_mget(self):
+        """Test retrieving several entries at once using handle_mget."""
+        response = self.server.handle_mget(["Bravo", "NonExistent", "Ölaf"])
+        self.assertEqual(response, "Bravo:2345678901;NonExistent:NOT FOUND;Ölaf:3456789012")
+
+    def test_handle_request_mget(self):
+        """Test dispatching an MGET request using handle_request."""
+        response = self.server.handle_request("MGET:Alpha;Charlie")
+        self.assertEqual(response, "Alpha:1234567890;Charlie:3456789012")
+
+    def test_handle_prefix(self):
+        """Test retrieving the entries starting with a prefix using handle_prefix."""
+        self.server.directory["Bravissimo"] = "4567890123"
+        self.assertEqual(self.server.handle_prefix("Bra"), "Bravissimo:4567890123;Bravo:2345678901")
+        self.assertEqual(self.server.handle_prefix("Zulu"), "EMPTY")
+
+    def test_handle_request_range(self):
+        """Test retrieving a range of names using handle_request."""
+        self.assertEqual(self.server.handle_request("RANGE:B:Charlie"), "Bravo:2345678901")
+        self.assertEqual(self.server.handle_request("RANGE:C:"), "Charlie:3456789012;Ölaf:3456789012")
+
+    def test_handle_request_put_and_delete(self):
+        """Test changing the directory using handle_request."""
+        self.assertEqual(self.server.handle_request("PUT:Delta:4567890123"), "Delta:4567890123")
+        self.assertEqual(self.server.handle_get("Delta"), "Delta:4567890123")
+        self.assertEqual(self.server.handle_request("DELETE:Alpha"), "Alpha:DELETED")
+        self.assertEqual(self.server.handle_request("DELETE:Alpha"), "Alpha:NOT FOUND")
+        self.assertEqual(self.server.handle_getall(),
+                         "Bravo:2345678901;Charlie:3456789012;Delta:4567890123;Ölaf:3456789012")
+
+    def test_handle_request_put_invalid(self):
+        """Test rejecting names with protocol separators and accepting numbers with colons."""
+        for name in ("A;B", "A|B", ""):
+            self.assertTrue(self.server.handle_request(f"PUT:{name}:123").startswith("ERROR: Invalid name"), name)
+        # by request, a colon ends the name
+        self.assertTrue(self.server.handle_put("A:B", "123").startswith("ERROR: Invalid name"))
+        self.assertTrue(self.server.handle_request("PUT:Delta:12;34").startswith("ERROR: Invalid number"))
+        self.assertEqual(self.server.handle_getall(),
+                         "Alpha:1234567890;Bravo:2345678901;Charlie:3456789012;Ölaf:3456789012")
+        self.assertEqual(self.server.handle_request("PUT:Delta:+49:123"), "Delta:+49:123")
+        self.assertEqual(self.server.handle_get("Delta"), "Delta:+49:123")
+
+    def test_put_and_delete_500_entries(self):
+        """Test that the index stays sorted while many entries are added and removed."""
+        self.server.directory = clientserver.DirectoryStore(self.server.directory, block_size=8)
+        expected = dict(self.server.directory)
+        for _ in range(500):
+            name, phone = generate_random_name(), generate_random_phone_number()
+            self.server.handle_put(name, phone)
+            expected[name] = phone
+        for name in list(expected)[::3]:
+            self.server.handle_delete(name)
+            del expected[name]
+        self.assertEqual(list(self.server.directory.items()),
+                         sorted(expected.items(), key=lambda entry: entry[0].encode()))
+        self.assertEqual(self.server.handle_mget(list(expected)), self.server._format(expected.items()))
+
+    def test_handle_getpage(self):
+        """Test paginating the directory using handle_getpage."""
+        cursor, entries = self.server.handle_getpage("", 3)
+        self.assertEqual((cursor, entries), ("Charlie", "Alpha:1234567890;Bravo:2345678901;Charlie:3456789012"))
+        cursor, entries = self.server.handle_getpage(cursor, 3)
+        self.assertEqual((cursor, entries), ("", "Ölaf:3456789012"), "Expected an empty cursor after the last page.")
+
+    def test_handle_getpage_while_changing(self):
+        """Test that pages neither skip nor repeat entries when the directory changes in between."""
+        cursor, _ = self.server.handle_getpage("", 2)
+        self.server.handle_delete("Alpha")
+        self.server.handle_put("Bert", "4567890123")
+        cursor, entries = self.server.handle_getpage(cursor, 2)
+        self.assertEqual((cursor, entries), ("", "Charlie:3456789012;Ölaf:3456789012"))
+
+    def test_handle_request_getpage_separators_in_names(self):
+        """Test paging by request through names containing the separators of the page protocol."""
+        self.server.directory = clientserver.DirectoryStore({"A|b": "1", "A:c": "2", "B": "3", "B|": "4"})
+        cursors, cursor = [], ""
+        while True:
+            cursor, _ = clientserver.split_page(self.server.handle_request(f"GETPAGE:{cursor}:1"))
+            if not cursor:
+                break
+            cursors.append(cursor)
+        self.assertEqual(cursors, ["A:c", "A|b", "B"], "Expected every name but the last as cursor.")
+        self.assertEqual(clientserver.split_page(clientserver.page_response("B|", "B|:4")), ("B|", "B|:4"))
+
+    def test_respond_streams_getall(self):
+        """Test streaming a large directory in pages using respond."""
+        for i in range(250):
+            self.server.directory[f"Name{i:03}"] = generate_random_phone_number()
+        pages = list(self.server.respond("GETALL"))
+        self.assertEqual(pages[-1], "", "Expected an empty frame to end the stream.")
+        self.assertEqual(len(pages), 4, "Expected pages of at most 100 entries.")
+        self.assertEqual(";".join(pages[:-1]), self.server.handle_getall())
+
+    def test_split_frames(self):
+        """Test extracting complete frames from a receive buffer."""
+        buffer = bytearray(clientserver.frame("GET:Alpha") + clientserver.frame("GETALL")[:5])
+        self.assertEqual(clientserver.split_frames(buffer), ["GET:Alpha"])
+        buffer += clientserver.frame("GETALL")[5:]
+        self.assertEqual(clientserver.split_frames(buffer), ["GETALL"])
+        self.assertEqual(len(buffer), 0, "Expected the buffer to be consumed.")
+
+    def test_split_frames_invalid(self):
+        """Test rejecting oversized and non UTF-8 frames."""
+        with self.assertRaises(clientserver.FrameError):
+            clientserver.split_frames(bytearray(b"\xff\xff\xff\xff"))
+        with self.assertRaises(clientserver.FrameError):
+            clientserver.split_frames(bytearray(b"\x00\x00\x00\x02\xc3\x28"))
+
     def test_handle_getall_empty_directory(self):
         """Test retrieving all entries using handle_getall when directory is empty."""
         self.server.directory.clear()  # Clear the directory to simulate empty state
@@ -96,5 +231,94 @@ class TestClientServer(unittest.TestCase):
         self.assertEqual(response, "EMPTY", "Expected EMPTY for an empty directory.")
 
 
+def free_port():
+    """Return a TCP port that is currently unused."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((clientserver.const_cs.HOST, 0))
+        return sock.getsockname()[1]
+
+
+class TestConcurrentServer(unittest.TestCase):
+    def setUp(self):
+        """Start a concurrent server with a large directory on a free port."""
+        patcher = mock.patch.object(clientserver.const_cs, "PORT", free_port())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = clientserver.Server()
+        self.server.directory = clientserver.DirectoryStore(
+            {f"{i:08d}": generate_random_phone_number() for i in range(20000)})
+        thread = threading.Thread(target=self.server.serve_concurrent)
+        thread.start()
+        self.addCleanup(thread.join)
+        # serve_concurrent() checks _serving at least once a second
+        self.addCleanup(setattr, self.server, "_serving", False)
+
+    @staticmethod
+    def connect(timeout=10.0):
+        """Connect a raw socket as soon as the server listens."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return socket.create_connection((clientserver.const_cs.HOST, clientserver.const_cs.PORT))
+            except ConnectionRefusedError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def test_stops_reading_while_responses_pile_up(self):
+        """Test that a client not reading its responses stops the server from handling its requests."""
+        requests = 100
+        with mock.patch.object(self.server, "respond", wraps=self.server.respond) as respond, self.connect() as sock:
+            for _ in range(requests):
+                sock.sendall(clientserver.frame("GETALL"))
+                time.sleep(0.01)
+            # the socket buffers hold the responses of a few requests only
+            self.assertLess(respond.call_count, requests / 2)
+            # all requests are answered once the client reads
+            sock.settimeout(10)
+            answered = 0
+            while answered < requests:
+                if clientserver.recv_frame(sock) == "":
+                    answered += 1
+            self.assertEqual(respond.call_count, requests)
+
+
+@unittest.skipUnless(hasattr(socket, "SO_REUSEPORT"), "SO_REUSEPORT is not supported on this platform")
+class TestPreforkServer(unittest.TestCase):
+    def setUp(self):
+        """Start a prefork server with 2 workers on a free port (workers inherit the patched port)."""
+        patcher = mock.patch.object(clientserver.const_cs, "PORT", free_port())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = clientserver.PreforkServer(workers=2, directory={"Alpha": "1234567890", "Bravo": "2345678901"})
+        thread = threading.Thread(target=self.server.serve)
+        thread.start()
+        self.addCleanup(thread.join)
+        # serve() checks _serving at least once a second, then stops the workers
+        self.addCleanup(setattr, self.server, "_serving", False)
+        self.client = self.connect()
+        self.addCleanup(self.client.close)
+
+    @staticmethod
+    def connect(timeout=10.0):
+        """Connect a client as soon as a worker listens."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return clientserver.Client()
+            except ConnectionRefusedError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def test_requests(self):
+        """Test get, put and get_all through the workers."""
+        self.assertEqual(self.client.get("Alpha"), "Alpha:1234567890")
+        self.assertEqual(self.client.put("Charlie", "3456789012"), "ERROR: Read-only directory")
+        self.assertEqual(self.client.get_all(), "Alpha:1234567890;Bravo:2345678901")
+        self.assertEqual(self.client.get("Charlie"), "Charlie:NOT FOUND")
+        self.assertEqual(self.server.stats()["requests"], 4)
+
+
 if __name__ == "__main__":
     unittest.main()
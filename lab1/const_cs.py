@@ -4,3 +4,12 @@ Constant definitions
 
 HOST = '127.0.0.1'
 PORT = 50007
+
+BUFFER_SIZE = 65536  # bytes received or buffered for sending at once
+MAX_FRAME = 16 * 1024 * 1024  # largest accepted frame in bytes
+PAGE_SIZE = 100  # directory entries per GETALL frame
+MGET_SIZE = 500  # names looked up by one MGET request of get_many
+PIPELINE_DEPTH = 16  # requests sent ahead of their responses by a pipelining client
+MAX_PENDING = 64  # responses queued for a client before the concurrent server stops reading its requests
+RESTART_DELAY = 1.0  # least seconds between two starts of a prefork worker
+REPORT_INTERVAL = 10.0  # seconds between two logs of the prefork request counters
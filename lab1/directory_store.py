@@ -0,0 +1,227 @@
+"""
+Memory-compact telephone directory
+
+DirectoryStore keeps the entries sorted by name in blocks of up to BLOCK_SIZE entries. A block
+stores its names and numbers UTF-8 encoded in one bytearray each, plus a table of the offsets
+where each entry ends, instead of two Python string objects and a hash table slot per entry.
+A name is found by binary search over the first names of the blocks and then over the names
+of its block. PUT and DELETE insert into or remove from a single block, which is split when
+it grows beyond BLOCK_SIZE and merged with its neighbour when it shrinks, so the index never
+has to be rebuilt.
+
+Iterating the store (items, range, prefix) is safe while it changes: after a change the
+iteration continues after the last name returned.
+"""
+
+import bisect
+import collections.abc
+import itertools
+from array import array
+
+BLOCK_SIZE = 512  # most entries per block
+
+
+class _Block:
+    """ Sorted entries stored in two byte strings with offset tables """
+    __slots__ = ('names', 'name_ends', 'numbers', 'number_ends')
+
+    def __init__(self, entries=()):
+        self.names = bytearray()
+        self.name_ends = array('I')
+        self.numbers = bytearray()
+        self.number_ends = array('I')
+        for name, number in entries:
+            self.names += name
+            self.name_ends.append(len(self.names))
+            self.numbers += number
+            self.number_ends.append(len(self.numbers))
+
+    def __len__(self):
+        return len(self.name_ends)
+
+    def __getitem__(self, index):
+        """Return the encoded name at index (lets bisect search the block)"""
+        start = self.name_ends[index - 1] if index else 0
+        return bytes(self.names[start:self.name_ends[index]])
+
+    def number(self, index):
+        start = self.number_ends[index - 1] if index else 0
+        return bytes(self.numbers[start:self.number_ends[index]])
+
+    def entries(self, start=0):
+        return [(self[index], self.number(index)) for index in range(start, len(self))]
+
+    @staticmethod
+    def _shift(ends, index, delta):
+        """Add delta to the offsets from index on"""
+        if delta:
+            ends[index:] = array('I', [offset + delta for offset in ends[index:]])
+
+    def insert(self, index, name, number):
+        for data, ends, value in ((self.names, self.name_ends, name), (self.numbers, self.number_ends, number)):
+            start = ends[index - 1] if index else 0
+            data[start:start] = value
+            ends.insert(index, start)
+            self._shift(ends, index, len(value))
+
+    def set_number(self, index, number):
+        start = self.number_ends[index - 1] if index else 0
+        end = self.number_ends[index]
+        self.numbers[start:end] = number
+        self._shift(self.number_ends, index, len(number) - (end - start))
+
+    def delete(self, index):
+        for data, ends in ((self.names, self.name_ends), (self.numbers, self.number_ends)):
+            start = ends[index - 1] if index else 0
+            end = ends[index]
+            del data[start:end]
+            del ends[index]
+            self._shift(ends, index, start - end)
+
+
+class DirectoryStore(collections.abc.MutableMapping):
+    """ Telephone directory mapping names to numbers, sorted by (UTF-8 encoded) name """
+
+    def __init__(self, entries=(), block_size=BLOCK_SIZE):
+        """
+        Create a directory
+        :param entries: mapping or iterable of (name, number) pairs to load
+        :param block_size: most entries per block
+        """
+        self.block_size = block_size
+        if isinstance(entries, collections.abc.Mapping):
+            entries = entries.items()
+        # load in one go: sort once and cut into blocks (later entries replace earlier ones)
+        encoded = dict((name.encode('utf-8'), number.encode('utf-8')) for name, number in entries)
+        self._blocks = []
+        self._firsts = []  # first name of each block
+        sorted_entries = sorted(encoded.items())
+        for first in range(0, len(sorted_entries), block_size):
+            self._blocks.append(_Block(sorted_entries[first:first + block_size]))
+            self._firsts.append(sorted_entries[first][0])
+        self._len = len(sorted_entries)
+        self._version = 0  # counts changes, lets iterations notice them
+
+    def _locate(self, name):
+        """Return block number and position of an encoded name, and whether it is there"""
+        block = max(bisect.bisect_right(self._firsts, name) - 1, 0)
+        if not self._blocks:
+            return block, 0, False
+        index = bisect.bisect_left(self._blocks[block], name)
+        return block, index, index < len(self._blocks[block]) and self._blocks[block][index] == name
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, name):
+        block, index, found = self._locate(name.encode('utf-8'))
+        if not found:
+            raise KeyError(name)
+        return self._blocks[block].number(index).decode('utf-8')
+
+    def __setitem__(self, name, number):
+        key, value = name.encode('utf-8'), number.encode('utf-8')
+        block, index, found = self._locate(key)
+        self._version += 1
+        if found:
+            self._blocks[block].set_number(index, value)
+            return
+        if not self._blocks:
+            self._blocks.append(_Block())
+            self._firsts.append(key)
+        self._blocks[block].insert(index, key, value)
+        self._len += 1
+        if index == 0:
+            self._firsts[block] = key
+        if len(self._blocks[block]) > self.block_size:
+            # split the block in halves
+            entries = self._blocks[block].entries()
+            half = len(entries) // 2
+            self._blocks[block:block + 1] = [_Block(entries[:half]), _Block(entries[half:])]
+            self._firsts.insert(block + 1, entries[half][0])
+
+    def __delitem__(self, name):
+        block, index, found = self._locate(name.encode('utf-8'))
+        if not found:
+            raise KeyError(name)
+        self._version += 1
+        self._blocks[block].delete(index)
+        self._len -= 1
+        if not self._blocks[block]:
+            del self._blocks[block]
+            del self._firsts[block]
+            return
+        if index == 0:
+            self._firsts[block] = self._blocks[block][0]
+        # merge a small block into its successor while both fit one block
+        if (len(self._blocks[block]) < self.block_size // 4 and block + 1 < len(self._blocks)
+                and len(self._blocks[block]) + len(self._blocks[block + 1]) <= self.block_size):
+            entries = self._blocks[block].entries() + self._blocks[block + 1].entries()
+            self._blocks[block:block + 2] = [_Block(entries)]
+            del self._firsts[block + 1]
+
+    def clear(self):
+        self._version += 1
+        self._blocks.clear()
+        self._firsts.clear()
+        self._len = 0
+
+    def _after(self, name):
+        """Return block number and position of the first entry after an encoded name"""
+        block, index, found = self._locate(name)
+        index += found
+        if self._blocks and index == len(self._blocks[block]):
+            return block + 1, 0
+        return block, index
+
+    def _entries(self, start=b'', after=False):
+        """Yield the encoded entries from name start on (after it), continuing correctly after changes"""
+        block, index = self._after(start) if after else self._locate(start)[:2]
+        while block < len(self._blocks):
+            version = self._version
+            for entry in self._blocks[block].entries(index):
+                yield entry
+                if self._version != version:
+                    break
+            else:
+                block, index = block + 1, 0
+                continue
+            # the store changed while the entry was handed out, go on after its name
+            block, index = self._after(entry[0])
+
+    def __iter__(self):
+        return (name.decode('utf-8') for name, _ in self._entries())
+
+    def items(self):
+        return _ItemsView(self)
+
+    def range(self, start='', stop=None, after=False):
+        """
+        Iterate over the entries with start <= name < stop, in order
+        :param start: least name
+        :param stop: name to stop at (None for no limit)
+        :param after: skip an entry named start (continue a previous iteration that ended there)
+        :return: iterator of (name, number) pairs
+        """
+        entries = self._entries(start.encode('utf-8'), after)
+        if stop is not None:
+            limit = stop.encode('utf-8')
+            entries = itertools.takewhile(lambda entry: entry[0] < limit, entries)
+        return ((name.decode('utf-8'), number.decode('utf-8')) for name, number in entries)
+
+    def prefix(self, prefix):
+        """
+        Iterate over the entries whose name starts with prefix, in order
+        :param prefix: start of the names
+        :return: iterator of (name, number) pairs
+        """
+        key = prefix.encode('utf-8')
+        entries = itertools.takewhile(lambda entry: entry[0].startswith(key), self._entries(key))
+        return ((name.decode('utf-8'), number.decode('utf-8')) for name, number in entries)
+
+
+class _ItemsView(collections.abc.ItemsView):
+    """ Items of a DirectoryStore, iterated block by block instead of looking up each name """
+
+    def __iter__(self):
+        return self._mapping.range()
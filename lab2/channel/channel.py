@@ -1,4 +1,4 @@
-from context import lab_channel
+from context import lab_channel, lab_dispatch
 import logging
 
 
@@ -14,13 +14,10 @@ class Server:
 
     def run(self):
         self.ci.bind(self.server)
-        while True:
-            message = self.ci.receive_from_any(self.timeout)
-            if message is not None:
-                try:
-                    self.ci.send_to({message[0]}, 'Received ' + message[1])
-                except AssertionError:
-                    self.logger.warning('Client has already left the channel.')
+        # handle requests on worker threads, one after another per client (replies are sent by the dispatcher)
+        dispatcher = lab_dispatch.Dispatcher(self.ci, timeout=self.timeout)
+        dispatcher.register(None, lambda client, message: 'Received ' + message)
+        dispatcher.run()
 
 
 class Client:
@@ -16,4 +16,4 @@ def add_parent_path(steps_up=2):
 add_parent_path()
 
 # following imports are used by other modules to access shared packages
-from lib import lab_logging, lab_channel
+from lib import lab_logging, lab_channel, lab_launch, lab_sim
@@ -9,11 +9,10 @@ Chord Application
 
 import logging
 import sys
-import multiprocessing as mp
 import random
 import chordnode as chord_node
 import constChord
-from context import lab_channel, lab_logging
+from context import lab_channel, lab_launch, lab_logging
 
 lab_logging.setup(stream_level=logging.INFO)
 
@@ -54,22 +53,6 @@ class DummyChordClient:
             constChord.STOP)
 
 
-def create_and_run(num_bits, node_class, enter_bar, run_bar):
-    """
-    Create and run a node (server or client role)
-    :param num_bits: address range of the channel
-    :param node_class: class of node
-    :param enter_bar: barrier syncing channel population 
-    :param run_bar: barrier syncing node creation
-    """
-    chan = lab_channel.Channel(n_bits=num_bits)
-    node = node_class(chan)
-    enter_bar.wait()  # wait for all nodes to join the channel
-    node.enter()  # do what is needed to enter the ring
-    run_bar.wait()  # wait for all nodes to finish entering
-    node.run()  # start operating the node
-
-
 if __name__ == "__main__":  # if script is started from command line
     m = 6  # Number of bits for linear names
     n = 8  # Number of nodes in the chord ring
@@ -83,31 +66,15 @@ if __name__ == "__main__":  # if script is started from command line
     chan = lab_channel.Channel()
     chan.channel.flushall()
 
-    # we need to spawn processes for support of windows
-    mp.set_start_method('spawn')
-
-    # create barriers to synchronize bootstrapping
-    bar1 = mp.Barrier(n+1)  # Wait for channel population to complete
-    bar2 = mp.Barrier(n+1)  # Wait for ring construction to complete
-
-    # start n chord nodes in separate processes
-    children = []
-    for i in range(n):
-        nodeproc = mp.Process(
-            target=create_and_run,
-            name="ChordNode-" + str(i),
-            args=(m, chord_node.ChordNode, bar1, bar2))
-        children.append(nodeproc)
-        nodeproc.start()
-
-    # spawn client proc and wait for it to finish
-    clientproc = mp.Process(
-        target=create_and_run,
-        name="ChordClient",
-        args=(m, DummyChordClient, bar1, bar2))
-    clientproc.start()
-    clientproc.join()
+    # n chord nodes and a client in separate processes, entering the ring
+    # after all have joined the channel and running after all have entered
+    launcher = lab_launch.Launcher(num_bits=m)
+    nodes = launcher.add("ChordNode-{}", chord_node.ChordNode, count=n, init='enter')
+    client = launcher.add("ChordClient", DummyChordClient, init='enter')
+    launcher.start()
+
+    # wait for the client to finish
+    launcher.join(client)
 
     # wait for node processes to finish
-    for nodeproc in children:
-        nodeproc.join()
+    launcher.join(nodes)
@@ -0,0 +1,35 @@
+"""
+Chord Simulation
+- runs the ring of doit.py (chord nodes and a DummyChordClient) in a
+  discrete-event simulation (see lib/lab_sim.py): one process, virtual time
+- allows rings of thousands of nodes with link latency and message loss
+- prints a JSON report (same seed, same result)
+"""
+
+import argparse
+import json
+import logging
+
+import chordnode as chord_node
+from context import lab_logging, lab_sim
+from doit import DummyChordClient
+
+lab_logging.setup(stream_level=logging.WARNING, file_level=logging.INFO)
+
+
+if __name__ == "__main__":  # if script is started from command line
+    parser = argparse.ArgumentParser(description='Simulate a chord ring')
+    parser.add_argument('m', type=int, nargs='?', default=6, help='number of bits for linear names')
+    parser.add_argument('n', type=int, nargs='?', default=8, help='number of nodes in the chord ring')
+    parser.add_argument('--latency', type=float, default=0.001, help='link latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='maximum extra latency in seconds')
+    parser.add_argument('--loss', type=float, default=0.0, help='probability of message loss')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--until', type=float, help='virtual seconds to simulate at most')
+    args = parser.parse_args()
+
+    sim = lab_sim.Simulation(n_bits=args.m, latency=args.latency, jitter=args.jitter, loss=args.loss,
+                             seed=args.seed)
+    sim.launch("ChordNode-{}", chord_node.ChordNode, count=args.n, init='enter')
+    sim.launch("ChordClient", DummyChordClient, init='enter')
+    print(json.dumps(sim.run(until=args.until), indent=2))
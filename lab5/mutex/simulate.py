@@ -0,0 +1,42 @@
+"""
+Mutex Simulation
+- runs the peers of doit.py in a discrete-event simulation
+  (see lib/lab_sim.py): one process, virtual time
+- allows groups of thousands of peers with link latency and message loss
+- crashes a random peer after some time (10 seconds), like doit.py
+- prints a JSON report (same seed, same result)
+"""
+
+import argparse
+import json
+import logging
+import random
+
+from process import Process
+
+from context import lab_logging, lab_sim
+from constMutex import BEHAVIOR_TYPES
+
+lab_logging.setup(stream_level=logging.WARNING, file_level=logging.INFO)
+
+
+if __name__ == "__main__":  # if script is started from command line
+    parser = argparse.ArgumentParser(description='Simulate a group of mutex peers')
+    parser.add_argument('m', type=int, nargs='?', default=8, help='number of bits for process ids')
+    parser.add_argument('n', type=int, nargs='?', default=4, help='number of processes in the group')
+    parser.add_argument('--latency', type=float, default=0.001, help='link latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='maximum extra latency in seconds')
+    parser.add_argument('--loss', type=float, default=0.0, help='probability of message loss')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--until', type=float, default=60, help='virtual seconds to simulate')
+    args = parser.parse_args()
+
+    sim = lab_sim.Simulation(n_bits=args.m, latency=args.latency, jitter=args.jitter, loss=args.loss,
+                             seed=args.seed)
+    # peer behavior and the crashing peer derive from the seed as well
+    choices = random.Random(args.seed)
+    for i in range(args.n):
+        peer_name = "Peer-" + str(i)
+        sim.launch(peer_name, Process, init_args=(peer_name, choices.choice(BEHAVIOR_TYPES)))
+    sim.crash("Peer-" + str(choices.randrange(args.n)), 10)
+    print(json.dumps(sim.run(until=args.until), indent=2))
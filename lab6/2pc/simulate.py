@@ -0,0 +1,34 @@
+"""
+2PC Simulation
+- runs the participants and the coordinator of 2pc.py in a
+  discrete-event simulation (see lib/lab_sim.py): one process, virtual time
+- allows groups of thousands of participants with link latency and message loss
+- prints a JSON report with the outcome of every process (same seed, same result)
+"""
+
+import argparse
+import json
+import logging
+
+import coordinator
+import participant
+from context import lab_logging, lab_sim
+
+lab_logging.setup(stream_level=logging.WARNING, file_level=logging.INFO)
+
+
+if __name__ == "__main__":  # if script is started from command line
+    parser = argparse.ArgumentParser(description='Simulate a distributed commit')
+    parser.add_argument('m', type=int, nargs='?', default=8, help='number of bits for process ids')
+    parser.add_argument('n', type=int, nargs='?', default=3, help='number of participants in the group')
+    parser.add_argument('--latency', type=float, default=0.001, help='link latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='maximum extra latency in seconds')
+    parser.add_argument('--loss', type=float, default=0.0, help='probability of message loss')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sim = lab_sim.Simulation(n_bits=args.m, latency=args.latency, jitter=args.jitter, loss=args.loss,
+                             seed=args.seed)
+    sim.launch("Participant-{}", participant.Participant, count=args.n)
+    sim.launch("Coordinator", coordinator.Coordinator)
+    print(json.dumps(sim.run(), indent=2))
@@ -1 +1 @@
-__all__ = ['lab_channel.py', 'lab_logging.py']
+__all__ = ['lab_bench.py', 'lab_channel.py', 'lab_codec.py', 'lab_dispatch.py', 'lab_launch.py', 'lab_logging.py', 'lab_metrics.py', 'lab_record.py', 'lab_sim.py', 'lab_store.py']
@@ -0,0 +1,251 @@
+"""
+Benchmarks for lab_channel.
+
+Measures
+- pingpong: point-to-point round trip latency (p50/p99)
+- throughput: one-way throughput for several message sizes
+- fanout: multicast (send_to) and broadcast (send_to_all) cost versus group size
+  (the messages are received after each round, so every round sends to empty queues)
+- receive: receive_from_any cost versus member count
+- join: join/leave cost versus n_bits
+
+All members are driven from the benchmark process, rebinding the channel to the acting member
+before each call. Results therefore reflect the cost of channel operations without scheduling
+noise of several processes. Each benchmark starts from an empty store, so running against redis
+flushes the database (use a local redis instance).
+
+Usage (from the top-level folder of the repository):
+
+    python -m lib.lab_bench --backend memory --output bench.json
+    python -m lib.lab_bench --host localhost --port 6379 --inbox pingpong fanout
+
+Results are written as JSON to compare runs over time.
+"""
+
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+
+from . import lab_channel
+
+# microseconds per second
+US = 1e6
+
+
+def _summary(samples: list) -> dict:
+    """
+    Summarize latency samples.
+    :param samples: durations in seconds
+    :return: dict of count, mean, p50, p99 and max in microseconds
+    """
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * US
+
+    return {'count': len(ordered),
+            'mean_us': sum(ordered) / len(ordered) * US,
+            'p50_us': percentile(0.5),
+            'p99_us': percentile(0.99),
+            'max_us': ordered[-1] * US}
+
+
+class Bench:
+    """
+    Runs the benchmarks against one channel configuration.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+
+    def channel(self, n_bits: int = 5) -> lab_channel.Channel:
+        """
+        Create a channel on an empty store.
+        :param n_bits: number of bits for member ids
+        :return: channel
+        """
+        chan = lab_channel.Channel(n_bits=n_bits, host_ip=self.args.host, port_no=self.args.port,
+                                   inbox=self.args.inbox, backend=self.args.backend,
+                                   batch_size=self.args.batch_size)
+        chan.channel.flushall()
+        return chan
+
+    @staticmethod
+    def members(chan: lab_channel.Channel, count: int, subgroup: str = 'bench') -> list:
+        return [chan.join(subgroup) for _ in range(count)]
+
+    @staticmethod
+    def n_bits(members: int) -> int:
+        # leave room so joins do not run into a crowded id space
+        return max(5, math.ceil(math.log2(members)) + 2)
+
+    def pingpong(self) -> dict:
+        chan = self.channel()
+        a, b = self.members(chan, 2)
+        samples: list = []
+        for i in range(self.args.warmup + self.args.rounds):
+            start = time.perf_counter()
+            chan.bind(a)
+            chan.send_to({b}, 'ping')
+            chan.bind(b)
+            chan.receive_from({a})
+            chan.send_to({a}, 'pong')
+            chan.bind(a)
+            chan.receive_from({b})
+            if i >= self.args.warmup:
+                samples.append(time.perf_counter() - start)
+        return _summary(samples)
+
+    def throughput(self) -> dict:
+        results: dict = {}
+        for size in self.args.sizes:
+            chan = self.channel()
+            a, b = self.members(chan, 2)
+            payload = bytes(size)
+            count: int = self.args.messages
+            chan.bind(a)
+            start = time.perf_counter()
+            for _ in range(count):
+                chan.send_to({b}, payload)
+            chan.flush()
+            sent = time.perf_counter()
+            chan.bind(b)
+            for _ in range(count):
+                chan.receive_from({a})
+            received = time.perf_counter()
+            results[str(size)] = {'messages': count,
+                                  'send_msgs_per_s': count / (sent - start),
+                                  'receive_msgs_per_s': count / (received - sent),
+                                  'msgs_per_s': count / (received - start),
+                                  'mb_per_s': count * size / (received - start) / 1e6}
+        return results
+
+    def fanout(self) -> dict:
+        results: dict = {}
+        for group in self.args.groups:
+            chan = self.channel(self.n_bits(group + 1))
+            sender, *receivers = self.members(chan, group + 1)
+            destinations = set(receivers)
+            chan.bind(sender)
+            multicast: list = []
+            broadcast: list = []
+            for _ in range(self.args.rounds):
+                start = time.perf_counter()
+                chan.send_to(destinations, 'fanout')
+                multicast.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                chan.send_to_all('fanout')
+                broadcast.append(time.perf_counter() - start)
+                self.drain(chan, sender, receivers)
+            results[str(group)] = {'send_to': _summary(multicast), 'send_to_all': _summary(broadcast)}
+        return results
+
+    @staticmethod
+    def drain(chan: lab_channel.Channel, sender: str, receivers: list) -> None:
+        """
+        Receive the multicast and broadcast of a fanout round (unmeasured), so queues do not grow over the rounds.
+        :param chan: channel
+        :param sender: member id of the sender (bound to the channel before and after)
+        :param receivers: member ids of the receivers
+        :return: None
+        """
+        chan.flush()
+        for receiver in receivers:
+            chan.bind(receiver)
+            chan.receive_from({sender})
+            chan.receive_from({sender})
+        # the broadcast also reaches the sender
+        chan.bind(sender)
+        chan.receive_from({sender})
+
+    def receive(self) -> dict:
+        results: dict = {}
+        for count in self.args.groups:
+            chan = self.channel(self.n_bits(count + 1))
+            receiver, *senders = self.members(chan, count + 1)
+            samples: list = []
+            for i in range(self.args.rounds):
+                # queue a message from a rotating sender, then time its retrieval
+                chan.bind(senders[i % count])
+                chan.send_to({receiver}, 'any')
+                chan.bind(receiver)
+                start = time.perf_counter()
+                chan.receive_from_any()
+                samples.append(time.perf_counter() - start)
+            results[str(count)] = _summary(samples)
+        return results
+
+    def join(self) -> dict:
+        results: dict = {}
+        for n_bits in self.args.n_bits:
+            chan = self.channel(n_bits)
+            # join up to half of the id space
+            count: int = min(self.args.joins, 2 ** (n_bits - 1))
+            joins: list = []
+            leaves: list = []
+            members: list = []
+            for _ in range(count):
+                start = time.perf_counter()
+                members.append(chan.join('bench'))
+                joins.append(time.perf_counter() - start)
+            for member in members:
+                chan.bind(member)
+                start = time.perf_counter()
+                chan.leave('bench')
+                leaves.append(time.perf_counter() - start)
+            results[str(n_bits)] = {'join': _summary(joins), 'leave': _summary(leaves)}
+        return results
+
+
+BENCHMARKS = ('pingpong', 'throughput', 'fanout', 'receive', 'join')
+
+
+def main(argv: list = None) -> dict:
+    parser = argparse.ArgumentParser(description='Benchmark lab_channel.Channel')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='benchmarks to run: {} (default: all)'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--backend', default='redis', choices=('redis', 'memory', 'local'))
+    parser.add_argument('--host', default='localhost', help='redis host')
+    parser.add_argument('--port', type=int, default=6379, help='redis port')
+    parser.add_argument('--inbox', action='store_true', help='use the inbox layout')
+    parser.add_argument('--batch-size', type=int, help='coalesce sends into batches of this size')
+    parser.add_argument('--rounds', type=int, default=1000, help='samples per latency measurement')
+    parser.add_argument('--warmup', type=int, default=100, help='unmeasured ping-pong rounds')
+    parser.add_argument('--messages', type=int, default=10000, help='messages per throughput size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[16, 256, 4096, 65536],
+                        help='payload sizes in bytes')
+    parser.add_argument('--groups', type=int, nargs='+', default=[1, 4, 16, 64],
+                        help='group sizes for fanout and receive')
+    parser.add_argument('--n-bits', type=int, nargs='+', default=[5, 8, 12, 16, 20],
+                        help='id space sizes for join')
+    parser.add_argument('--joins', type=int, default=64, help='members joining per n_bits value')
+    parser.add_argument('--output', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark ' + name)
+
+    bench = Bench(args)
+    report: dict = {'time': time.time(),
+                    'python': platform.python_version(),
+                    'config': {key: value for key, value in vars(args).items() if key != 'output'},
+                    'results': {}}
+    for name in args.benchmarks or BENCHMARKS:
+        start = time.perf_counter()
+        report['results'][name] = getattr(bench, name)()
+        print('{} done in {:.1f}s'.format(name, time.perf_counter() - start), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""
+Benchmark unit tests
+"""
+
+import os
+import tempfile
+import unittest
+
+from lib import lab_bench, lab_store
+
+
+class TestFanout(unittest.TestCase):
+
+    def test_rounds_leave_queues_empty(self):
+        """Test that the fanout benchmark receives what it sends, also with batches and in inbox layout."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            for options in ([], ['--inbox'], ['--batch-size', '4']):
+                with self.subTest(options=options):
+                    report = lab_bench.main(['fanout', '--backend', 'memory', '--rounds', '20',
+                                             '--groups', '1', '8', '--output', output] + options)
+                    self.assertEqual(report['results']['fanout']['8']['send_to_all']['count'], 20)
+                    store = lab_store.connect('memory')
+                    queues = [key.decode() for key in store.keys('*')]
+                    self.assertEqual(sum(store.llen(key) for key in queues if key.startswith(('[', 'inbox:'))), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
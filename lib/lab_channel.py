@@ -1,12 +1,549 @@
 import logging
+import math
 import os
 import pickle
 import random
+import threading
+import time
+
+import asyncio
+import bisect
+import zlib
 
 import redis
+import redis.asyncio
+
+from . import lab_codec, lab_metrics, lab_record, lab_store
+
+# redis connection pools of this process by (os pid, host, port, blocking), shared by all channels and threads
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def connection_pool(host: str, port: int, blocking: bool = False) -> redis.ConnectionPool:
+    """
+    Get the connection pool of this process for a redis instance.
+    All channels of a process share one pool per instance for commands and a second one for blocking
+    receives. A pending BLPOP thus holds a dedicated connection and never delays sends of other threads.
+    :param host: redis host
+    :param port: redis port
+    :param blocking: True for the pool of blocking receives
+    :return: connection pool
+    """
+    key: tuple = (os.getpid(), host, port, blocking)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = redis.ConnectionPool(host=host, port=port, db=0)
+            _pools[key] = pool
+        return pool
+
+
+def _client(host: str, port: int, blocking: bool = False) -> redis.StrictRedis:
+    return redis.StrictRedis(connection_pool=connection_pool(host, port, blocking))
+
+
+class MemberCache:
+    """
+    MemberCache keeps a client-side copy of the global member set and subgroup sets.
 
+    Sets are loaded from redis on first access and dropped as soon as a member joins or leaves.
+    Joining and leaving members announce the affected subgroup on the "membership" pub/sub channel,
+    which is consumed by a background thread.
 
-class Channel:
+    The cache fails safe: a pid missing from a cached set is looked up again in redis before it is
+    considered unknown, and if the subscription thread dies, all lookups go to redis directly.
+    """
+
+    def __init__(self, client: redis.StrictRedis):
+        self.client = client
+        # cached sets by redis key
+        self.sets = {}
+        # incremented on every invalidation, used to detect loads that raced with a change
+        self.version: int = 0
+        self.lock = threading.Lock()
+        self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(**{BaseChannel.MEMBERSHIP: self.__invalidate})
+        self.thread = self.pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def __invalidate(self, message) -> None:
+        # a join/leave changes the global member set and one subgroup
+        with self.lock:
+            self.version += 1
+            self.sets.pop('members', None)
+            self.sets.pop(message['data'].decode(), None)
+
+    def __load(self, key: str) -> set:
+        version: int = self.version
+        members: set = {i.decode() for i in self.client.smembers(key)}
+        with self.lock:
+            # only keep the result if no change was announced in the meantime
+            if version == self.version and self.thread.is_alive():
+                self.sets[key] = members
+        return members
+
+    def members(self, key: str = 'members') -> set:
+        """
+        Retrieve a member set from the cache (or from redis on a miss).
+        :param key: 'members' or a subgroup identifier
+        :return: set of member ids
+        """
+        if not self.thread.is_alive():
+            return self.__load(key)
+        members = self.sets.get(key)
+        return members if members is not None else self.__load(key)
+
+    def contains(self, pid: str, key: str = 'members') -> bool:
+        """
+        Check membership of a pid, re-reading the set from redis before reporting a miss.
+        :param pid: member id
+        :param key: 'members' or a subgroup identifier
+        :return: true if pid is in the set
+        """
+        return pid in self.members(key) or pid in self.__load(key)
+
+    def close(self) -> None:
+        """
+        Stop the subscription thread.
+        :return: None
+        """
+        self.thread.stop()
+
+
+class ShardRing:
+    """
+    Consistent hashing ring mapping member ids to shard indices.
+    Every shard owns a number of virtual points on the ring; a member belongs to the shard owning
+    the first point at or after the hash of its id. Adding a shard only moves the members of
+    the ring segments taken over by the new shard.
+    """
+
+    def __init__(self, n_shards: int, replicas: int = 64):
+        points: list = sorted((zlib.crc32('{}:{}'.format(shard, replica).encode()), shard)
+                              for shard in range(n_shards) for replica in range(replicas))
+        self.hashes: list = [point[0] for point in points]
+        self.shards: list = [point[1] for point in points]
+
+    def shard(self, pid: str) -> int:
+        """
+        Locate the shard of a member id.
+        :param pid: member id
+        :return: shard index
+        """
+        i: int = bisect.bisect_left(self.hashes, zlib.crc32(pid.encode())) % len(self.hashes)
+        return self.shards[i]
+
+
+class BaseChannel:
+    """
+    BaseChannel holds the parts shared by the blocking Channel and the AsyncChannel:
+    redis scripts, the queue layout, message serialization and local pid bindings.
+    Both channel types can be mixed freely within a group as long as they use the same layout.
+
+    Messages are serialized by a codec chosen per channel (see lab_codec). Each message carries
+    the tag of its codec, so members using different codecs can still talk to each other.
+    """
+
+    # pub/sub channel announcing membership changes
+    MEMBERSHIP = 'membership'
+
+    # number of random id candidates offered to the join script per round
+    JOIN_CANDIDATES = 16
+    # rounds of sampling from the whole id space before sampling from the remaining ids
+    JOIN_ROUNDS = 4
+
+    # Add the first unused candidate id to the member set and subgroup and announce the change.
+    # KEYS: global member set, subgroup set
+    # ARGV: membership pub/sub channel, subgroup, candidate ids
+    JOIN_SCRIPT = """
+    for i = 3, #ARGV do
+        if redis.call('SADD', KEYS[1], ARGV[i]) == 1 then
+            redis.call('SADD', KEYS[2], ARGV[i])
+            redis.call('PUBLISH', ARGV[1], ARGV[2])
+            return ARGV[i]
+        end
+    end
+    return false
+    """
+
+    # Push a message to a list of queues, respecting queue capacity and retention (shared by the send scripts).
+    # Unless the overflow policy is 'drop', nothing is pushed if any of the queues is full.
+    # Dropping trims the oldest messages. Every push renews the expiry of the queue.
+    # The capacity counts queue elements, so a batch (see lab_codec.batch) counts as one.
+    PUSH_FUNCTION = """
+    local function push(keys, message, capacity, overflow, ttl)
+        capacity = tonumber(capacity)
+        ttl = tonumber(ttl)
+        if capacity > 0 and overflow ~= 'drop' then
+            for _, key in ipairs(keys) do
+                if redis.call('LLEN', key) >= capacity then
+                    return 'queue full'
+                end
+            end
+        end
+        for _, key in ipairs(keys) do
+            redis.call('RPUSH', key, message)
+            if capacity > 0 and overflow == 'drop' then
+                redis.call('LTRIM', key, -capacity, -1)
+            end
+            if ttl > 0 then
+                redis.call('EXPIRE', key, ttl)
+            end
+        end
+        return 'OK'
+    end
+    """
+
+    # Push a message to queues without validation (used for queues on shards).
+    # KEYS: queue keys
+    # ARGV: message, capacity (0: unbounded), overflow policy, ttl (0: none)
+    PUSH_SCRIPT = PUSH_FUNCTION + """
+    return push(KEYS, ARGV[1], ARGV[2], ARGV[3], ARGV[4])
+    """
+
+    # Validate caller and destinations, then push the message to all destination queues.
+    # KEYS: global member set, queue keys (one per destination)
+    # ARGV: message, caller id, capacity, overflow policy, ttl, destination ids (same order as queue keys)
+    SEND_SCRIPT = PUSH_FUNCTION + """
+    if redis.call('SISMEMBER', KEYS[1], ARGV[2]) == 0 then
+        return 'unknown sender'
+    end
+    for i = 6, #ARGV do
+        if redis.call('SISMEMBER', KEYS[1], ARGV[i]) == 0 then
+            return 'unknown receiver'
+        end
+    end
+    local keys = {}
+    for i = 2, #KEYS do
+        table.insert(keys, KEYS[i])
+    end
+    return push(keys, ARGV[1], ARGV[3], ARGV[4], ARGV[5])
+    """
+
+    # Validate caller, then push the message to the queues of all current members.
+    # KEYS: global member set
+    # ARGV: message, caller id, capacity, overflow policy, ttl,
+    #       queue key prefix and suffix (enclosing the receiver id)
+    SEND_ALL_SCRIPT = PUSH_FUNCTION + """
+    if redis.call('SISMEMBER', KEYS[1], ARGV[2]) == 0 then
+        return 'unknown sender'
+    end
+    local keys = {}
+    for _, member in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+        table.insert(keys, ARGV[6] .. member .. ARGV[7])
+    end
+    return push(keys, ARGV[1], ARGV[3], ARGV[4], ARGV[5])
+    """
+
+    # Pop up to a maximum number of messages from a set of queues, taking one message per
+    # non-empty queue and round. The leading (high priority) queues are drained before the others.
+    # Popping renews the expiry of a queue like pushing does. Returns a flat list of queue keys and messages.
+    # KEYS: queue keys
+    # ARGV: maximum number of messages, number of leading queues (optional), ttl (optional, 0: none)
+    DRAIN_SCRIPT = """
+    local result = {}
+    local remaining = tonumber(ARGV[1])
+    local ttl = tonumber(ARGV[3] or 0)
+    local function drain(first, last)
+        local active = true
+        while active and remaining > 0 do
+            active = false
+            for i = first, last do
+                if remaining > 0 then
+                    local message = redis.call('LPOP', KEYS[i])
+                    if message then
+                        table.insert(result, KEYS[i])
+                        table.insert(result, message)
+                        remaining = remaining - 1
+                        active = true
+                        if ttl > 0 then
+                            redis.call('EXPIRE', KEYS[i], ttl)
+                        end
+                    end
+                end
+            end
+        end
+    end
+    local leading = tonumber(ARGV[2] or 0)
+    drain(1, leading)
+    drain(leading + 1, #KEYS)
+    return result
+    """
+
+    # message priorities (lanes), in the order receives drain them
+    HIGH = 1
+    NORMAL = 0
+    LANES = (HIGH, NORMAL)
+    # queue key prefix of the high priority lane
+    HIGH_PREFIX = 'high:'
+
+    # overflow policies of bounded queues
+    BLOCK = 'block'
+    FAIL = 'fail'
+    DROP = 'drop'
+    # maximum seconds between retries of a blocked send
+    BLOCK_POLL = 0.1
+
+    def __init__(self, n_bits: int = 5, inbox: bool = False, codec=None, capacity: int = None,
+                 overflow: str = BLOCK, queue_ttl: int = None):
+        # create dict of local pid bindings
+        self.os_members = {}
+        # Number of bits for pid addresses
+        self.n_bits: int = n_bits
+        # Maximum corresponding pid
+        self.MAXPROC: int = pow(2, n_bits)
+        # use a single inbox per member instead of pairwise queues
+        self.inbox: bool = inbox
+        # messages popped from inboxes but not yet returned, by receiver id
+        # (lists of (sender, message, priority) tuples, high priority first)
+        self.stash = {}
+        # codec for outgoing messages (incoming messages are decoded by their tag)
+        self.codec = codec if codec is not None else lab_codec.PickleCodec()
+        # capacity of each queue in elements (None: unbounded, a batch counts as one), policy for full queues,
+        # expiry of idle queues in seconds
+        assert overflow in (self.BLOCK, self.FAIL, self.DROP), 'unknown overflow policy'
+        self.capacity = capacity
+        self.overflow: str = overflow
+        self.queue_ttl = queue_ttl
+        # instance logger (named by subclasses)
+        self.logger = logging.getLogger('vs2lab.channel.' + type(self).__name__)
+        # optional metrics (see lab_metrics, set by subclasses)
+        self.metrics = None
+        # optional trace recorder (see lab_record, set by subclasses)
+        self.recorder = None
+
+    @staticmethod
+    def _decode_set(raw) -> set:
+        return {i.decode() for i in raw}
+
+    def bind(self, pid: str) -> int:
+        """
+        Associate os pid with channel member id.
+        Thus a caller does not need to provide its id for every subsequent call.
+        :param pid: identifier of process member
+        :return: os pid value
+        """
+        # retrieve os pid and map to given member id
+        os_pid: int = os.getpid()
+        self.os_members[os_pid] = pid
+        self.logger.debug("Member %s bound %s", pid, os_pid)
+        return os_pid
+
+    def _candidates(self, members: set = None) -> list:
+        """
+        Sample candidate ids for the join script.
+        :param members: current member set if the id space is (nearly) full, else None
+        :return: list of candidate id strings
+        """
+        if members is None:
+            # sample candidates uniformly from the whole id space
+            return [str(i) for i in random.sample(range(self.MAXPROC), min(self.JOIN_CANDIDATES, self.MAXPROC))]
+        # the id space is (nearly) full, so MAXPROC is close to the group size
+        # and we can afford to sample from the remaining ids directly
+        remaining_ids = list(set([str(i) for i in range(self.MAXPROC)]) - members)
+        assert len(remaining_ids) > 0, 'no free member id'
+        return random.sample(remaining_ids, min(self.JOIN_CANDIDATES, len(remaining_ids)))
+
+    @staticmethod
+    def _xchan(pid: str, members: set) -> list:
+        """
+        Construct serialized bidirectional queue names for a member and a set of other members.
+        :param pid: member identifier
+        :param members: other member identifiers
+        :return: list of queue identifier objects
+        """
+        xchan: list = [[pid, other] for other in members] + [[other, pid] for other in members]
+        return [pickle.dumps(xc) for xc in xchan]
+
+    def _queue_key(self, sender: str, receiver: str, priority: int = NORMAL) -> str:
+        """
+        Construct queue name from sender and receiver ids.
+        :param sender: member identifier
+        :param receiver: member identifier
+        :param priority: lane of the queue (NORMAL or HIGH)
+        :return: redis key
+        """
+        key: str = 'inbox:' + receiver if self.inbox else str([sender, receiver])
+        return self.HIGH_PREFIX + key if priority == self.HIGH else key
+
+    def _queue_key_affixes(self, sender: str, priority: int = NORMAL) -> tuple:
+        """
+        Construct the parts of a queue name enclosing the receiver id (used by the broadcast script).
+        :param sender: member identifier
+        :param priority: lane of the queue (NORMAL or HIGH)
+        :return: tuple of prefix and suffix
+        """
+        prefix, suffix = ('inbox:', '') if self.inbox else ("['{}', '".format(sender), "']")
+        return (self.HIGH_PREFIX + prefix if priority == self.HIGH else prefix), suffix
+
+    def _in_queues(self, senders, receiver: str) -> list:
+        """
+        Construct the incoming queue names of a receiver, high priority lanes first.
+        Blocking pops and the drain script serve queues in this order.
+        :param senders: member identifiers (ignored in inbox layout)
+        :param receiver: member identifier
+        :return: list of redis keys
+        """
+        if self.inbox:
+            senders = [receiver]
+        return [self._queue_key(sender, receiver, lane) for lane in self.LANES for sender in senders]
+
+    def _bounds(self) -> list:
+        """
+        Construct the capacity, overflow and retention arguments of the send scripts.
+        :return: list of capacity, overflow policy and ttl (0 disables limits)
+        """
+        return [self.capacity or 0, self.overflow, self.queue_ttl or 0]
+
+    def _orphans(self, pid: str, members: set) -> list:
+        """
+        Construct the names of all queues whose messages can no longer be received once a member left.
+        :param pid: identifier of the leaving member
+        :param members: remaining members
+        :return: list of pairs of receiver id and queue key
+        """
+        keys: list = [(pid, key) for key in self._in_queues(members | {pid}, pid)]
+        if not self.inbox:
+            # messages of a former member are not received either (inboxes are shared, though)
+            keys += [(member, self._queue_key(pid, member, lane)) for lane in self.LANES for member in members]
+        return keys
+
+    def _priority(self, result) -> int:
+        """
+        Get the lane a blpop result was taken from.
+        :param result: pair of queue key and serialized message
+        :return: HIGH or NORMAL
+        """
+        return self.HIGH if result[0].startswith(self.HIGH_PREFIX.encode()) else self.NORMAL
+
+    def _pack(self, sender: str, message: object) -> bytes:
+        """
+        Serialize a message for sending, adding the sender id in inbox layout.
+        :param sender: member identifier
+        :param message: the message object
+        :return: serialized message
+        """
+        return self.codec.encode((sender, message) if self.inbox else message)
+
+    def _record_send(self, caller: str, destinations: list, data: bytes, priority: int) -> None:
+        """
+        Record a sent message for each destination.
+        :param caller: member id of the sender
+        :param destinations: member ids of the receivers
+        :param data: serialized message
+        :param priority: lane of the message
+        :return: None
+        """
+        for destination in destinations:
+            self.recorder.record(lab_record.SEND, caller, destination,
+                                 self._queue_key(caller, destination, priority), data)
+
+    def _unpack_all(self, caller: str, result) -> list:
+        """
+        Extract sender ids and messages from a blpop result holding a single message or a batch.
+        :param caller: member id of the receiver
+        :param result: pair of queue key and serialized message
+        :return: list of tuples of sender id and message
+        """
+        # extract sender id from key part (the sender id is part of the message in inbox layout)
+        sender = None if self.inbox else result[0].decode().split("'")[1]
+        received: list = []
+        for data in lab_codec.split(result[1]):
+            item = tuple(lab_codec.decode(data)) if self.inbox else (sender, lab_codec.decode(data))
+            if self.metrics is not None:
+                self.metrics.record_receive(caller, item[0], len(data), lab_codec.sent_at(data))
+            if self.recorder is not None:
+                self.recorder.record(lab_record.RECEIVE, item[0], caller, result[0].decode(), data)
+            received.append(item)
+        return received
+
+    def _unpack(self, caller: str, result) -> tuple:
+        """
+        Extract sender id and message from a blpop result.
+        Further messages of a batch are stashed for later receive calls.
+        :param caller: member id of the receiver
+        :param result: pair of queue key and serialized message
+        :return: tuple of sender id and message
+        """
+        first, *rest = self._unpack_all(caller, result)
+        for item in rest:
+            self._stash(caller, item, self._priority(result))
+        return first
+
+    def _collect(self, caller: str, results: list, sender_set, received: list, max_count: int) -> None:
+        """
+        Unpack popped messages in arrival order, keeping up to max_count messages from the given senders.
+        All other messages are stashed for later receive calls.
+        :param caller: member id of the receiver
+        :param results: list of blpop results
+        :param sender_set: set of accepted senders or None for any sender
+        :param received: list of tuples of sender id and message to append to
+        :param max_count: maximum length of received
+        :return: None
+        """
+        for result in results:
+            for item in self._unpack_all(caller, result):
+                if len(received) < max_count and (sender_set is None or item[0] in sender_set):
+                    received.append(item)
+                else:
+                    self._stash(caller, item, self._priority(result))
+
+    def _unstash(self, caller: str, sender_set) -> tuple:
+        """
+        Take the first stashed message of the caller from one of the given senders.
+        :param caller: member id of the receiver
+        :param sender_set: set of accepted senders or None for any sender
+        :return: tuple of sender id and message or None
+        """
+        stash: list = self.stash.setdefault(caller, [])
+        for i, (sender, message, _) in enumerate(stash):
+            if sender_set is None or sender in sender_set:
+                del stash[i]
+                return sender, message
+
+    def _unstash_many(self, caller: str, sender_set, max_count: int) -> list:
+        """
+        Take up to max_count stashed messages of the caller from the given senders.
+        :param caller: member id of the receiver
+        :param sender_set: set of accepted senders or None for any sender
+        :param max_count: maximum number of messages
+        :return: list of tuples of sender id and message
+        """
+        received: list = []
+        while len(received) < max_count:
+            item = self._unstash(caller, sender_set)
+            if item is None:
+                break
+            received.append(item)
+        return received
+
+    def _stash(self, caller: str, received: tuple, priority: int) -> None:
+        """
+        Stash a popped message for later receive calls, behind all stashed messages of its lane.
+        :param caller: member id of the receiver
+        :param received: tuple of sender id and message
+        :param priority: lane the message was taken from
+        :return: None
+        """
+        stash: list = self.stash.setdefault(caller, [])
+        position: int = len(stash)
+        while position > 0 and stash[position - 1][2] < priority:
+            position -= 1
+        stash.insert(position, received + (priority,))
+
+    @staticmethod
+    def _wait(deadline) -> int:
+        """
+        Compute the blpop timeout for the remaining time until a deadline.
+        :param deadline: absolute time or None to block forever
+        :return: timeout in seconds (0 blocks forever)
+        """
+        if deadline is None:
+            return 0
+        return max(1, math.ceil(deadline - time.time()))
+
+
+class Channel(BaseChannel):
     """
     Channel implements a communication channel for persistent asynchronous message exchange between member processes.
     Member processes (short: members) have to explicitly join a common global channel and obtain an identifier.
@@ -33,31 +570,246 @@ class Channel:
     Subgroup Member Sets
         Key: <subgroup>
         Value: redis set of member ID strings
-    Global Queue List (containing all possible queue keys)
+    Membership Notifications
+        Pub/sub channel: "membership"
+        Message: subgroup of a joining or leaving member
+    Global Queue Set (containing all possible queue keys)
         Key: "xchan"
-        Value: redis list of queue identifier objects
+        Value: redis set of queue identifier objects
     Queues
         Key: "['<member1>','<member2>']"
         Value: redis list of message objects send fom member1 to member2
+    Inboxes (inbox layout only)
+        Key: "inbox:<member>"
+        Value: redis list of (sender, message) objects send to member
+    High Priority Lanes
+        Key: "high:" followed by a queue or inbox key
+        Value: redis list of messages sent with priority HIGH
+
+    Send operations run as server-side (lua) scripts. Validation of sender and receivers as well as
+    pushing the message to all queues of a multicast happen atomically in a single round trip.
+    Batched receive operations (receive_many, receive_from_many) likewise pop up to a given number
+    of messages from all watched queues in one round trip, keeping FIFO order per sender.
+
+    Alternatively, the channel can use an inbox layout with a single queue per receiver.
+    The sender id then travels with each message and receive operations block on one key,
+    independent of the group size. Messages popped by receive_from that stem from other senders
+    are stashed locally and returned by later receive calls in arrival order.
+    All members of a channel have to use the same layout.
+
+    Messages sent with priority HIGH (e.g. protocol decisions) travel in separate queues (lanes).
+    Receive operations always take messages from high priority lanes first; within a lane,
+    messages keep FIFO order per sender.
+
+    Optionally, the channel keeps a local cache of the member sets (see MemberCache).
+    Receive operations then validate members and construct queue keys without querying redis.
+
+    Instead of redis, the channel can keep its data structures in a store of the local host
+    (see lab_store): 'memory' for threads of one process, 'local' for processes of one host.
+    The backend is chosen by the backend parameter or the VS2LAB_CHANNEL_BACKEND environment variable.
+
+    Channels of a process share their redis connections (see connection_pool). Blocking receives use
+    connections of their own, so threads can send while another thread waits for messages.
+
+    Queues can be spread over several redis instances (shards). Membership data stays on the primary
+    instance (host_ip, port_no), while all incoming queues of a receiver are placed on one shard chosen
+    by consistent hashing of the receiver id (see ShardRing), so blocking receives address one instance.
+    Multicasts to receivers on several shards validate members first and then push to each shard,
+    so they are atomic per shard only. All members have to use the same list of shards.
+
+    Queues can be bounded by a capacity. Sending to a full queue then blocks until the receiver catches
+    up (overflow BLOCK), fails with an assertion (FAIL) or drops the oldest messages (DROP). Multicasts
+    push to all destinations or (unless dropping) to none of them. The capacity counts queue elements,
+    and a batch (see below) is one element, so with batching a queue holds up to capacity * batch_size
+    messages. With a queue_ttl, queues expire when nothing was pushed to or received from them for that
+    many seconds, bounding the memory of queues nobody reads (e.g. of crashed members). Receivers have to
+    use the same queue_ttl as senders. The queues of a leaving member are deleted right away.
+
+    Optionally, the channel collects metrics (see lab_metrics): message and byte counters per member
+    and peer, time blocked in receives, round trips per operation and delivery latency. They are
+    enabled per channel by the metrics parameter or for all channels by the VS2LAB_CHANNEL_METRICS
+    environment variable, and read by stats(). Broadcasts count for peer '*'.
+
+    Likewise, the channel can record a trace of all sent and received messages (see lab_record) given
+    by the recorder parameter or the VS2LAB_CHANNEL_RECORD environment variable. Traces can be replayed
+    into a channel at original or accelerated speed.
+
+    With a batch_size, the channel buffers normal priority messages per receiver and pushes them as
+    one batch (see lab_codec.batch) when a buffer holds batch_size messages, batch_delay seconds after
+    the first buffered message, on flush(), or before the sender receives, broadcasts or leaves.
+    Receivers unpack batches transparently (also without batching enabled), so members can mix both.
+    Messages of a batch that are not returned right away are stashed for later receive calls.
+    Buffered sends validate sender and receivers right away, like unbatched ones. If a flush in the
+    background fails (e.g. a receiver left meanwhile), the next send or flush raises the error.
     """
 
-    def __init__(self, n_bits: int = 5, host_ip: str = 'localhost', port_no: int = 6379):
-        # create redis client
-        self.channel = redis.StrictRedis(host=host_ip, port=port_no, db=0)
-        # create dict of local pid bindings
-        self.os_members = {}
-        # Number of bits for pid addresses
-        self.n_bits: int = n_bits
-        # Maximum corresponding pid
-        self.MAXPROC: int = pow(2, n_bits)
-        # create instance logger
-        self.logger = logging.getLogger('vs2lab.channel.Channel')
+    # environment variable selecting the default backend
+    BACKEND_ENV = 'VS2LAB_CHANNEL_BACKEND'
+
+    # seconds a cached receive_from_any blocks before picking up membership changes
+    CACHE_SLICE = 1
+
+    def __init__(self, n_bits: int = 5, host_ip: str = 'localhost', port_no: int = 6379,
+                 cache_members: bool = False, inbox: bool = False, codec=None, backend: str = None,
+                 shards: list = None, metrics: lab_metrics.ChannelMetrics = None, capacity: int = None,
+                 overflow: str = BaseChannel.BLOCK, queue_ttl: int = None, batch_size: int = None,
+                 batch_delay: float = 0.01, recorder: lab_record.Recorder = None):
+        super().__init__(n_bits, inbox, codec, capacity, overflow, queue_ttl)
+        # create redis client (or connect to a redis-free store)
+        self.backend: str = backend or os.environ.get(self.BACKEND_ENV, 'redis')
+        if self.backend == 'redis':
+            self.channel = _client(host_ip, port_no)
+        else:
+            assert not cache_members, 'member caches require the redis backend'
+            assert not shards, 'shards require the redis backend'
+            self.channel = lab_store.connect(self.backend)
+        # redis clients holding the queues, by shard index ((host, port) pairs, default: primary only)
+        self.shards: list = [_client(host, port) for host, port in shards] if shards else [self.channel]
+        # queues live apart from the membership data (also with a single shard)
+        self.sharded: bool = bool(shards)
+        # clients for blocking receives by shard index (the store serves every thread on its own connection)
+        if self.backend == 'redis':
+            self.blocking_shards: list = [_client(host, port, blocking=True)
+                                          for host, port in shards or [(host_ip, port_no)]]
+        else:
+            self.blocking_shards: list = [self.channel]
+        self.ring = ShardRing(len(self.shards))
+        # register join and send scripts (loaded lazily on first use, then called by hash)
+        self.__join = self.channel.register_script(self.JOIN_SCRIPT)
+        self.__send = self.channel.register_script(self.SEND_SCRIPT)
+        self.__send_all = self.channel.register_script(self.SEND_ALL_SCRIPT)
+        self.__drain = self.channel.register_script(self.DRAIN_SCRIPT)
+        self.__push_script = self.channel.register_script(self.PUSH_SCRIPT)
+        # optional local cache of member sets
+        self.cache = MemberCache(self.channel) if cache_members else None
+        # optional send buffers of normal priority messages by (sender, receiver), flushed as batches
+        # when one holds batch_size messages or batch_delay seconds after the first message
+        self.batch_size = batch_size
+        self.batch_delay: float = batch_delay
+        self.__batches = {}
+        self.__batch_lock = threading.RLock()
+        self.__batch_timer = None
+        # error of a flush in the timer thread, raised by the next send or flush
+        self.__flush_error = None
+        # optional metrics (given or enabled by the VS2LAB_CHANNEL_METRICS environment variable)
+        self.metrics = metrics if metrics is not None else lab_metrics.from_env()
+        if self.metrics is not None:
+            # carry the send time for delivery latency
+            self.codec = lab_codec.Timestamped(self.codec)
+            if self.backend == 'redis':
+                for client in {id(client): client
+                               for client in [self.channel] + self.shards + self.blocking_shards}.values():
+                    self.metrics.instrument(client)
+        # optional trace recorder (given or enabled by the VS2LAB_CHANNEL_RECORD environment variable)
+        self.recorder = recorder if recorder is not None else lab_record.from_env()
         self.logger.debug('New Channel created.')
 
-    @staticmethod
-    def __decode_set(raw) -> set:
-        return {i.decode() for i in raw}
+    def stats(self) -> dict:
+        """
+        Take a snapshot of the channel metrics.
+        :return: dict of counters and histograms (see lab_metrics), None if metrics are disabled
+        """
+        return self.metrics.stats() if self.metrics is not None else None
+
+    def __queues(self, receiver: str):
+        """
+        Get the redis client holding the incoming queues of a receiver.
+        :param receiver: member id
+        :return: redis client of the shard
+        """
+        if len(self.shards) == 1:
+            return self.shards[0]
+        return self.shards[self.ring.shard(receiver)]
+
+    def __blpop(self, receiver: str, keys, timeout: int):
+        """
+        Blocking pop on the shard of a receiver, using a connection dedicated to blocking receives.
+        Renews the expiry of the queue popped from and records the time blocked if metrics are enabled.
+        :param receiver: member id
+        :param keys: queue key or keys
+        :param timeout: timeout in seconds (0 blocks forever)
+        :return: blpop result or None
+        """
+        shard = self.blocking_shards[self.ring.shard(receiver) if len(self.blocking_shards) > 1 else 0]
+        if self.metrics is None:
+            result = shard.blpop(keys, timeout)
+        else:
+            start = time.perf_counter()
+            try:
+                result = shard.blpop(keys, timeout)
+            finally:
+                self.metrics.record_blocked(time.perf_counter() - start)
+        if result is not None and self.queue_ttl:
+            # a receiving member keeps the queue alive like senders do (see DRAIN_SCRIPT)
+            self.__queues(receiver).expire(result[0].decode(), self.queue_ttl)
+        return result
 
+    def __push(self, caller: str, destinations: list, data: bytes, priority: int) -> None:
+        """
+        Validate caller and destinations and push a message to the incoming queues of all destinations.
+        :param caller: member id of the sender
+        :param destinations: member ids of the receivers
+        :param data: serialized message
+        :param priority: lane of the message (NORMAL or HIGH)
+        :return: None
+        """
+        if not self.sharded:
+            # a single atomic round trip
+            keys: list = ['members'] + [self._queue_key(caller, d, priority) for d in destinations]
+            args: list = [data, caller] + self._bounds() + destinations
+            self.__bounded(lambda: self.__send(keys=keys, args=args))
+            return
+
+        # validate on the primary, then push to the queues of every shard in one script call each
+        self.__validate(caller, destinations)
+        by_shard = {}
+        for destination in destinations:
+            by_shard.setdefault(self.ring.shard(destination), []).append(
+                self._queue_key(caller, destination, priority))
+        for shard, keys in by_shard.items():
+            self.__bounded(
+                lambda: self.__push_script(keys=keys, args=[data] + self._bounds(), client=self.shards[shard]))
+
+    def __validate(self, caller: str, destinations: list) -> None:
+        """
+        Validate caller and destinations like the send script does (for pushes outside of it).
+        :param caller: member id of the sender
+        :param destinations: member ids of the receivers
+        :return: None
+        """
+        if self.cache is not None:
+            assert self.cache.contains(caller), 'unknown sender'
+            assert all(self.cache.contains(destination) for destination in destinations), 'unknown receiver'
+            return
+        flags: list = self.channel.smismember('members', [caller] + destinations)
+        assert flags[0], 'unknown sender'
+        assert all(flags[1:]), 'unknown receiver'
+
+    def __bounded(self, push) -> None:
+        """
+        Run a send script, retrying with growing delays while a queue is full and the overflow policy is BLOCK.
+        :param push: function calling the script and returning its status
+        :return: None
+        """
+        delay: float = 0.001
+        status = push()
+        while status == b'queue full' and self.overflow == self.BLOCK:
+            time.sleep(delay)
+            delay = min(2 * delay, self.BLOCK_POLL)
+            status = push()
+        assert status == b'OK', status.decode()
+
+    def __members(self, key: str = 'members') -> set:
+        if self.cache is not None:
+            return self.cache.members(key)
+        return self._decode_set(self.channel.smembers(key))
+
+    def __is_member(self, pid: str, key: str = 'members') -> bool:
+        if self.cache is not None:
+            return self.cache.contains(pid, key)
+        return self.channel.sismember(key, pid)
+
+    @lab_metrics.measured
     def join(self, subgroup: str) -> str:
         """
         Join a process as a member to the global channel and associate it with a (sub)group. 
@@ -66,181 +818,318 @@ class Channel:
         :param subgroup: an identifier for the grouping
         :return: global member id of the process.
         """
-        # For concurrently assigning unique member ids, we need to use a transaction
-        # atomically reading and writing the member set. This can be implemented by
-        # means of the pipeline construct.
-        with self.channel.pipeline() as pipe:
-            while 1:
-                try:
-                    # Put a WATCH on the key that holds the member set
-                    pipe.watch('members')
-                    # After WATCHing, the pipeline is put into immediate execution
-                    # mode until we tell it to start buffering commands again.
-                    # This allows us to get the current value of the global member set
-                    raw_members = pipe.smembers('members')
-                    members = self.__decode_set(raw_members)
-                    # Now construct new/unused random member id
-                    remaining_ids = list(set([str(i) for i in range(self.MAXPROC)]) - members)
-                    new_pid = random.choice(remaining_ids)
-                    # Then we can put the pipeline back into buffered mode with MULTI
-                    pipe.multi()
-                    # Add new member id to global member set and subgroup
-                    pipe.sadd('members', new_pid)
-                    pipe.sadd(subgroup, new_pid)
-                    # and finally, execute the pipeline (the set command)
-                    pipe.execute()
-                    # if a WatchError wasn't raised during execution,
-                    # everything we just did happened atomically.
-                    break
-                except redis.WatchError:
-                    # another client must have changed 'members' between
-                    # the time we started WATCHing it and the pipeline's execution.
-                    # our best bet is to just retry.
-                    continue
-        self.logger.info("Member {} joining {}.".format(new_pid, subgroup))
+        # Claim a random unused member id. The join script atomically adds the first free
+        # candidate to the member sets, so the cost does not depend on the size of the id space.
+        new_pid = None
+        rounds: int = 0
+        while new_pid is None:
+            candidates: list = self._candidates(None if rounds < self.JOIN_ROUNDS else self.__members())
+            new_pid = self.__join(keys=['members', subgroup], args=[self.MEMBERSHIP, subgroup] + candidates)
+            rounds += 1
+        new_pid = new_pid.decode()
+        self.logger.info("Member %s joining %s.", new_pid, subgroup)
 
         # construct bidirectional queue names for new member and all existing members (if any)
-        if len(members) > 0:
-            xchan: list = [[new_pid, other] for other in members] + [[other, new_pid] for other in members]
-            # push queue names to global list of all possible transfer queues
-            for xc in xchan:
-                self.channel.rpush('xchan', pickle.dumps(xc))
+        if not self.inbox:
+            members: set = self._decode_set(self.channel.smembers('members')) - {new_pid}
+            if len(members) > 0:
+                # add queue names to global set of all possible transfer queues
+                self.channel.sadd('xchan', *self._xchan(new_pid, members))
         return new_pid
 
+    @lab_metrics.measured
     def leave(self, subgroup: str):
         """
         Unregister a process from the global channel (and subgroup).
         :param subgroup: subgroup identifier
         :return: None
         """
+        # peers might be waiting for buffered messages
+        if self.__batches:
+            self.flush()
+
         # retrieve member id via os pid and validate it
         os_pid: int = os.getpid()
         pid: str = self.os_members[os_pid]
-        assert self.channel.sismember('members', pid), 'member unknown'
-        self.logger.info("Member {} leaving {}".format(pid, subgroup))
+        assert self.__is_member(pid), 'member unknown'
+        self.logger.info("Member %s leaving %s", pid, subgroup)
 
-        # remove binding and global member element
+        # remove binding
         del self.os_members[os_pid]
-        self.channel.srem('members', pid)
 
-        # decode member set binary elements to string list
-        raw_members: set = self.channel.smembers('members')
-        members: set = self.__decode_set(raw_members)
+        # remaining members (a cache might not have seen the removal yet)
+        members: set = self.__members() - {pid}
 
-        # construct bidirectional queue names for new member and all existing members (if any)
-        if len(members) > 0:
-            xchan: list = [[pid, other] for other in members] + [[other, pid] for other in members]
-            # pop queue names from global list of all possible transfer queues
-            for xc in xchan:
-                self.channel.lrem('xchan', 0, pickle.dumps(xc))
+        # queues of the member that can no longer be received from, by shard
+        orphans = {}
+        for receiver, key in self._orphans(pid, members):
+            orphans.setdefault(self.ring.shard(receiver), []).append(key)
 
-        # remove member id from subgroup set
-        self.channel.srem(subgroup, pid)
+        with self.channel.pipeline() as pipe:
+            # remove global member element and member id from subgroup set
+            pipe.srem('members', pid)
+            pipe.srem(subgroup, pid)
+            # construct bidirectional queue names for leaving member and all remaining members (if any)
+            if len(members) > 0 and not self.inbox:
+                # remove queue names from global set of all possible transfer queues
+                pipe.srem('xchan', *self._xchan(pid, members))
+            # announce the change to member caches
+            pipe.publish(self.MEMBERSHIP, subgroup)
+            if not self.sharded:
+                pipe.delete(*orphans[0])
+            pipe.execute()
+        if self.sharded:
+            for shard, keys in orphans.items():
+                self.shards[shard].delete(*keys)
 
+    @lab_metrics.measured
     def exists(self, pid: str) -> bool:
         """
         Check if pid is in global member set
         :param pid: process identifier
         :return: boolean value, true if pid is a member
         """
-        return self.channel.sismember('members', pid)
-
-    def bind(self, pid: str) -> int:
-        """
-        Associate os pid with channel member id.
-        Thus a caller does not need to provide its id for every subsequent call.
-        :param pid: identifier of process member
-        :return: os pid value
-        """
-        # retrieve os pid and map to given member id
-        os_pid: int = os.getpid()
-        self.os_members[os_pid] = pid
-        self.logger.debug("Member {} bound {}".format(pid, os_pid))
-        return os_pid
+        return self.__is_member(pid)
 
+    @lab_metrics.measured
     def subgroup(self, subgroup: str) -> set:
         """
         Retrieve members of a subgroup.
         :param subgroup: subgroup string identifier
         :return: set of member process identifiers
         """
-        return self.__decode_set(self.channel.smembers(subgroup))
-
-    @staticmethod
-    def __queue_key(sender: str, receiver: str) -> str:
-        """
-        Construct queue name from sender and receiver ids.
-        :param sender: member identifier
-        :param receiver: member identifier
-        :return: redis key
-        """
-        return str([sender, receiver])
+        return self.__members(subgroup)
 
-    def send_to(self, destination_set: set, message: object) -> None:
+    @lab_metrics.measured
+    def send_to(self, destination_set: set, message: object, priority: int = BaseChannel.NORMAL) -> None:
         """
         Sends an asynchronous, persistent multicast message.
         :param destination_set: a set of member identifiers
         :param message: the message object to be send (see 'message format' in class doc)
+        :param priority: HIGH to deliver ahead of all NORMAL messages queued for the receivers
         :return: None
         """
         # destination_set needs to contain string identifiers
         assert all(type(k) is str for k in destination_set), 'type error'
 
-        # lookup member id by pid and validate it
+        # lookup member id by pid
         caller: str = self.os_members[os.getpid()]
-        assert self.channel.sismember('members', caller), 'unknown sender'
-        self.logger.debug("{} sends {} to {}".format(caller, message, destination_set))
+        self.logger.debug("%s sends %s to %s", caller, message, destination_set)
+
+        destinations: list = list(destination_set)
+        data = self._pack(caller, message)
+        if self.metrics is not None:
+            self.metrics.record_send(caller, destinations, len(data))
+        if self.recorder is not None:
+            self._record_send(caller, destinations, data, priority)
+        if self.batch_size is not None and priority == self.NORMAL:
+            # fail right away on unknown members instead of when the batch is pushed
+            self.__validate(caller, destinations)
+            self.__buffer(caller, destinations, data)
+        else:
+            # validate caller and destinations and push message to incoming queues of all destinations
+            self.__push(caller, destinations, data, priority)
+
+    def __buffer(self, caller: str, destinations: list, data: bytes) -> None:
+        """
+        Add a message to the send buffers of its destinations.
+        :param caller: member id of the sender
+        :param destinations: member ids of the receivers
+        :param data: serialized message
+        :return: None
+        """
+        with self.__batch_lock:
+            self.__raise_flush_error()
+            full: bool = False
+            for destination in destinations:
+                batch: list = self.__batches.setdefault((caller, destination), [])
+                batch.append(data)
+                full = full or len(batch) >= self.batch_size
+            if full:
+                self.flush()
+            elif self.__batch_timer is None:
+                self.__batch_timer = threading.Timer(self.batch_delay, self.__flush_due)
+                self.__batch_timer.daemon = True
+                self.__batch_timer.start()
+
+    def __flush_due(self) -> None:
+        # runs in the timer thread, so keep errors for the next send or flush of the sender
+        with self.__batch_lock:
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error("Flushing send buffers failed: %s", e)
+                self.__flush_error = e
+
+    def __raise_flush_error(self) -> None:
+        """
+        Raise the error of a failed flush in the timer thread (once).
+        :return: None
+        """
+        error, self.__flush_error = self.__flush_error, None
+        if error is not None:
+            raise error
 
-        # push message to incoming queues of all destinations
-        for destination in destination_set:
-            assert self.channel.sismember('members', destination), 'unknown receiver'
-            self.channel.rpush(self.__queue_key(caller, destination), pickle.dumps(message))
+    @lab_metrics.measured
+    def flush(self) -> None:
+        """
+        Push all buffered messages, one batch per receiver (see batch_size).
+        Receivers with the same buffered messages (e.g. after multicasts) share one push.
+        If the push of such a group fails (e.g. a receiver left meanwhile), its receivers are pushed one
+        by one, so only the messages of failing receivers are lost, and an AssertionError names them.
+        On other errors (e.g. redis connection errors) the messages not pushed yet stay buffered.
+        :return: None
+        """
+        with self.__batch_lock:
+            self.__raise_flush_error()
+            batches, self.__batches = self.__batches, {}
+            if self.__batch_timer is not None:
+                self.__batch_timer.cancel()
+                self.__batch_timer = None
+            # group receivers by buffer contents (a multicast message is shared by the buffers of all receivers)
+            groups = {}
+            for (caller, destination), messages in batches.items():
+                groups.setdefault((caller, tuple(map(id, messages))), (messages, []))[1].append(destination)
+            failed: list = []
+            try:
+                for (caller, _), (messages, destinations) in groups.items():
+                    data = messages[0] if len(messages) == 1 else lab_codec.batch(messages)
+                    try:
+                        self.__push(caller, destinations, data, self.NORMAL)
+                    except AssertionError:
+                        for destination in list(destinations):
+                            try:
+                                self.__push(caller, [destination], data, self.NORMAL)
+                            except AssertionError as e:
+                                failed.append('{} ({})'.format(destination, e))
+                            destinations.remove(destination)
+                    else:
+                        destinations.clear()
+            except Exception:
+                # keep the messages not pushed yet for the next flush
+                for (caller, _), (messages, destinations) in groups.items():
+                    for destination in destinations:
+                        self.__batches[(caller, destination)] = messages
+                raise
+            assert not failed, 'buffered messages not delivered to ' + ', '.join(failed)
 
-    def send_to_all(self, message: object) -> None:
+    @lab_metrics.measured
+    def send_to_all(self, message: object, priority: int = BaseChannel.NORMAL) -> None:
         """
         Sends an asynchronous, persistent broadcast message.
         The message is delivered to all queues of currently registered members.
         :param message: the message object to be send
+        :param priority: HIGH to deliver ahead of all NORMAL messages queued for the receivers
         :return: None
         """
-        # lookup member id by pid and validate it
+        # lookup member id by pid
         caller: str = self.os_members[os.getpid()]
-        assert self.channel.sismember('members', caller), 'unknown sender'
-        self.logger.debug("{} sends {} to all members".format(caller, message))
+        self.logger.debug("%s sends %s to all members", caller, message)
+
+        # keep FIFO order with buffered messages
+        if self.__batches:
+            self.flush()
+
+        # validate caller and push message to incoming queues of all members
+        data = self._pack(caller, message)
+        if self.sharded:
+            members: list = list(self.__members())
+            if self.metrics is not None:
+                self.metrics.record_send(caller, members, len(data))
+            if self.recorder is not None:
+                self._record_send(caller, members, data, priority)
+            self.__push(caller, members, data, priority)
+            return
+        prefix, suffix = self._queue_key_affixes(caller, priority)
+        if self.metrics is not None:
+            # the receivers are only known to the script
+            self.metrics.record_send(caller, ['*'], len(data))
+        if self.recorder is not None:
+            self.recorder.record(lab_record.SEND, caller, '*', prefix + '*' + suffix, data)
+        args: list = [data, caller] + self._bounds() + [prefix, suffix]
+        self.__bounded(lambda: self.__send_all(keys=['members'], args=args))
+
+    def __receive_inbox(self, caller: str, sender_set, timeout: int):
+        """
+        Take the next message from the inbox of the caller (inbox layout only).
+        Messages from senders outside of sender_set are stashed for later receive calls.
+        :param caller: member id of the receiver
+        :param sender_set: set of accepted senders or None for any sender
+        :param timeout: overall timeout (0 blocks forever)
+        :return: tuple of sender id and message or None
+        """
+        # serve stashed messages first (in arrival order)
+        received = self._unstash(caller, sender_set)
+        if received is not None:
+            return received
 
-        members = self.__decode_set(self.channel.smembers('members'))
-        # push message to incoming queues of all members
-        for destination in members:
-            self.channel.rpush([self.__queue_key(caller, destination)], pickle.dumps(message))
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            result = self.__blpop(caller, self._in_queues(None, caller), self._wait(deadline))
+            if result is None:
+                return None
+            received: list = []
+            self._collect(caller, [result], sender_set, received, 1)
+            if len(received) > 0:
+                return received[0]
+            if deadline is not None and time.time() >= deadline:
+                return None
 
+    @lab_metrics.measured
     def receive_from_any(self, timeout: int = 0) -> tuple:
         """
         Make a blocking request to take the next message off any of the callers' incoming queues.
         :param timeout: optional timeout for blocking read.
         :return: list containing the queue name and message
         """
+        # peers might be waiting for buffered messages
+        if self.__batches:
+            self.flush()
+
         # lookup member id by pid and validate it
         caller = self.os_members[os.getpid()]
-        assert self.channel.sismember('members', str(caller)), 'unknown receiver'
-
-        # decode member set binary elements
-        members: set = self.__decode_set(self.channel.smembers('members'))
-        # construct incoming message queues for all members
-        in_queues: set = {self.__queue_key(member, caller) for member in members}
-        self.logger.debug("{} receives from {}".format(caller, in_queues))
+        assert self.__is_member(str(caller)), 'unknown receiver'
+        self.logger.debug("%s receives from any member", caller)
 
         # block until new msg appears on one of the incoming queues
-        result = self.channel.blpop(in_queues, timeout)
-        if result is not None:
-            # extract sender id from key part
-            key: str = result[0].decode()
-            sender: str = key.split("'")[1]
-            # deserialize msg content
-            message = pickle.loads(result[1])
+        if self.inbox:
+            received = self.__receive_inbox(caller, None, timeout)
+        else:
+            # serve messages left over from received batches first
+            received = self._unstash(caller, None)
+            if received is None:
+                if self.cache is None:
+                    # construct incoming message queues for all members
+                    in_queues: list = self._in_queues(self.__members(), caller)
+                    result = self.__blpop(caller, in_queues, timeout)
+                else:
+                    result = self.__blpop_cached(caller, timeout)
+                received = self._unpack(caller, result) if result is not None else None
+        if received is not None:
             # log and return results
-            self.logger.debug("{} received {} from {}".format(caller, message, sender))
-            return sender, message
+            self.logger.debug("%s received %s from %s", caller, received[1], received[0])
+            return received
+
+    def __blpop_cached(self, caller: str, timeout: int):
+        """
+        Block on the incoming queues of all cached members in short slices.
+        Members that join while waiting are picked up in the next slice instead of being
+        ignored until the next receive call.
+        :param caller: member id of the receiver
+        :param timeout: overall timeout (0 blocks forever)
+        :return: blpop result or None
+        """
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            in_queues: list = self._in_queues(self.cache.members(), caller)
+            wait: int = self.CACHE_SLICE
+            if deadline is not None:
+                wait = max(1, min(wait, math.ceil(deadline - time.time())))
+            result = self.__blpop(caller, in_queues, wait)
+            if result is not None or (deadline is not None and time.time() >= deadline):
+                return result
 
+    @lab_metrics.measured
     def receive_from(self, sender_set: set, timeout: int = 0) -> tuple:
         """
         Make a blocking call to pop the next message off any of the callers' queues
@@ -249,27 +1138,415 @@ class Channel:
         :param timeout: optional timeout for blocking call
         :return:
         """
+        # peers might be waiting for buffered messages
+        if self.__batches:
+            self.flush()
+
         assert (type(k) is str for k in sender_set), 'Address type mismatch.'
 
         # lookup member id by pid and validate it
         caller: str = self.os_members[os.getpid()]
-        assert self.channel.sismember('members', caller), 'unknown receiver'
-        self.logger.debug("{} receives from {}".format(caller, sender_set))
+        assert self.__is_member(caller), 'unknown receiver'
+        self.logger.debug("%s receives from %s", caller, sender_set)
 
         # validate all senders and construct incoming queues for them
-        in_queues: set = set()
         for sender in sender_set:
-            assert self.channel.sismember('members', sender), 'unknown sender'
-            in_queues.add(self.__queue_key(sender, caller))
+            assert self.__is_member(sender), 'unknown sender'
+        in_queues: list = self._in_queues(sender_set, caller)
 
         # block until new msg appears on one of the queues
-        result = self.channel.blpop(in_queues, timeout)
-        if result is not None:
-            # extract sender id from key part
-            key: str = result[0].decode()
-            sender: str = key.split("'")[1]
-            # deserialize msg content
-            message = pickle.loads(result[1])
+        if self.inbox:
+            received = self.__receive_inbox(caller, set(sender_set), timeout)
+        else:
+            # serve messages left over from received batches first
+            received = self._unstash(caller, set(sender_set))
+            if received is None:
+                result = self.__blpop(caller, in_queues, timeout)
+                received = self._unpack(caller, result) if result is not None else None
+        if received is not None:
             # log and return results
-            self.logger.debug("{} received {} from {}".format(caller, message, sender))
-            return sender, message
+            self.logger.debug("%s received %s from %s", caller, received[1], received[0])
+            return received
+
+    @staticmethod
+    def __pairs(results: list) -> list:
+        # pair up the flat key/message list returned by the drain script
+        return list(zip(results[::2], results[1::2]))
+
+    def __receive_many(self, caller: str, sender_set, in_queues: list, max_count: int, timeout: int) -> list:
+        """
+        Pop up to max_count messages from a set of queues (pairwise layout only).
+        Blocks for the first message only if all queues are empty.
+        :param caller: member id of the receiver
+        :param sender_set: set of accepted senders or None for any sender
+        :param in_queues: queue keys to pop from (high priority lanes first, see _in_queues)
+        :param max_count: maximum number of messages
+        :param timeout: timeout for blocking on the first message (0 blocks forever)
+        :return: list of (sender id, message) tuples, empty on timeout
+        """
+        # serve messages left over from received batches first
+        received: list = self._unstash_many(caller, sender_set, max_count)
+        if len(received) == max_count:
+            return received
+        shard = self.__queues(caller)
+        # the first half of the queues are high priority lanes
+        leading: int = len(in_queues) // 2
+        ttl: int = self.queue_ttl or 0
+        results: list = self.__pairs(
+            self.__drain(keys=in_queues, args=[max_count - len(received), leading, ttl], client=shard))
+        if len(results) == 0 and len(received) == 0:
+            # nothing queued yet, so block until the first message appears
+            if self.cache is None:
+                first = self.__blpop(caller, in_queues, timeout)
+            else:
+                first = self.__blpop_cached(caller, timeout)
+            if first is None:
+                return []
+            results = [first]
+            if max_count > 1:
+                results += self.__pairs(self.__drain(keys=in_queues, args=[max_count - 1, leading, ttl], client=shard))
+        self._collect(caller, results, sender_set, received, max_count)
+        return received
+
+    def __receive_inbox_many(self, caller: str, sender_set, max_count: int, timeout: int) -> list:
+        """
+        Pop up to max_count messages from the inbox of the caller (inbox layout only).
+        Messages from senders outside of sender_set are stashed for later receive calls.
+        :param caller: member id of the receiver
+        :param sender_set: set of accepted senders or None for any sender
+        :param max_count: maximum number of messages
+        :param timeout: timeout for blocking on the first message (0 blocks forever)
+        :return: list of (sender id, message) tuples, empty on timeout
+        """
+        # serve stashed messages first (in arrival order)
+        received: list = self._unstash_many(caller, sender_set, max_count)
+
+        keys: list = self._in_queues(None, caller)
+        shard = self.__queues(caller)
+        ttl: int = self.queue_ttl or 0
+        deadline = time.time() + timeout if timeout else None
+        while len(received) < max_count:
+            results: list = self.__pairs(
+                self.__drain(keys=keys, args=[max_count - len(received), 1, ttl], client=shard))
+            if len(results) == 0:
+                if len(received) > 0:
+                    break
+                first = self.__blpop(caller, keys, self._wait(deadline))
+                if first is None:
+                    break
+                results = [first]
+            self._collect(caller, results, sender_set, received, max_count)
+            if len(received) == 0 and deadline is not None and time.time() >= deadline:
+                break
+        return received
+
+    @lab_metrics.measured
+    def receive_many(self, max_count: int, timeout: int = 0) -> list:
+        """
+        Take up to max_count messages off any of the callers' incoming queues in one round trip.
+        Blocks only if no message is queued at all.
+        :param max_count: maximum number of messages to return
+        :param timeout: optional timeout for blocking read
+        :return: list of (sender id, message) tuples (FIFO per sender), empty on timeout
+        """
+        # peers might be waiting for buffered messages
+        if self.__batches:
+            self.flush()
+
+        # lookup member id by pid and validate it
+        caller: str = self.os_members[os.getpid()]
+        assert self.__is_member(caller), 'unknown receiver'
+        self.logger.debug("%s receives up to %s messages from any member", caller, max_count)
+
+        if self.inbox:
+            received = self.__receive_inbox_many(caller, None, max_count, timeout)
+        else:
+            in_queues: list = self._in_queues(self.__members(), caller)
+            received = self.__receive_many(caller, None, in_queues, max_count, timeout)
+        self.logger.debug("%s received %s", caller, received)
+        return received
+
+    @lab_metrics.measured
+    def receive_from_many(self, sender_set: set, max_count: int, timeout: int = 0) -> list:
+        """
+        Take up to max_count messages off the callers' queues from the members in sender_set.
+        Blocks only if no message from these senders is queued at all.
+        :param sender_set: set of ids to watch respective incoming queues for new messages
+        :param max_count: maximum number of messages to return
+        :param timeout: optional timeout for blocking call
+        :return: list of (sender id, message) tuples (FIFO per sender), empty on timeout
+        """
+        # peers might be waiting for buffered messages
+        if self.__batches:
+            self.flush()
+
+        # lookup member id by pid and validate it
+        caller: str = self.os_members[os.getpid()]
+        assert self.__is_member(caller), 'unknown receiver'
+        self.logger.debug("%s receives up to %s messages from %s", caller, max_count, sender_set)
+
+        # validate all senders and construct incoming queues for them
+        for sender in sender_set:
+            assert self.__is_member(sender), 'unknown sender'
+        in_queues: list = self._in_queues(sender_set, caller)
+
+        if self.inbox:
+            received = self.__receive_inbox_many(caller, set(sender_set), max_count, timeout)
+        else:
+            received = self.__receive_many(caller, set(sender_set), in_queues, max_count, timeout)
+        self.logger.debug("%s received %s", caller, received)
+        return received
+
+
+class AsyncChannel(BaseChannel):
+    """
+    AsyncChannel provides the Channel API as coroutines on top of redis.asyncio.
+
+    It uses the same redis data structures, scripts and message format as Channel, so blocking and
+    asyncio members can talk to each other. Many sends and receives of one process can be pending
+    concurrently on a single event loop, e.g. one receive per outstanding RPC request.
+
+    Every pending receive occupies its own pooled connection while blocking. Receives can be cancelled
+    or bounded by asyncio.wait_for; a message that redis hands out at the very moment of cancellation
+    may get lost with the dropped connection, so prefer the timeout parameter where possible.
+    Member caching (see MemberCache) and send batching are not supported. Blocked sends to full queues (see Channel)
+    wait without blocking the event loop.
+    """
+
+    def __init__(self, n_bits: int = 5, host_ip: str = 'localhost', port_no: int = 6379, inbox: bool = False,
+                 codec=None, capacity: int = None, overflow: str = BaseChannel.BLOCK, queue_ttl: int = None):
+        super().__init__(n_bits, inbox, codec, capacity, overflow, queue_ttl)
+        # create asyncio redis client
+        self.channel = redis.asyncio.StrictRedis(host=host_ip, port=port_no, db=0)
+        # register join and send scripts (loaded lazily on first use, then called by hash)
+        self.__join = self.channel.register_script(self.JOIN_SCRIPT)
+        self.__send = self.channel.register_script(self.SEND_SCRIPT)
+        self.__send_all = self.channel.register_script(self.SEND_ALL_SCRIPT)
+        # signals stashed inbox messages to concurrent receives
+        self.__arrival = asyncio.Condition()
+        # members with a receive currently popping their inbox
+        self.__readers = set()
+        self.logger.debug('New AsyncChannel created.')
+
+    async def close(self) -> None:
+        """
+        Close all connections of the underlying redis client.
+        :return: None
+        """
+        await self.channel.aclose()
+
+    async def join(self, subgroup: str) -> str:
+        """
+        Join a process as a member to the global channel and associate it with a (sub)group.
+        :param subgroup: an identifier for the grouping
+        :return: global member id of the process.
+        """
+        # claim a random unused member id (see Channel.join)
+        new_pid = None
+        rounds: int = 0
+        while new_pid is None:
+            members = None
+            if rounds >= self.JOIN_ROUNDS:
+                members = self._decode_set(await self.channel.smembers('members'))
+            new_pid = await self.__join(keys=['members', subgroup],
+                                        args=[self.MEMBERSHIP, subgroup] + self._candidates(members))
+            rounds += 1
+        new_pid = new_pid.decode()
+        self.logger.info("Member %s joining %s.", new_pid, subgroup)
+
+        # add bidirectional queue names for new member and all existing members (if any)
+        if not self.inbox:
+            members: set = self._decode_set(await self.channel.smembers('members')) - {new_pid}
+            if len(members) > 0:
+                await self.channel.sadd('xchan', *self._xchan(new_pid, members))
+        return new_pid
+
+    async def leave(self, subgroup: str) -> None:
+        """
+        Unregister a process from the global channel (and subgroup).
+        :param subgroup: subgroup identifier
+        :return: None
+        """
+        # retrieve member id via os pid and validate it
+        os_pid: int = os.getpid()
+        pid: str = self.os_members[os_pid]
+        assert await self.channel.sismember('members', pid), 'member unknown'
+        self.logger.info("Member %s leaving %s", pid, subgroup)
+
+        # remove binding
+        del self.os_members[os_pid]
+
+        members: set = self._decode_set(await self.channel.smembers('members')) - {pid}
+        async with self.channel.pipeline() as pipe:
+            pipe.srem('members', pid)
+            pipe.srem(subgroup, pid)
+            if len(members) > 0 and not self.inbox:
+                pipe.srem('xchan', *self._xchan(pid, members))
+            pipe.publish(self.MEMBERSHIP, subgroup)
+            # delete queues that can no longer be received from
+            pipe.delete(*[key for _, key in self._orphans(pid, members)])
+            await pipe.execute()
+
+    async def exists(self, pid: str) -> bool:
+        """
+        Check if pid is in global member set
+        :param pid: process identifier
+        :return: boolean value, true if pid is a member
+        """
+        return bool(await self.channel.sismember('members', pid))
+
+    async def subgroup(self, subgroup: str) -> set:
+        """
+        Retrieve members of a subgroup.
+        :param subgroup: subgroup string identifier
+        :return: set of member process identifiers
+        """
+        return self._decode_set(await self.channel.smembers(subgroup))
+
+    async def send_to(self, destination_set: set, message: object, priority: int = BaseChannel.NORMAL) -> None:
+        """
+        Sends an asynchronous, persistent multicast message.
+        :param destination_set: a set of member identifiers
+        :param message: the message object to be send
+        :param priority: HIGH to deliver ahead of all NORMAL messages queued for the receivers
+        :return: None
+        """
+        assert all(type(k) is str for k in destination_set), 'type error'
+
+        caller: str = self.os_members[os.getpid()]
+        self.logger.debug("%s sends %s to %s", caller, message, destination_set)
+
+        destinations: list = list(destination_set)
+        keys: list = ['members'] + [self._queue_key(caller, destination, priority) for destination in destinations]
+        args: list = [self._pack(caller, message), caller] + self._bounds() + destinations
+        await self.__bounded(lambda: self.__send(keys=keys, args=args))
+
+    async def send_to_all(self, message: object, priority: int = BaseChannel.NORMAL) -> None:
+        """
+        Sends an asynchronous, persistent broadcast message to all currently registered members.
+        :param message: the message object to be send
+        :param priority: HIGH to deliver ahead of all NORMAL messages queued for the receivers
+        :return: None
+        """
+        caller: str = self.os_members[os.getpid()]
+        self.logger.debug("%s sends %s to all members", caller, message)
+
+        prefix, suffix = self._queue_key_affixes(caller, priority)
+        args: list = [self._pack(caller, message), caller] + self._bounds() + [prefix, suffix]
+        await self.__bounded(lambda: self.__send_all(keys=['members'], args=args))
+
+    async def __bounded(self, push) -> None:
+        """
+        Run a send script, retrying with growing delays while a queue is full and the overflow policy is BLOCK.
+        :param push: function calling the script and returning an awaitable status
+        :return: None
+        """
+        delay: float = 0.001
+        status = await push()
+        while status == b'queue full' and self.overflow == self.BLOCK:
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, self.BLOCK_POLL)
+            status = await push()
+        assert status == b'OK', status.decode()
+
+    async def __blpop(self, keys, timeout: int):
+        """
+        Blocking pop, renewing the expiry of the queue popped from (see Channel).
+        :param keys: queue keys
+        :param timeout: timeout in seconds (0 blocks forever)
+        :return: blpop result or None
+        """
+        result = await self.channel.blpop(keys, timeout)
+        if result is not None and self.queue_ttl:
+            await self.channel.expire(result[0], self.queue_ttl)
+        return result
+
+    async def __receive_inbox(self, caller: str, sender_set, timeout: int):
+        """
+        Take the next message from the inbox of the caller (inbox layout only).
+        Messages from senders outside of sender_set are stashed for later receive calls.
+        :param caller: member id of the receiver
+        :param sender_set: set of accepted senders or None for any sender
+        :param timeout: overall timeout (0 blocks forever)
+        :return: tuple of sender id and message or None
+        """
+        deadline = time.time() + timeout if timeout else None
+        async with self.__arrival:
+            while True:
+                # serve stashed messages first (in arrival order)
+                received = self._unstash(caller, sender_set)
+                if received is not None:
+                    return received
+                if deadline is not None and time.time() >= deadline:
+                    return None
+                if caller in self.__readers:
+                    # another receive pops the inbox and hands over messages via the stash
+                    try:
+                        await asyncio.wait_for(self.__arrival.wait(),
+                                               deadline - time.time() if deadline is not None else None)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                # pop the inbox without holding the lock, so other receives can pick up stashed messages
+                self.__readers.add(caller)
+                self.__arrival.release()
+                result = None
+                try:
+                    result = await self.__blpop(self._in_queues(None, caller), self._wait(deadline))
+                finally:
+                    await self.__arrival.acquire()
+                    self.__readers.discard(caller)
+                    if result is not None:
+                        for item in self._unpack_all(caller, result):
+                            self._stash(caller, item, self._priority(result))
+                    self.__arrival.notify_all()
+
+    async def receive_from_any(self, timeout: int = 0) -> tuple:
+        """
+        Wait for the next message on any of the callers' incoming queues.
+        :param timeout: optional timeout for blocking read.
+        :return: tuple of sender id and message or None on timeout
+        """
+        caller: str = self.os_members[os.getpid()]
+        members: set = self._decode_set(await self.channel.smembers('members'))
+        assert caller in members, 'unknown receiver'
+        self.logger.debug("%s receives from any member", caller)
+
+        if self.inbox:
+            received = await self.__receive_inbox(caller, None, timeout)
+        else:
+            # serve messages left over from received batches first
+            received = self._unstash(caller, None)
+            if received is None:
+                result = await self.__blpop(self._in_queues(members, caller), timeout)
+                received = self._unpack(caller, result) if result is not None else None
+        if received is not None:
+            self.logger.debug("%s received %s from %s", caller, received[1], received[0])
+            return received
+
+    async def receive_from(self, sender_set: set, timeout: int = 0) -> tuple:
+        """
+        Wait for the next message on the callers' queues from the members in sender_set.
+        :param sender_set: set of ids to watch respective incoming queues for a new message
+        :param timeout: optional timeout for blocking call
+        :return: tuple of sender id and message or None on timeout
+        """
+        caller: str = self.os_members[os.getpid()]
+        senders: list = list(sender_set)
+        # validate receiver and all senders in one round trip
+        flags = await self.channel.smismember('members', [caller] + senders)
+        assert flags[0], 'unknown receiver'
+        assert all(flags[1:]), 'unknown sender'
+        self.logger.debug("%s receives from %s", caller, sender_set)
+
+        if self.inbox:
+            received = await self.__receive_inbox(caller, set(senders), timeout)
+        else:
+            # serve messages left over from received batches first
+            received = self._unstash(caller, set(senders))
+            if received is None:
+                result = await self.__blpop(self._in_queues(senders, caller), timeout)
+                received = self._unpack(caller, result) if result is not None else None
+        if received is not None:
+            self.logger.debug("%s received %s from %s", caller, received[1], received[0])
+            return received
@@ -0,0 +1,479 @@
+"""
+Channel unit tests
+
+The same scenarios run against every backend and queue layout: the redis backend against fakeredis,
+which executes the channel's lua scripts, and the memory and local backends, which reimplement them
+(see lab_store). So no redis server is needed. Run from the repository root: python -m pytest lib
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+import fakeredis
+import redis
+
+from lib import lab_channel, lab_codec, lab_metrics, lab_store
+
+
+class ChannelTestCase(unittest.TestCase):
+    """Test case creating channels of a backend and queue layout"""
+    backend = 'memory'
+    inbox = False
+
+    def setUp(self):
+        lab_store.connect(self.backend).flushall()
+
+    def store(self):
+        """Direct client of the store holding the channel data"""
+        return lab_store.connect(self.backend)
+
+    def member(self, subgroup='node', **options):
+        """Create a channel, join it and bind the member id"""
+        options.setdefault('backend', self.backend)
+        options.setdefault('inbox', self.inbox)
+        chan = lab_channel.Channel(**options)
+        pid = chan.join(subgroup)
+        chan.bind(pid)
+        return chan, pid
+
+    def queues(self):
+        """Keys of all queues in the store"""
+        keys = {key.decode() for key in self.store().keys('*')}
+        return {key for key in keys if key.startswith(('[', 'inbox:', lab_channel.BaseChannel.HIGH_PREFIX))}
+
+
+class FakeRedisTestCase(ChannelTestCase):
+    """Test case connecting channels to fake redis servers (one per host and port)"""
+    backend = 'redis'
+
+    def setUp(self):
+        self.servers = {}
+
+        def connection_pool(host, port, blocking=False):
+            server = self.servers.setdefault((host, port), fakeredis.FakeServer())
+            return redis.ConnectionPool(connection_class=fakeredis.FakeRedisConnection, server=server)
+
+        patcher = mock.patch.object(lab_channel, 'connection_pool', connection_pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def store(self, host='localhost', port=6379):
+        return redis.StrictRedis(connection_pool=lab_channel.connection_pool(host, port))
+
+
+class ChannelScenarios:
+    """Channel behaviour every backend and layout has to show (mixed into test cases of each)"""
+
+    def test_join_and_leave(self):
+        """Test member ids, subgroups and the removal of a leaving member and its queues."""
+        (a, pid_a), (b, pid_b) = self.member('server'), self.member('client')
+        self.assertNotEqual(pid_a, pid_b)
+        self.assertTrue(a.exists(pid_b))
+        self.assertEqual((a.subgroup('server'), a.subgroup('client')), ({pid_a}, {pid_b}))
+        a.send_to({pid_b}, 'unread')
+        b.send_to({pid_a}, 'unread')
+        b.leave('client')
+        self.assertFalse(a.exists(pid_b))
+        self.assertEqual(a.subgroup('client'), set())
+        with self.assertRaises(AssertionError):
+            a.send_to({pid_b}, 'to nobody')
+        # only the queue to a remains in inbox layout, where it does not belong to b alone
+        self.assertEqual(self.queues(), {a._queue_key(pid_b, pid_a)} if self.inbox else set())
+
+    def test_join_fills_small_id_space(self):
+        """Test that joins find the last free ids of a nearly full id space and then fail."""
+        for n_bits in (2, 3):
+            # with a single candidate per round, the last ids are mostly found by sampling the remaining ids,
+            # right away without rounds of sampling from the whole id space
+            for rounds in (0, lab_channel.BaseChannel.JOIN_ROUNDS):
+                with self.subTest(n_bits=n_bits, rounds=rounds), \
+                        mock.patch.object(lab_channel.BaseChannel, 'JOIN_CANDIDATES', 1), \
+                        mock.patch.object(lab_channel.BaseChannel, 'JOIN_ROUNDS', rounds):
+                    self.store().flushall()
+                    pids = [self.member(n_bits=n_bits)[1] for _ in range(2 ** n_bits)]
+                    self.assertEqual(sorted(pids, key=int), [str(i) for i in range(2 ** n_bits)])
+                    with self.assertRaisesRegex(AssertionError, 'no free member id'):
+                        self.member(n_bits=n_bits)
+
+    def test_fifo_per_sender(self):
+        """Test that messages of each sender arrive in order, also when receiving from one sender only."""
+        (a, pid_a), (b, pid_b), (c, pid_c) = self.member(), self.member(), self.member()
+        for i in range(5):
+            a.send_to({pid_c}, ('a', i))
+        b.send_to({pid_c}, ('b', 0))
+        b.send_to({pid_c}, ('b', 1))
+        self.assertEqual([c.receive_from({pid_b}, timeout=1) for _ in range(2)], [(pid_b, ('b', 0)), (pid_b, ('b', 1))])
+        self.assertEqual([c.receive_from({pid_a}, timeout=1) for _ in range(5)], [(pid_a, ('a', i)) for i in range(5)])
+
+    def test_receive_any_and_many(self):
+        """Test receive_from_any, receive_many and receive_from_many."""
+        (a, pid_a), (b, pid_b), (c, pid_c) = self.member(), self.member(), self.member()
+        for i in range(10):
+            a.send_to({pid_c}, i)
+        b.send_to({pid_c}, 'b')
+        self.assertEqual(c.receive_from_many({pid_b}, 5, timeout=1), [(pid_b, 'b')])
+        self.assertEqual(c.receive_from_any(timeout=1), (pid_a, 0))
+        self.assertEqual(c.receive_many(5, timeout=1), [(pid_a, i) for i in range(1, 6)])
+        self.assertEqual(c.receive_from_many({pid_a}, 10, timeout=1), [(pid_a, i) for i in range(6, 10)])
+
+    def test_multicast_and_broadcast(self):
+        """Test that multicasts reach all destinations and broadcasts all members (including the sender)."""
+        (a, pid_a), (b, pid_b), (c, pid_c) = self.member(), self.member(), self.member()
+        a.send_to({pid_b, pid_c}, 'multicast')
+        a.send_to_all('broadcast')
+        for chan in (b, c):
+            self.assertEqual(chan.receive_many(5, timeout=1), [(pid_a, 'multicast'), (pid_a, 'broadcast')])
+        self.assertEqual(a.receive_from_any(timeout=1), (pid_a, 'broadcast'))
+
+    def test_priority(self):
+        """Test that HIGH priority messages overtake queued NORMAL ones."""
+        (a, pid_a), (b, pid_b) = self.member(), self.member()
+        for message in ('n1', 'n2'):
+            a.send_to({pid_b}, message)
+        a.send_to({pid_b}, 'h1', lab_channel.BaseChannel.HIGH)
+        a.send_to_all('h2', lab_channel.BaseChannel.HIGH)
+        self.assertEqual(b.receive_from({pid_a}, timeout=1), (pid_a, 'h1'))
+        self.assertEqual(b.receive_many(5, timeout=1), [(pid_a, 'h2'), (pid_a, 'n1'), (pid_a, 'n2')])
+
+    def test_overflow_fail(self):
+        """Test that sends to a full queue fail and multicasts then reach no destination at all."""
+        (a, pid_a), (b, pid_b), (c, pid_c) = (self.member(capacity=2, overflow=lab_channel.BaseChannel.FAIL),
+                                              self.member(), self.member())
+        a.send_to({pid_b}, 1)
+        a.send_to({pid_b}, 2)
+        with self.assertRaisesRegex(AssertionError, 'queue full'):
+            a.send_to({pid_b}, 3)
+        with self.assertRaisesRegex(AssertionError, 'queue full'):
+            a.send_to({pid_b, pid_c}, 'multicast')
+        a.send_to({pid_c}, 'next')
+        self.assertEqual(c.receive_from({pid_a}, timeout=1), (pid_a, 'next'))
+        self.assertEqual(b.receive_many(5, timeout=1), [(pid_a, 1), (pid_a, 2)])
+
+    def test_overflow_drop(self):
+        """Test that sends to a full queue drop the oldest messages."""
+        (a, pid_a), (b, pid_b) = self.member(capacity=2, overflow=lab_channel.BaseChannel.DROP), self.member()
+        for i in range(5):
+            a.send_to({pid_b}, i)
+        self.assertEqual(b.receive_many(5, timeout=1), [(pid_a, 3), (pid_a, 4)])
+
+    def test_overflow_block(self):
+        """Test that sends to a full queue wait until the receiver catches up."""
+        (a, pid_a), (b, pid_b) = self.member(capacity=1), self.member()
+        a.send_to({pid_b}, 1)
+        sender = threading.Thread(target=a.send_to, args=({pid_b}, 2))
+        sender.start()
+        sender.join(0.3)
+        self.assertTrue(sender.is_alive(), 'Expected the send to block on the full queue.')
+        self.assertEqual(b.receive_from({pid_a}, timeout=1), (pid_a, 1))
+        sender.join(2)
+        self.assertFalse(sender.is_alive())
+        self.assertEqual(b.receive_from({pid_a}, timeout=1), (pid_a, 2))
+
+    def test_queue_ttl_renewed_by_receives(self):
+        """Test that a queue does not expire while its receiver keeps taking messages off it."""
+        (a, pid_a), (b, pid_b) = self.member(queue_ttl=1), self.member(queue_ttl=1)
+        for i in range(3):
+            a.send_to({pid_b}, i)
+        time.sleep(0.6)
+        self.assertEqual(b.receive_from({pid_a}, timeout=1), (pid_a, 0))
+        time.sleep(0.6)
+        self.assertEqual(b.receive_many(1, timeout=1), [(pid_a, 1)])
+        time.sleep(0.6)
+        self.assertEqual(b.receive_from_any(timeout=1), (pid_a, 2))
+
+    def test_batching(self):
+        """Test that batched messages arrive in order, on a full batch, flush and after batch_delay."""
+        (a, pid_a), (b, pid_b), (c, pid_c) = self.member(batch_size=3, batch_delay=60), self.member(), self.member()
+        for i in range(7):
+            a.send_to({pid_b}, i)
+        a.send_to({pid_b, pid_c}, 'multicast')
+        self.assertEqual(b.receive_many(10, timeout=1), [(pid_a, i) for i in range(6)])
+        a.flush()
+        self.assertEqual([b.receive_from({pid_a}, timeout=1) for _ in range(2)], [(pid_a, 6), (pid_a, 'multicast')])
+        self.assertEqual(c.receive_from_any(timeout=1), (pid_a, 'multicast'))
+        (d, pid_d) = self.member(batch_size=3, batch_delay=0.05)
+        d.send_to({pid_b}, 'delayed')
+        self.assertEqual(b.receive_from({pid_d}, timeout=2), (pid_d, 'delayed'))
+
+    def test_batch_flush_keeps_other_receivers(self):
+        """Test that a receiver leaving before the flush only loses its own messages."""
+        (a, pid_a), (b, pid_b), (c, pid_c) = self.member(batch_size=10, batch_delay=60), self.member(), self.member()
+        with self.assertRaises(AssertionError):
+            a.send_to({'unknown'}, 'to nobody')
+        a.send_to({pid_c}, 'to c')
+        a.send_to({pid_b}, 'to b')
+        c.leave('node')
+        with self.assertRaisesRegex(AssertionError, pid_c):
+            a.flush()
+        self.assertEqual(b.receive_from({pid_a}, timeout=1), (pid_a, 'to b'))
+
+    def test_failed_timer_flush_raises_on_next_send(self):
+        """Test that an error of a background flush reaches the sender."""
+        (a, pid_a), (b, pid_b), (c, pid_c) = self.member(batch_size=10, batch_delay=0.05), self.member(), self.member()
+        a.send_to({pid_c}, 'to c')
+        a.send_to({pid_b}, 'to b')
+        c.leave('node')
+        self.assertEqual(b.receive_from({pid_a}, timeout=2), (pid_a, 'to b'))
+        with self.assertRaisesRegex(AssertionError, pid_c):
+            a.send_to({pid_b}, 'next')
+        a.send_to({pid_b}, 'next')
+        a.flush()
+        self.assertEqual(b.receive_from({pid_a}, timeout=1), (pid_a, 'next'))
+
+    def test_codecs(self):
+        """Test that members using different codecs understand each other."""
+        codecs = [lab_codec.Pickle5Codec(), lab_codec.Compressed(threshold=16), lab_codec.PickleCodec(protocol=2)]
+        if lab_codec.msgpack is not None:
+            codecs.append(lab_codec.MsgpackCodec())
+        receiver, pid = self.member()
+        for codec in codecs:
+            chan, sender = self.member(codec=codec)
+            message = ('payload', 'x' * 100, 42)
+            chan.send_to({pid}, message)
+            self.assertEqual(receiver.receive_from({sender}, timeout=1), (sender, message), type(codec).__name__)
+            receiver.send_to({sender}, message)
+            self.assertEqual(chan.receive_from({pid}, timeout=1), (pid, message), type(codec).__name__)
+
+    def test_unknown_members(self):
+        """Test that sends and receives involving unknown members fail."""
+        a, _ = self.member()
+        with self.assertRaisesRegex(AssertionError, 'unknown receiver'):
+            a.send_to({'unknown'}, 'to nobody')
+        with self.assertRaisesRegex(AssertionError, 'unknown sender'):
+            a.receive_from({'unknown'}, timeout=1)
+
+
+class TestRedisChannel(ChannelScenarios, FakeRedisTestCase):
+    pass
+
+
+class TestRedisInboxChannel(ChannelScenarios, FakeRedisTestCase):
+    inbox = True
+
+
+class TestMemoryChannel(ChannelScenarios, ChannelTestCase):
+    backend = 'memory'
+
+
+class TestMemoryInboxChannel(ChannelScenarios, ChannelTestCase):
+    backend = 'memory'
+    inbox = True
+
+
+class TestLocalChannel(ChannelScenarios, ChannelTestCase):
+    backend = 'local'
+
+
+class TestLocalInboxChannel(ChannelScenarios, ChannelTestCase):
+    backend = 'local'
+    inbox = True
+
+
+class TestAsyncChannel(FakeRedisTestCase, unittest.IsolatedAsyncioTestCase):
+    """AsyncChannel members on fake redis servers, talking to each other and to Channel members"""
+
+    def setUp(self):
+        super().setUp()
+
+        def strict_redis(host='localhost', port=6379, db=0):
+            server = self.servers.setdefault((host, port), fakeredis.FakeServer())
+            return fakeredis.FakeAsyncRedis(server=server)
+
+        patcher = mock.patch.object(lab_channel.redis.asyncio, 'StrictRedis', strict_redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def async_member(self, subgroup='node', **options):
+        """Create an async channel, join it and bind the member id"""
+        chan = lab_channel.AsyncChannel(inbox=self.inbox, **options)
+        self.addAsyncCleanup(chan.close)
+        pid = await chan.join(subgroup)
+        chan.bind(pid)
+        return chan, pid
+
+    async def test_send_and_receive(self):
+        """Test sends and receives between async members, also with several receives pending at once."""
+        (a, pid_a), (b, pid_b), (c, pid_c) = [await self.async_member() for _ in range(3)]
+        await a.send_to({pid_c}, 'from a')
+        self.assertEqual(await c.receive_from({pid_a}, timeout=1), (pid_a, 'from a'))
+        pending = [asyncio.ensure_future(c.receive_from({sender}, timeout=2)) for sender in (pid_a, pid_b)]
+        await asyncio.sleep(0.1)
+        await b.send_to({pid_c}, 'from b')
+        await a.send_to({pid_c}, 'from a')
+        self.assertEqual(await asyncio.gather(*pending), [(pid_a, 'from a'), (pid_b, 'from b')])
+        await a.send_to_all('all', lab_channel.BaseChannel.HIGH)
+        self.assertEqual(await b.receive_from_any(timeout=1), (pid_a, 'all'))
+
+    async def test_interop_with_channel(self):
+        """Test that async and blocking members exchange messages in both directions."""
+        (chan, pid), (sync, sync_pid) = await self.async_member(), self.member()
+        await chan.send_to({sync_pid}, ('async', 1))
+        self.assertEqual(sync.receive_from({pid}, timeout=1), (pid, ('async', 1)))
+        sync.send_to({pid}, ('sync', 2))
+        sync.send_to_all(('sync', 'all'))
+        self.assertEqual(await chan.receive_from({sync_pid}, timeout=1), (sync_pid, ('sync', 2)))
+        self.assertEqual(await chan.receive_from_any(timeout=1), (sync_pid, ('sync', 'all')))
+        self.assertEqual(await chan.subgroup('node'), {pid, sync_pid})
+        await chan.leave('node')
+        self.assertFalse(sync.exists(pid))
+
+    async def test_receive_timeout(self):
+        """Test that receives return None after their timeout and fail for unknown members."""
+        (a, _), (_, pid_b) = await self.async_member(), await self.async_member()
+        start = time.time()
+        self.assertIsNone(await a.receive_from({pid_b}, timeout=1))
+        self.assertIsNone(await a.receive_from_any(timeout=1))
+        self.assertGreaterEqual(time.time() - start, 1.5)
+        with self.assertRaisesRegex(AssertionError, 'unknown sender'):
+            await a.receive_from({'unknown'}, timeout=1)
+        with self.assertRaisesRegex(AssertionError, 'unknown receiver'):
+            await a.send_to({'unknown'}, 'to nobody')
+
+    async def test_join_fills_small_id_space(self):
+        """Test that async joins find the last free ids by sampling the remaining ids and then fail."""
+        with mock.patch.object(lab_channel.BaseChannel, 'JOIN_CANDIDATES', 1), \
+                mock.patch.object(lab_channel.BaseChannel, 'JOIN_ROUNDS', 0):
+            pids = [(await self.async_member(n_bits=2))[1] for _ in range(4)]
+            self.assertEqual(sorted(pids), ['0', '1', '2', '3'])
+            with self.assertRaisesRegex(AssertionError, 'no free member id'):
+                await self.async_member(n_bits=2)
+
+
+class TestAsyncInboxChannel(TestAsyncChannel):
+    inbox = True
+
+
+class TestMemberCache(FakeRedisTestCase):
+
+    def cached_member(self, subgroup='node'):
+        """Create a member caching the member sets"""
+        chan, pid = self.member(subgroup, cache_members=True)
+        self.addCleanup(chan.cache.close)
+        # let the cache see its own join first
+        self.wait_for(lambda: chan.cache.version > 0)
+        return chan, pid
+
+    def wait_for(self, condition, timeout=3):
+        """Poll until condition() holds (the cache is invalidated by a background thread)"""
+        deadline = time.time() + timeout
+        while not condition():
+            self.assertLess(time.time(), deadline, 'Expected the condition to hold in time.')
+            time.sleep(0.01)
+
+    def test_invalidation_on_join_and_leave(self):
+        """Test that joins and leaves of other members drop the affected cached sets."""
+        a, pid_a = self.cached_member('server')
+        self.assertEqual((a.cache.members(), a.cache.members('server')), ({pid_a}, {pid_a}))
+        b, pid_b = self.member('client')
+        self.wait_for(lambda: 'members' not in a.cache.sets)
+        self.assertIn('server', a.cache.sets, 'Expected other subgroups to stay cached.')
+        self.assertEqual((a.cache.members(), a.cache.members('client')), ({pid_a, pid_b}, {pid_b}))
+        b.leave('client')
+        self.wait_for(lambda: 'client' not in a.cache.sets)
+        self.assertEqual((a.subgroup('client'), a.cache.members()), (set(), {pid_a}))
+
+    def test_unknown_members(self):
+        """Test that cached members still fail for unknown members and find members the cache missed."""
+        a, pid_a = self.cached_member()
+        a.cache.members()
+        with self.assertRaisesRegex(AssertionError, 'unknown receiver'):
+            a.send_to({'unknown'}, 'to nobody')
+        with self.assertRaisesRegex(AssertionError, 'unknown sender'):
+            a.receive_from({'unknown'}, timeout=1)
+        # a member whose join is not announced yet is looked up in redis
+        b, pid_b = self.member()
+        a.cache.sets['members'] = {pid_a}
+        a.send_to({pid_b}, 'hello')
+        self.assertEqual(b.receive_from({pid_a}, timeout=1), (pid_a, 'hello'))
+
+    def test_receive_from_any_sees_new_members(self):
+        """Test that a blocked receive_from_any picks up a member joining after the cache was filled."""
+        a, pid_a = self.cached_member()
+        results = []
+        receiver = threading.Thread(target=lambda: results.append(a.receive_from_any(timeout=5)))
+        receiver.start()
+        time.sleep(0.2)
+        b, pid_b = self.member()
+        b.send_to({pid_a}, 'late')
+        receiver.join(5)
+        self.assertEqual(results, [(pid_b, 'late')])
+
+
+class TestChannelMetrics(FakeRedisTestCase):
+
+    def test_stats_match_traffic(self):
+        """Test that counters and latencies of stats() match the messages sent and received."""
+        (a, pid_a), (b, pid_b) = [self.member(metrics=lab_metrics.ChannelMetrics()) for _ in range(2)]
+        messages = ['hello', 42, {'nested': [1, 2.5, None]}]
+        # every message carries the 'T' frame: tag and send time ahead of the pickled message
+        size = sum(9 + len(lab_codec.PickleCodec().encode(message)) for message in messages)
+        for message in messages:
+            a.send_to({pid_b}, message)
+        received = [b.receive_from({pid_a}, timeout=1) for _ in messages]
+        self.assertEqual(received, [(pid_a, message) for message in messages])
+
+        sent, got = a.stats(), b.stats()
+        self.assertEqual(sent['sent'], {pid_a: {pid_b: {'messages': 3, 'bytes': size}}})
+        self.assertEqual(got['received'], {pid_b: {pid_a: {'messages': 3, 'bytes': size}}})
+        self.assertEqual((sent['received'], got['sent']), ({}, {}))
+        self.assertEqual(got['latency']['count'], 3)
+        self.assertTrue(0 <= got['latency']['min'] <= got['latency']['max'] < 1)
+        self.assertEqual(got['blocked']['count'], 3)
+        self.assertEqual(sent['latency']['count'], 0)
+        self.assertEqual((sent['operations']['send_to']['calls'], got['operations']['receive_from']['calls']), (3, 3))
+        # one script call per send, plus loading the script (failed evalsha and script load) on the first
+        self.assertEqual(sent['operations']['send_to']['round_trips'], 3 + 2)
+
+        # broadcasts count once for all receivers
+        a.send_to_all('all')
+        self.assertEqual(b.receive_from_any(timeout=1), (pid_a, 'all'))
+        broadcast = 9 + len(lab_codec.PickleCodec().encode('all'))
+        self.assertEqual(a.stats()['sent'][pid_a]['*'], {'messages': 1, 'bytes': broadcast})
+        self.assertEqual(b.stats()['received'][pid_b][pid_a], {'messages': 4, 'bytes': size + broadcast})
+
+    def test_timestamp_removed_without_metrics(self):
+        """Test that members without metrics decode timestamped messages of members with metrics."""
+        a, pid_a = self.member(metrics=lab_metrics.ChannelMetrics())
+        b, pid_b = self.member()
+        self.assertIsNone(b.stats())
+        a.send_to({pid_b}, ('tuple', b'bytes'))
+        self.assertEqual(b.receive_from({pid_a}, timeout=1), (pid_a, ('tuple', b'bytes')))
+        b.send_to({pid_a}, 'plain')
+        self.assertEqual(a.receive_from({pid_b}, timeout=1), (pid_b, 'plain'))
+        # untimestamped messages are counted but leave the latency alone
+        self.assertEqual(a.stats()['received'][pid_a][pid_b]['messages'], 1)
+        self.assertEqual(a.stats()['latency']['count'], 0)
+
+
+class TestShards(FakeRedisTestCase):
+
+    def test_single_shard_apart_from_primary(self):
+        """Test that queues go to the only shard if it is not the primary instance."""
+        (a, pid_a), (b, pid_b) = [self.member(shards=[('shard', 7000)]) for _ in range(2)]
+        a.send_to({pid_b}, 'hello')
+        self.assertEqual(b.receive_from({pid_a}, timeout=1), (pid_a, 'hello'))
+        b.send_to_all('all')
+        self.assertEqual(a.receive_from_any(timeout=1), (pid_b, 'all'))
+        self.assertEqual(b.receive_from_any(timeout=1), (pid_b, 'all'))
+        # the primary only holds membership data
+        self.assertEqual({key.decode() for key in self.store().keys('*')}, {'members', 'node', 'xchan'})
+        a.send_to({pid_b}, 'orphan')
+        b.leave('node')
+        self.assertEqual(self.store('shard', 7000).keys('*'), [])
+
+    def test_two_shards(self):
+        """Test that every receiver gets its messages from its own shard."""
+        shards = [('shard', 7000), ('shard', 7001)]
+        members = [self.member(shards=shards) for _ in range(6)]
+        (sender, pid), receivers = members[0], members[1:]
+        sender.send_to({other for _, other in receivers}, 'multicast')
+        for chan, other in receivers:
+            self.assertEqual(chan.receive_from({pid}, timeout=1), (pid, 'multicast'))
+        self.assertTrue(all(self.store(*shard).keys('*') == [] for shard in shards))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,216 @@
+"""
+Message codecs for lab_channel.
+
+A codec turns message objects into bytes and back. Every encoded message starts with the tag
+of its codec, so a receiver can decode messages of any registered codec, no matter which codec
+it uses for sending itself. Members of one channel may therefore use different codecs.
+
+Codecs:
+
+PickleCodec (tag 0x80)
+    Plain pickle. The tag is the first byte of every pickle stream (protocol 2 and higher),
+    so messages are identical to those of channels without codec support.
+Pickle5Codec (tag 'P')
+    Pickle protocol 5 with out-of-band buffers. Large buffers (bytearray, PickleBuffer,
+    numpy arrays, ...) are copied into the message once instead of being copied into the
+    pickle stream first. Decoding passes slices of the received message as buffers.
+    Frame: 'P' | pickle length (4 bytes) | pickle stream | (buffer length (8 bytes) | buffer)*
+MsgpackCodec (tag 'M')
+    Compact encoding for small messages made of numbers, strings, bytes and tuples, like the
+    (clock, pid, TYPE) messages of the mutex lab. Arrays are decoded as tuples.
+    Requires the optional msgpack package.
+Compressed (tag 'Z')
+    Wraps another codec and zlib-compresses encodings above a size threshold.
+    Frame: 'Z' | compressed encoding of the inner codec
+Timestamped (tag 'T')
+    Wraps another codec and prepends the send time (used by channel metrics for delivery latency).
+    Frame: 'T' | time.time() as double (8 bytes) | encoding of the inner codec
+
+Batches of encoded messages (tag 'B', see batch and split) carry several messages in one queue element.
+    Frame: 'B' | (encoding length (4 bytes) | encoding)*
+"""
+
+import pickle
+import struct
+import time
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional
+    msgpack = None
+
+
+class PickleCodec:
+    """Plain pickle with the default protocol (the classic channel message format)."""
+
+    tag = b'\x80'
+
+    def __init__(self, protocol: int = pickle.DEFAULT_PROTOCOL):
+        assert protocol >= 2, 'pickle protocol 2 or higher required'
+        self.protocol: int = protocol
+
+    def encode(self, message: object) -> bytes:
+        return pickle.dumps(message, protocol=self.protocol)
+
+    @staticmethod
+    def decode(data: memoryview) -> object:
+        # the tag is part of the pickle stream
+        return pickle.loads(data)
+
+
+class Pickle5Codec:
+    """Pickle protocol 5 with out-of-band buffers."""
+
+    tag = b'P'
+
+    @staticmethod
+    def encode(message: object) -> bytearray:
+        buffers: list = []
+        data: bytes = pickle.dumps(message, protocol=5, buffer_callback=buffers.append)
+        frame = bytearray(Pickle5Codec.tag)
+        frame += struct.pack('!I', len(data))
+        frame += data
+        for buffer in buffers:
+            raw = buffer.raw()
+            frame += struct.pack('!Q', raw.nbytes)
+            frame += raw
+        # redis accepts the bytearray as is, so buffers are not copied again
+        return frame
+
+    @staticmethod
+    def decode(data: memoryview) -> object:
+        (length,) = struct.unpack_from('!I', data, 1)
+        stream: memoryview = data[5:5 + length]
+        # slice out-of-band buffers without copying
+        buffers: list = []
+        offset: int = 5 + length
+        while offset < len(data):
+            (size,) = struct.unpack_from('!Q', data, offset)
+            buffers.append(data[offset + 8:offset + 8 + size])
+            offset += 8 + size
+        return pickle.loads(stream, buffers=buffers)
+
+
+class MsgpackCodec:
+    """msgpack for small messages of plain values and tuples."""
+
+    tag = b'M'
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError('MsgpackCodec requires the msgpack package')
+
+    def encode(self, message: object) -> bytes:
+        return self.tag + msgpack.packb(message, use_bin_type=True)
+
+    @staticmethod
+    def decode(data: memoryview) -> object:
+        return msgpack.unpackb(data[1:], raw=False, use_list=False)
+
+
+class Compressed:
+    """Compress encodings of another codec above a size threshold."""
+
+    tag = b'Z'
+
+    def __init__(self, codec=None, threshold: int = 1024, level: int = 1):
+        """
+        :param codec: inner codec (default: PickleCodec)
+        :param threshold: minimum encoding size in bytes for compression
+        :param level: zlib compression level
+        """
+        self.codec = codec if codec is not None else PickleCodec()
+        self.threshold: int = threshold
+        self.level: int = level
+
+    def encode(self, message: object) -> bytes:
+        data = self.codec.encode(message)
+        if len(data) < self.threshold:
+            return data
+        return self.tag + zlib.compress(data, self.level)
+
+    @staticmethod
+    def decode(data: memoryview) -> object:
+        return decode(zlib.decompress(data[1:]))
+
+
+class Timestamped:
+    """Prepend the send time to encodings of another codec."""
+
+    tag = b'T'
+
+    def __init__(self, codec=None):
+        """
+        :param codec: inner codec (default: PickleCodec)
+        """
+        self.codec = codec if codec is not None else PickleCodec()
+
+    def encode(self, message: object) -> bytes:
+        return self.tag + struct.pack('!d', time.time()) + self.codec.encode(message)
+
+    @staticmethod
+    def decode(data: memoryview) -> object:
+        return decode(data[9:])
+
+
+# registered codecs by tag
+CODECS = {codec.tag: codec for codec in (PickleCodec, Pickle5Codec, MsgpackCodec, Compressed, Timestamped)}
+
+
+# tag of message batches
+BATCH_TAG = b'B'
+
+
+def batch(encodings: list) -> bytes:
+    """
+    Frame encoded messages as one batch.
+    :param encodings: encoded messages
+    :return: batch frame
+    """
+    frame = bytearray(BATCH_TAG)
+    for encoding in encodings:
+        frame += struct.pack('!I', len(encoding))
+        frame += encoding
+    return bytes(frame)
+
+
+def split(data: bytes) -> list:
+    """
+    Split a batch into its encoded messages (without copying).
+    :param data: batch frame or single encoded message
+    :return: list of encoded messages
+    """
+    view = memoryview(data)
+    if bytes(view[:1]) != BATCH_TAG:
+        return [view]
+    encodings: list = []
+    offset: int = 1
+    while offset < len(view):
+        (length,) = struct.unpack_from('!I', view, offset)
+        encodings.append(view[offset + 4:offset + 4 + length])
+        offset += 4 + length
+    return encodings
+
+
+def sent_at(data: bytes):
+    """
+    Get the send time of a Timestamped message.
+    :param data: encoded message
+    :return: send time (seconds since the epoch) or None if the message carries no timestamp
+    """
+    if data[:1] != Timestamped.tag:
+        return None
+    return struct.unpack_from('!d', data, 1)[0]
+
+
+def decode(data: bytes) -> object:
+    """
+    Decode a message encoded by any registered codec.
+    :param data: encoded message
+    :return: message object
+    """
+    view = memoryview(data)
+    codec = CODECS.get(bytes(view[:1]))
+    assert codec is not None, 'unknown codec tag'
+    return codec.decode(view)
@@ -0,0 +1,189 @@
+"""
+Message dispatcher for lab_channel.
+
+A Dispatcher replaces the usual 'while True: receive_from_any()' loop of a channel member.
+Handlers are registered per message type and run on a pool of workers, so a slow handler only
+delays further messages of the same sender, while messages of other senders are processed
+concurrently. Messages of one sender are handled one after another in arrival order.
+
+The type of a message is its first element for tuple and list messages (e.g. (LOOKUP_REQ, key, ...)),
+otherwise the message itself. A different mapping can be passed as type_of.
+A handler is called with sender id and message. If it returns a value other than None,
+the value is sent back to the sender as reply.
+
+    dispatcher = lab_dispatch.Dispatcher(chan, workers=8)
+
+    @dispatcher.handler(constRPC.APPEND)
+    def append(sender, request):
+        return request[2].append(request[1])
+
+    dispatcher.run()
+
+Workers are threads by default, which run in parallel while handlers wait for I/O (including
+the channel). For CPU-bound handlers, pass a concurrent.futures.ProcessPoolExecutor; handlers
+and messages then need to be picklable and replies are sent by the dispatcher process.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+
+def message_type(message: object):
+    """
+    Default mapping of messages to handler keys.
+    :param message: received message
+    :return: first element of tuple and list messages, else the message (None if unhashable)
+    """
+    if isinstance(message, (tuple, list)):
+        return message[0] if len(message) > 0 else None
+    try:
+        hash(message)
+    except TypeError:
+        return None
+    return message
+
+
+class Dispatcher:
+    """
+    Dispatches received channel messages to handlers on a worker pool, keeping FIFO order per sender.
+    """
+
+    def __init__(self, channel, workers: int = None, executor: Executor = None, type_of=message_type,
+                 max_pending: int = 1000, max_count: int = 64, timeout: int = 1):
+        """
+        :param channel: joined and bound lab_channel.Channel
+        :param workers: number of worker threads (default: ThreadPoolExecutor default)
+        :param executor: executor running the handlers (replaces the worker threads)
+        :param type_of: function mapping messages to handler keys
+        :param max_pending: maximum number of received but unfinished messages (then receiving pauses)
+        :param max_count: maximum number of messages taken off the channel at once
+        :param timeout: seconds a receive blocks before checking for stop()
+        """
+        self.channel = channel
+        self.executor: Executor = executor if executor is not None else ThreadPoolExecutor(max_workers=workers)
+        self.type_of = type_of
+        self.max_count: int = max_count
+        self.timeout: int = timeout
+        # handlers by message type and the handler for all other messages
+        self.handlers = {}
+        self.default = None
+        # messages waiting for an earlier message of the same sender, by sender (present while one is handled)
+        self.pending = {}
+        self.lock = threading.Lock()
+        # bounds the number of messages in the dispatcher
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.running: bool = False
+        self.logger = logging.getLogger('vs2lab.dispatch.Dispatcher')
+
+    def register(self, msg_type, handler) -> None:
+        """
+        Register the handler of a message type.
+        :param msg_type: message type (see type_of), None for all messages without a handler
+        :param handler: function called with sender id and message, returning a reply or None
+        :return: None
+        """
+        if msg_type is None:
+            self.default = handler
+        else:
+            self.handlers[msg_type] = handler
+
+    def handler(self, msg_type=None):
+        """
+        Decorator registering the handler of a message type (see register).
+        """
+        def decorator(function):
+            self.register(msg_type, function)
+            return function
+        return decorator
+
+    def dispatch(self, sender: str, message: object) -> None:
+        """
+        Hand a message to its handler, after all earlier messages of the same sender.
+        :param sender: member id of the sender
+        :param message: received message
+        :return: None
+        """
+        self.slots.acquire()
+        with self.lock:
+            queue = self.pending.get(sender)
+            if queue is not None:
+                # an earlier message of the sender is being handled
+                queue.append(message)
+                return
+            self.pending[sender] = deque([message])
+        self.__next(sender)
+
+    def __next(self, sender: str) -> None:
+        """
+        Submit the next message of a sender (if any) to the workers.
+        :param sender: member id of the sender
+        :return: None
+        """
+        while True:
+            with self.lock:
+                queue = self.pending[sender]
+                if len(queue) == 0:
+                    del self.pending[sender]
+                    return
+                message = queue[0]
+            handler = self.handlers.get(self.type_of(message), self.default)
+            if handler is not None:
+                future = self.executor.submit(handler, sender, message)
+                future.add_done_callback(lambda done: self.__done(sender, done))
+                return
+            self.logger.warning("No handler for message %s from %s.", message, sender)
+            self.__finish(sender)
+
+    def __finish(self, sender: str) -> None:
+        with self.lock:
+            self.pending[sender].popleft()
+        self.slots.release()
+
+    def __done(self, sender: str, future) -> None:
+        """
+        Send the reply of a finished handler and continue with the next message of the sender.
+        """
+        reply = None
+        try:
+            reply = future.result()
+        except Exception:
+            self.logger.exception("Handling a message from %s failed.", sender)
+        try:
+            if reply is not None:
+                self.channel.send_to({sender}, reply)
+        except AssertionError:
+            self.logger.warning("Sender %s has already left the channel.", sender)
+        except Exception:
+            self.logger.exception("Replying to %s failed.", sender)
+        finally:
+            # a failed reply must not hold up further messages of the sender
+            self.__finish(sender)
+            self.__next(sender)
+
+    def run(self) -> None:
+        """
+        Receive and dispatch messages until stop() is called.
+        Returns after all received messages are handled and the workers are shut down.
+        :return: None
+        """
+        self.running = True
+        while self.running:
+            for sender, message in self.channel.receive_many(self.max_count, self.timeout):
+                self.dispatch(sender, message)
+        # handlers submit the next message of their sender, so wait until no sender has messages left
+        while True:
+            with self.lock:
+                if len(self.pending) == 0:
+                    break
+            time.sleep(0.01)
+        self.executor.shutdown()
+
+    def stop(self) -> None:
+        """
+        Stop run() after the current receive (at most timeout seconds).
+        :return: None
+        """
+        self.running = False
@@ -0,0 +1,36 @@
+"""
+Dispatcher unit tests
+"""
+
+import threading
+import unittest
+
+from lib import lab_channel, lab_dispatch, lab_store
+
+
+class TestDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        lab_store.connect('memory').flushall()
+        self.server, self.client = lab_channel.Channel(backend='memory'), lab_channel.Channel(backend='memory')
+        self.server.bind(self.server.join('server'))
+        self.client_id = self.client.join('client')
+        self.client.bind(self.client_id)
+        self.dispatcher = lab_dispatch.Dispatcher(self.server, workers=2, timeout=0.1)
+        self.thread = threading.Thread(target=self.dispatcher.run)
+        self.thread.start()
+        self.addCleanup(self.thread.join)
+        self.addCleanup(self.dispatcher.stop)
+
+    def test_failed_reply_continues_with_next_message(self):
+        """Test that a reply the channel cannot send does not stop the messages of its sender."""
+        @self.dispatcher.handler('echo')
+        def echo(sender, message):
+            # a function as reply cannot be pickled
+            return message[1] if message[1] != 'function' else (lambda: None)
+
+        server_id = self.server.subgroup('server').pop()
+        with self.assertLogs('vs2lab.dispatch.Dispatcher', 'ERROR'):
+            self.client.send_to({server_id}, ('echo', 'function'))
+            self.client.send_to({server_id}, ('echo', 'next'))
+            self.assertEqual(self.client.receive_from({server_id}, timeout=2), (server_id, 'next'))
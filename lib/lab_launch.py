@@ -0,0 +1,219 @@
+"""
+Launcher for the multi-process lab runners (chord, mutex, 2pc).
+
+Each node runs create_and_run in a process of its own: it creates a channel and its node object
+(which joins the channel), waits until all nodes have joined, bootstraps (e.g. enter or init),
+waits until all nodes have bootstrapped and finally runs.
+
+    launcher = lab_launch.Launcher(num_bits=6)
+    launcher.add('ChordNode-{}', chord_node.ChordNode, count=8, init='enter')
+    client = launcher.add('ChordClient', DummyChordClient, init='enter')
+    launcher.start()
+    launcher.join(client)
+    launcher.join()
+
+Processes are started by a forkserver (where available, 'spawn' otherwise). The forkserver imports
+redis, the channel, the main module and the modules of the node classes once; every node is then
+forked from it with all modules loaded, instead of re-importing them like spawned processes do.
+Nodes are started in batches: the next batch starts once all nodes of the current one have joined
+the channel, so large groups do not flood the store with joins at once.
+
+start() returns when all nodes run and logs a report of the launch time: for every phase
+(started, joined, entered, running) the time from start() until the last node reached it.
+"""
+
+import logging
+import multiprocessing
+import queue
+import time
+
+from . import lab_channel
+
+# launch phases reported by the nodes, in order
+STARTED = 'started'
+JOINED = 'joined'
+ENTERED = 'entered'
+RUNNING = 'running'
+PHASES = (STARTED, JOINED, ENTERED, RUNNING)
+
+# modules imported by the forkserver in any case
+PRELOAD = ['redis', 'lib.lab_channel', 'lib.lab_logging', '__main__']
+
+logger = logging.getLogger('vs2lab.launch')
+
+
+def create_and_run(num_bits, node_class, enter_bar, run_bar, init='init', init_args=(),
+                   channel_options=None, events=None, name=None):
+    """
+    Create and run a node
+    :param num_bits: address range of the channel
+    :param node_class: class of node (joins the channel when created)
+    :param enter_bar: barrier syncing channel population
+    :param run_bar: barrier syncing bootstrap
+    :param init: name of the bootstrap method of the node
+    :param init_args: arguments of the bootstrap method
+    :param channel_options: further keyword arguments of the channel
+    :param events: queue receiving (name, phase, time) launch events (optional)
+    :param name: node name in launch events
+    """
+    def reached(phase):
+        if events is not None:
+            events.put((name, phase, time.time()))
+
+    reached(STARTED)
+    chan = lab_channel.Channel(n_bits=num_bits, **(channel_options or {}))
+    node = node_class(chan)
+    reached(JOINED)
+    enter_bar.wait()  # wait for all nodes to join the channel
+    getattr(node, init)(*init_args)  # do some bootstrapping
+    reached(ENTERED)
+    run_bar.wait()  # wait for all nodes to finish bootstrapping
+    reached(RUNNING)
+    result = node.run()  # start operating
+    if result is not None:
+        logger.info(result)  # log outcome
+
+
+class Launcher:
+    """
+    Starts a group of nodes in separate processes.
+    """
+
+    def __init__(self, num_bits: int, start_method: str = None, batch_size: int = 16, preload: list = None,
+                 channel_options: dict = None):
+        """
+        :param num_bits: address range of the channel
+        :param start_method: multiprocessing start method (default: 'forkserver' where available, else 'spawn')
+        :param batch_size: number of nodes started at once
+        :param preload: further modules imported by the forkserver
+        :param channel_options: further keyword arguments of the node channels (e.g. backend)
+        """
+        if start_method is None:
+            available = multiprocessing.get_all_start_methods()
+            start_method = 'forkserver' if 'forkserver' in available else 'spawn'
+        self.start_method: str = start_method
+        self.context = multiprocessing.get_context(start_method)
+        self.num_bits: int = num_bits
+        self.batch_size: int = batch_size
+        self.preload: list = PRELOAD + (preload or [])
+        self.channel_options: dict = channel_options or {}
+        # nodes to start: (name, node class, bootstrap method, bootstrap arguments)
+        self.nodes: list = []
+        # processes by node name (once started)
+        self.processes = {}
+        self.events = None
+        # barriers of the launch phases (once started)
+        self.barriers: list = []
+        # launch events by phase and node name
+        self.reached = {phase: {} for phase in PHASES}
+        self.started_at = None
+
+    def add(self, name: str, node_class, count: int = 1, init: str = 'init', init_args: tuple = ()) -> list:
+        """
+        Add nodes to the group (before start).
+        :param name: process name ('{}' is replaced by the index of the node)
+        :param node_class: class of node
+        :param count: number of nodes
+        :param init: name of the bootstrap method of the nodes
+        :param init_args: arguments of the bootstrap method
+        :return: list of node names (keys of processes)
+        """
+        assert self.started_at is None, 'nodes have to be added before start'
+        if node_class.__module__ not in self.preload:
+            self.preload.append(node_class.__module__)
+        names: list = [name.format(i) for i in range(count)]
+        assert not any(name in self.processes for name in names), 'duplicate node name'
+        for node_name in names:
+            self.nodes.append((node_name, node_class, init, tuple(init_args)))
+            self.processes[node_name] = None
+        return names
+
+    def __await(self, phase: str, names: list) -> None:
+        """
+        Collect launch events until all named nodes reached a phase.
+        :param phase: launch phase
+        :param names: node names
+        :return: None
+        """
+        while not all(name in self.reached[phase] for name in names):
+            try:
+                name, reached, at = self.events.get(timeout=1)
+            except queue.Empty:
+                # a node that died before reaching the phase would block the launch forever
+                dead: list = [name for name in names
+                              if name not in self.reached[phase] and not self.processes[name].is_alive()]
+                if dead:
+                    logger.error("Nodes failed to launch: %s.", ", ".join(dead))
+                    self.__abort()
+                assert not dead, 'nodes failed to launch: ' + ', '.join(dead)
+                continue
+            self.reached[reached][name] = at
+
+    def __abort(self) -> None:
+        """
+        Stop a failed launch: release the nodes waiting at the barriers and end all started processes.
+        :return: None
+        """
+        for barrier in self.barriers:
+            barrier.abort()
+        started: list = [process for process in self.processes.values() if process is not None]
+        for process in started:
+            process.terminate()
+        for process in started:
+            process.join()
+
+    def start(self) -> dict:
+        """
+        Start all nodes in batches and wait until they run.
+        :return: launch report (see report)
+        """
+        if self.start_method == 'forkserver':
+            self.context.set_forkserver_preload(self.preload)
+        n: int = len(self.nodes)
+        enter_bar = self.context.Barrier(n)  # wait for channel population to complete
+        run_bar = self.context.Barrier(n)  # wait for bootstrapping to complete
+        self.barriers = [enter_bar, run_bar]
+        self.events = self.context.Queue()
+        self.started_at = time.time()
+        for first in range(0, n, self.batch_size):
+            batch: list = self.nodes[first:first + self.batch_size]
+            for name, node_class, init, init_args in batch:
+                process = self.context.Process(
+                    target=create_and_run,
+                    name=name,
+                    args=(self.num_bits, node_class, enter_bar, run_bar, init, init_args,
+                          self.channel_options, self.events, name))
+                self.processes[name] = process
+                process.start()
+            # let the batch join before starting the next one
+            self.__await(JOINED, [name for name, *_ in batch])
+        self.__await(RUNNING, [name for name, *_ in self.nodes])
+        report: dict = self.report()
+        logger.info("Launched %d nodes (%s) in %.3fs: %s.", n, self.start_method, report['phases'][RUNNING],
+                    ", ".join("{} {:.3f}s".format(phase, report['phases'][phase]) for phase in PHASES))
+        return report
+
+    def report(self) -> dict:
+        """
+        Summarize the launch times.
+        :return: dict of start method, number of nodes, batch size, and the seconds from start until
+                 all nodes reached each phase (phases) and per node (nodes)
+        """
+        return {'start_method': self.start_method,
+                'nodes': len(self.nodes),
+                'batch_size': self.batch_size,
+                'phases': {phase: max(at - self.started_at for at in self.reached[phase].values())
+                           for phase in PHASES if self.reached[phase]},
+                'per_node': {name: {phase: self.reached[phase][name] - self.started_at
+                                    for phase in PHASES if name in self.reached[phase]}
+                             for name, *_ in self.nodes}}
+
+    def join(self, names: list = None) -> None:
+        """
+        Wait for nodes to finish.
+        :param names: node names returned by add (default: all nodes)
+        :return: None
+        """
+        for name in names if names is not None else list(self.processes):
+            self.processes[name].join()
+
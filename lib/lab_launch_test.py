@@ -0,0 +1,44 @@
+"""
+Launcher unit tests
+"""
+
+import unittest
+
+from lib import lab_launch
+
+
+class Node:
+    """Node that joins the channel and idles"""
+
+    def __init__(self, chan):
+        self.chan = chan
+        self.chan.join('node')
+
+    def init(self):
+        pass
+
+    def run(self):
+        pass
+
+
+class FailingNode(Node):
+    """Node that dies while bootstrapping"""
+
+    def init(self):
+        raise RuntimeError('bootstrap failed')
+
+
+class TestLauncher(unittest.TestCase):
+
+    def test_failed_node_ends_launch(self):
+        """Test that a node dying during the launch ends the other nodes instead of leaving them at a barrier."""
+        launcher = lab_launch.Launcher(num_bits=5, channel_options={'backend': 'local'})
+        launcher.add('Node-{}', Node, count=3)
+        launcher.add('Failing', FailingNode)
+        with self.assertLogs('vs2lab.launch', 'ERROR'), self.assertRaisesRegex(AssertionError, 'Failing'):
+            launcher.start()
+        self.assertFalse(any(process.is_alive() for process in launcher.processes.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
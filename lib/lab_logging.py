@@ -1,10 +1,117 @@
+"""
+Logging setup for the labs.
+
+All lab loggers are children of the 'vs2lab' logger, which writes to vs2lab<file_postfix>.log
+and to the console.
+
+By default, handlers write in the thread that logs. With queued=True (or the environment variable
+VS2LAB_LOG_QUEUED set to '1'), log records are put on a queue instead, and a background thread
+builds the messages and writes them. Logging then costs neither disk I/O nor string building in
+the logging thread, even at the default DEBUG level of the log file. The logging thread only copies
+arguments that are mutable containers (lists, dicts, sets and bytearrays), so containers changed
+right after logging show up as they were logged.
+Processes forked by multiprocessing start a writer thread of their own and write their remaining
+records when they exit.
+
+setup can be called repeatedly (e.g. by several modules of a lab): each call replaces the handlers
+of the previous call instead of adding more.
+"""
+
 import logging
+import logging.handlers
+import multiprocessing.util
+import os
+import queue
+
+# environment variable enabling queued logging for all labs (value: '1')
+QUEUED_ENV = 'VS2LAB_LOG_QUEUED'
+
+# handlers added by the last setup call and the writer thread of queued logging
+_handlers = []
+_listener = None
+
+
+# argument types copied before queueing, as they may change once logging returns
+_MUTABLE = (list, dict, set, bytearray)
+
+
+def _snapshot(value):
+    return value.copy() if isinstance(value, _MUTABLE) else value
+
 
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue handler passing records on unformatted (the writer thread builds the message and formats them)."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # leave building the message to the writer thread, but keep the arguments as they are now
+        if isinstance(record.args, dict):
+            record.args = {key: _snapshot(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(_snapshot(arg) for arg in record.args)
+        if record.exc_info:
+            # tracebacks do not outlive the exception handler, format them right away
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _stop() -> None:
+    """
+    Write all queued records and stop the writer thread.
+    :return: None
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _start(handler: _QueueHandler, targets: list) -> None:
+    """
+    Start a writer thread on a fresh queue.
+    :param handler: queue handler of the 'vs2lab' logger
+    :param targets: handlers writing the records
+    :return: None
+    """
+    global _listener
+    handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(handler.queue, *targets, respect_handler_level=True)
+    _listener.start()
+    # multiprocessing children leave by os._exit, so register with its finalizers as well as atexit
+    multiprocessing.util.Finalize(None, _stop, exitpriority=10)
+
+
+def _after_fork(handler: _QueueHandler) -> None:
+    # the writer thread of the parent does not exist in the child
+    global _listener
+    if _listener is not None and handler in _handlers:
+        _listener = None
+        _start(handler, _handlers[1:])
+
+
+def setup(stream_level=logging.WARNING, file_level=logging.DEBUG, file_postfix='', queued: bool = None):
+    """
+    Set up the 'vs2lab' logger, replacing handlers of earlier calls.
+    :param stream_level: minimum level of console output
+    :param file_level: minimum level of the log file
+    :param file_postfix: log file name postfix
+    :param queued: write log records in a background thread (default: VS2LAB_LOG_QUEUED environment variable)
+    :return: None
+    """
+    if queued is None:
+        queued = os.environ.get(QUEUED_ENV) == '1'
 
-def setup(stream_level=logging.WARNING, file_level=logging.DEBUG, file_postfix=''):
     # create logger with 'vs2lab'
     logger = logging.getLogger('vs2lab')
-    logger.setLevel(logging.DEBUG)
+    # skip records below both handler levels before their message is built
+    logger.setLevel(min(stream_level, file_level))
+
+    # remove the handlers of an earlier call
+    _stop()
+    for handler in _handlers:
+        logger.removeHandler(handler)
+        handler.close()
+    _handlers.clear()
 
     # create file handler which logs even debug messages
     fh = logging.FileHandler('vs2lab' + file_postfix + '.log')
@@ -20,6 +127,15 @@ def setup(stream_level=logging.WARNING, file_level=logging.DEBUG, file_postfix='
     fh.setFormatter(formatter)
     ch.setFormatter(formatter)
 
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    if queued:
+        # the logger only enqueues, the writer thread passes records on to the handlers
+        qh = _QueueHandler(None)
+        _handlers.extend([qh, fh, ch])
+        _start(qh, [fh, ch])
+        multiprocessing.util.register_after_fork(qh, _after_fork)
+        logger.addHandler(qh)
+    else:
+        # add the handlers to the logger
+        _handlers.extend([fh, ch])
+        logger.addHandler(fh)
+        logger.addHandler(ch)
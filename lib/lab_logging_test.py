@@ -0,0 +1,89 @@
+"""
+Logging setup unit tests
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from lib import lab_logging
+
+
+class Probe:
+    """Log argument remembering the threads that turned it into a string"""
+
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread())
+        return 'probe'
+
+
+class TestSetup(unittest.TestCase):
+
+    def setUp(self):
+        # log files are written to the working directory
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+        self.addCleanup(self.remove_handlers)
+        self.logger = logging.getLogger('vs2lab.test')
+
+    @staticmethod
+    def remove_handlers():
+        lab_logging._stop()
+        logger = logging.getLogger('vs2lab')
+        for handler in lab_logging._handlers:
+            logger.removeHandler(handler)
+            handler.close()
+        lab_logging._handlers.clear()
+
+    @staticmethod
+    def read_log(postfix=''):
+        with open('vs2lab' + postfix + '.log') as file:
+            return file.read()
+
+    def test_repeated_setup_replaces_handlers(self):
+        """Test that calling setup again replaces the handlers instead of adding more."""
+        for queued, count in ((False, 2), (True, 1)):
+            with self.subTest(queued=queued):
+                postfix = '-queued' if queued else ''
+                lab_logging.setup(queued=queued, file_postfix=postfix)
+                lab_logging.setup(queued=queued, file_postfix=postfix)
+                self.assertEqual(len(logging.getLogger('vs2lab').handlers), count)
+                self.logger.info('once')
+                lab_logging._stop()
+                self.assertEqual(self.read_log(postfix).count('once'), 1)
+
+    def test_queued_records_reach_the_file(self):
+        """Test that queued records are written by the writer thread, with arguments as they were logged."""
+        lab_logging.setup(queued=True)
+        # handlers of the test runner (at the root logger) would build messages in this thread
+        patcher = mock.patch.object(logging.getLogger('vs2lab'), 'propagate', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        probe = Probe()
+        values = [1, 2]
+        self.logger.debug('values %s of %s', values, probe)
+        values.append(3)
+        try:
+            raise ValueError('failed')
+        except ValueError:
+            self.logger.exception('error %(code)s', {'code': 42})
+        # stopping writes the queued records
+        lab_logging._stop()
+        log = self.read_log()
+        self.assertIn('vs2lab.test - DEBUG - values [1, 2] of probe', log)
+        self.assertIn('vs2lab.test - ERROR - error 42', log)
+        self.assertIn('ValueError: failed', log)
+        self.assertNotIn(threading.current_thread(), probe.threads)
+        self.assertTrue(probe.threads, 'Expected the writer thread to build the message.')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,244 @@
+"""
+Metrics for lab_channel.
+
+ChannelMetrics collects
+- messages and bytes sent and received, per member and peer
+- time spent blocking in BLPOP
+- calls, redis round trips and duration per channel operation
+- end-to-end delivery latency, measured by a send timestamp carried in each message
+  (see lab_codec.Timestamped; clocks of sender and receiver hosts need to be in sync)
+
+Channels collect metrics if they are given a ChannelMetrics instance, or if the environment
+variable VS2LAB_CHANNEL_METRICS is set. The latter way enables metrics for all protocols without
+changing their code: all channels of a process then share one instance, which is dumped as JSON
+periodically and when the process exits to the file named by the variable ('{pid}' is replaced by
+the os pid).
+Setting the variable to '1' enables metrics without dumping.
+
+Without metrics, channels pay a single 'is None' check per operation.
+"""
+
+import functools
+import json
+import math
+import multiprocessing.util
+import os
+import threading
+import time
+
+# environment variable enabling metrics (value: dump file name or '1')
+METRICS_ENV = 'VS2LAB_CHANNEL_METRICS'
+
+
+class Histogram:
+    """
+    Histogram of durations with power-of-two buckets (in microseconds).
+    """
+
+    def __init__(self):
+        self.count: int = 0
+        self.total: float = 0.0
+        self.min = None
+        self.max = None
+        # sample counts by bucket exponent (bucket e holds values below 2**e microseconds)
+        self.buckets = {}
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+        exponent: int = max(0, math.ceil(math.log2(max(seconds * 1e6, 1))))
+        self.buckets[exponent] = self.buckets.get(exponent, 0) + 1
+
+    def quantile(self, q: float):
+        """
+        Approximate a quantile by the upper bound of its bucket (in seconds).
+        :param q: quantile between 0 and 1
+        :return: upper bound or None if empty
+        """
+        if self.count == 0:
+            return None
+        rank: float = q * self.count
+        seen: int = 0
+        for exponent in sorted(self.buckets):
+            seen += self.buckets[exponent]
+            if seen >= rank:
+                return min(2 ** exponent / 1e6, self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {'count': self.count,
+                'sum': self.total,
+                'min': self.min,
+                'max': self.max,
+                'mean': self.total / self.count if self.count else None,
+                'p50': self.quantile(0.5),
+                'p99': self.quantile(0.99),
+                'buckets_us': {str(2 ** exponent): n for exponent, n in sorted(self.buckets.items())}}
+
+
+class ChannelMetrics:
+    """
+    Thread-safe metrics of one or more channels.
+    """
+
+    def __init__(self, dump_path: str = None, interval: float = 10):
+        """
+        :param dump_path: file for periodic and final JSON dumps ('{pid}' is replaced by the os pid), None to disable
+        :param interval: seconds between dumps
+        """
+        self.lock = threading.Lock()
+        # [messages, bytes] by (member, peer)
+        self.sent = {}
+        self.received = {}
+        # time blocked in blpop and end-to-end latency
+        self.blocked = Histogram()
+        self.latency = Histogram()
+        # [calls, round trips, duration histogram] by operation name
+        self.operations = {}
+        # round trips of the operation currently running in a thread
+        self.current = threading.local()
+        self.dump_path = dump_path.replace('{pid}', str(os.getpid())) if dump_path else None
+        if self.dump_path is not None:
+            threading.Thread(target=self.__dump_loop, args=(interval,), daemon=True).start()
+            # dump the final counts when the process exits (multiprocessing children leave by os._exit,
+            # so register with its finalizers, which also run at exit of the main process)
+            multiprocessing.util.Finalize(self, self.dump, exitpriority=10)
+
+    def record_send(self, member: str, peers: list, size: int) -> None:
+        with self.lock:
+            for peer in peers:
+                counts = self.sent.setdefault((member, peer), [0, 0])
+                counts[0] += 1
+                counts[1] += size
+
+    def record_receive(self, member: str, peer: str, size: int, sent_at) -> None:
+        with self.lock:
+            counts = self.received.setdefault((member, peer), [0, 0])
+            counts[0] += 1
+            counts[1] += size
+            if sent_at is not None:
+                self.latency.add(max(0.0, time.time() - sent_at))
+
+    def record_blocked(self, seconds: float) -> None:
+        with self.lock:
+            self.blocked.add(seconds)
+
+    def round_trip(self) -> None:
+        """Count a round trip for the operation running in the current thread (if any)."""
+        if getattr(self.current, 'round_trips', None) is not None:
+            self.current.round_trips += 1
+
+    def record_operation(self, name: str, round_trips: int, seconds: float) -> None:
+        with self.lock:
+            stats = self.operations.setdefault(name, [0, 0, Histogram()])
+            stats[0] += 1
+            stats[1] += round_trips
+            stats[2].add(seconds)
+
+    def instrument(self, client) -> None:
+        """
+        Count round trips of a redis client (commands, script calls and pipelines).
+        :param client: redis client
+        :return: None
+        """
+        execute_command = client.execute_command
+        pipeline = client.pipeline
+
+        def counted_command(*args, **options):
+            self.round_trip()
+            return execute_command(*args, **options)
+
+        def counted_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            def counted_execute(*exec_args, **exec_kwargs):
+                self.round_trip()
+                return execute(*exec_args, **exec_kwargs)
+            pipe.execute = counted_execute
+            return pipe
+
+        client.execute_command = counted_command
+        client.pipeline = counted_pipeline
+
+    @staticmethod
+    def __by_member(counts: dict) -> dict:
+        result = {}
+        for (member, peer), (messages, size) in counts.items():
+            result.setdefault(str(member), {})[str(peer)] = {'messages': messages, 'bytes': size}
+        return result
+
+    def stats(self) -> dict:
+        """
+        Take a snapshot of all metrics.
+        :return: dict of plain (JSON serializable) values
+        """
+        with self.lock:
+            return {'time': time.time(),
+                    'pid': os.getpid(),
+                    'sent': self.__by_member(self.sent),
+                    'received': self.__by_member(self.received),
+                    'blocked': self.blocked.snapshot(),
+                    'latency': self.latency.snapshot(),
+                    'operations': {name: {'calls': calls,
+                                          'round_trips': round_trips,
+                                          'round_trips_per_call': round_trips / calls,
+                                          'time': duration.snapshot()}
+                                   for name, (calls, round_trips, duration) in self.operations.items()}}
+
+    def dump(self, path: str = None) -> None:
+        """
+        Write a snapshot of all metrics as JSON.
+        :param path: file name (default: dump_path)
+        :return: None
+        """
+        with open(path or self.dump_path, 'w') as file:
+            json.dump(self.stats(), file, indent=2)
+
+    def __dump_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            self.dump()
+
+
+# metrics shared by all channels of this process when enabled by the environment, by os pid
+_shared = {}
+
+
+def from_env():
+    """
+    Get the metrics shared by all channels of this process if enabled by VS2LAB_CHANNEL_METRICS.
+    :return: ChannelMetrics instance or None
+    """
+    setting = os.environ.get(METRICS_ENV)
+    if not setting:
+        return None
+    metrics = _shared.get(os.getpid())
+    if metrics is None:
+        metrics = ChannelMetrics(dump_path=None if setting == '1' else setting)
+        _shared[os.getpid()] = metrics
+    return metrics
+
+
+def measured(method):
+    """
+    Decorator recording round trips and duration of a channel operation if the channel has metrics.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if metrics is None:
+            return method(self, *args, **kwargs)
+        outer = getattr(metrics.current, 'round_trips', None)
+        metrics.current.round_trips = 0
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            round_trips = metrics.current.round_trips
+            metrics.record_operation(method.__name__, round_trips, time.perf_counter() - start)
+            # nested operations (e.g. leave calling other operations) also count for the outer one
+            metrics.current.round_trips = None if outer is None else outer + round_trips
+    return wrapper
@@ -0,0 +1,43 @@
+"""
+Channel metrics unit tests
+"""
+
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from lib import lab_metrics
+
+
+def record_sends(path, count):
+    """Count sends in a child process with metrics enabled by the environment"""
+    os.environ[lab_metrics.METRICS_ENV] = path
+    metrics = lab_metrics.from_env()
+    for _ in range(count):
+        metrics.record_send('1', ['2'], 10)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_child_process_metrics_are_dumped(self):
+        """Test that processes started by multiprocessing dump their metrics when they exit."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'metrics-{pid}.json')
+        for method in ('fork', 'forkserver'):
+            if method not in multiprocessing.get_all_start_methods():
+                continue
+            with self.subTest(method=method):
+                process = multiprocessing.get_context(method).Process(target=record_sends, args=(path, 100))
+                process.start()
+                process.join()
+                with open(path.replace('{pid}', str(process.pid))) as file:
+                    stats = json.load(file)
+                self.assertEqual(stats['pid'], process.pid)
+                self.assertEqual(stats['sent'], {'1': {'2': {'messages': 100, 'bytes': 1000}}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,275 @@
+"""
+Recording and replay of lab_channel traffic.
+
+A Recorder writes every message a channel sends or receives as a compact binary record:
+
+    time (8 bytes, double) | kind (1 byte: 'S' send, 'R' receive) | codec tag (1 byte) | size (4 bytes)
+    | sender, receiver, queue key (each: length (2 bytes) | utf-8)
+
+following a file header (MAGIC). Messages themselves are not recorded, only their size and codec.
+Broadcasts are recorded once with receiver '*'.
+
+Channels record if they are given a Recorder, or if the environment variable VS2LAB_CHANNEL_RECORD
+names a trace file ('{pid}' is replaced by the os pid). The latter way records the protocols
+(chord, mutex, 2pc, ...) without changing their code: all channels of a process then share one file.
+
+The replay tool feeds the sends of recorded traces back into a channel at original or accelerated
+speed, and receives them again where the trace did. Payloads are random bytes, encoded by the
+codec of the record and sized so the encoding takes the recorded number of bytes. Where no payload
+fits exactly (e.g. member ids of another length in inbox layout, or a codec that is not available
+and replaced by the default codec of the channel), the replay sends the closest smaller one and
+reports a size mismatch. For example:
+
+    python -m lib.lab_record dump trace-1234.bin
+    python -m lib.lab_record replay --speed 10 --backend memory trace-*.bin
+"""
+
+import argparse
+import json
+import multiprocessing.util
+import os
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from . import lab_codec
+
+# environment variable enabling recording (value: trace file name)
+RECORD_ENV = 'VS2LAB_CHANNEL_RECORD'
+
+# file header of traces
+MAGIC = b'VS2LAB-TRACE-1\n'
+
+# record kinds
+SEND = b'S'
+RECEIVE = b'R'
+
+_HEADER = struct.Struct('!dccI')
+_LENGTH = struct.Struct('!H')
+
+Record = namedtuple('Record', ['time', 'kind', 'codec', 'size', 'sender', 'receiver', 'queue'])
+
+
+class Recorder:
+    """
+    Thread-safe writer of a channel trace.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: trace file ('{pid}' is replaced by the os pid)
+        """
+        self.path: str = path.replace('{pid}', str(os.getpid()))
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'wb')
+        self.file.write(MAGIC)
+        # write buffered records when the process exits (multiprocessing children leave by os._exit,
+        # so register with its finalizers, which also run at exit of the main process)
+        multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+
+    def record(self, kind: bytes, sender: str, receiver: str, queue: str, data) -> None:
+        """
+        Write a record for a sent or received message.
+        :param kind: SEND or RECEIVE
+        :param sender: member id of the sender
+        :param receiver: member id of the receiver ('*' for broadcasts)
+        :param queue: queue key
+        :param data: encoded message
+        :return: None
+        """
+        frame = bytearray(_HEADER.pack(time.time(), kind, bytes(data[:1]), len(data)))
+        for text in (sender, receiver, queue):
+            raw: bytes = str(text).encode()
+            frame += _LENGTH.pack(len(raw))
+            frame += raw
+        with self.lock:
+            self.file.write(frame)
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+# recorder shared by all channels of this process when enabled by the environment, by os pid
+_shared = {}
+
+
+def from_env():
+    """
+    Get the recorder shared by all channels of this process if enabled by VS2LAB_CHANNEL_RECORD.
+    :return: Recorder instance or None
+    """
+    path = os.environ.get(RECORD_ENV)
+    if not path:
+        return None
+    recorder = _shared.get(os.getpid())
+    if recorder is None:
+        recorder = Recorder(path)
+        _shared[os.getpid()] = recorder
+    return recorder
+
+
+def read(path: str):
+    """
+    Read the records of a trace.
+    :param path: trace file
+    :return: iterator of Record tuples
+    """
+    with open(path, 'rb') as file:
+        data: bytes = file.read()
+    assert data.startswith(MAGIC), 'not a channel trace'
+    offset: int = len(MAGIC)
+    while offset < len(data):
+        timestamp, kind, codec, size = _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+        texts: list = []
+        for _ in range(3):
+            (length,) = _LENGTH.unpack_from(data, offset)
+            offset += _LENGTH.size
+            texts.append(data[offset:offset + length].decode())
+            offset += length
+        yield Record(timestamp, kind, codec, size, *texts)
+
+
+def _codecs() -> dict:
+    """
+    Instantiate the codecs to replay records with.
+    :return: dict of codec instances by tag (without codecs whose optional dependency is missing)
+    """
+    codecs: dict = {lab_codec.PickleCodec.tag: lab_codec.PickleCodec(),
+                    lab_codec.Pickle5Codec.tag: lab_codec.Pickle5Codec(),
+                    # compress any size, records of the compressing codec are compressed
+                    lab_codec.Compressed.tag: lab_codec.Compressed(threshold=0),
+                    lab_codec.Timestamped.tag: lab_codec.Timestamped()}
+    if lab_codec.msgpack is not None:
+        codecs[lab_codec.MsgpackCodec.tag] = lab_codec.MsgpackCodec()
+    return codecs
+
+
+def _payload(chan, sender: str, size: int) -> bytes:
+    """
+    Build a message whose encoding by a channel (codec and queue layout) takes size bytes.
+    :param chan: channel set up with the codec to replay
+    :param sender: member id of the sender (part of the encoding in inbox layout)
+    :param size: recorded size of the encoding
+    :return: random (incompressible) bytes, encoded to size bytes or as few less as possible
+    """
+    # encoding overhead grows with the payload, so start from the overhead of no payload and shrink
+    length: int = max(0, size - len(chan._pack(sender, b'')))
+    while True:
+        message: bytes = os.urandom(length)
+        if length == 0 or len(chan._pack(sender, message)) <= size:
+            return message
+        length -= 1
+
+
+def _dump(args: argparse.Namespace) -> None:
+    for path in args.traces:
+        for record in read(path):
+            print('{:.6f} {} {} -> {} {} bytes, codec {!r}, queue {}'.format(
+                record.time, record.kind.decode(), record.sender, record.receiver, record.size,
+                record.codec, record.queue))
+
+
+def _replay(args: argparse.Namespace) -> dict:
+    # lazy import, lab_channel imports this module
+    from .lab_channel import BaseChannel, Channel
+
+    records: list = sorted((record for path in args.traces for record in read(path)), key=lambda r: r.time)
+    chan = Channel(n_bits=args.n_bits, host_ip=args.host, port_no=args.port, inbox=args.inbox,
+                   backend=args.backend)
+    chan.channel.flushall()
+
+    # one replay member per recorded member id
+    recorded: set = ({r.sender for r in records} | {r.receiver for r in records}) - {'*'}
+    members: dict = {pid: chan.join('replay') for pid in sorted(recorded)}
+
+    codecs: dict = _codecs()
+    default_codec = chan.codec
+    # payloads and whether they match the recorded size, by codec tag, size and sender
+    payloads: dict = {}
+    sends: int = 0
+    mismatches: int = 0
+    receives: int = 0
+    lag: float = 0.0
+    start: float = time.perf_counter()
+    for record in records:
+        if args.speed > 0:
+            # keep the (accelerated) schedule of the trace
+            due: float = start + (record.time - records[0].time) / args.speed
+            delay: float = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            lag = max(lag, -delay)
+        if record.kind == SEND:
+            sender: str = members[record.sender]
+            chan.bind(sender)
+            chan.codec = codecs.get(record.codec, default_codec)
+            key: tuple = (record.codec, record.size, sender)
+            if key not in payloads:
+                message: bytes = _payload(chan, sender, record.size)
+                payloads[key] = (message, len(chan._pack(sender, message)) == record.size)
+            message, exact = payloads[key]
+            priority = BaseChannel.HIGH if record.queue.startswith(BaseChannel.HIGH_PREFIX) else BaseChannel.NORMAL
+            if record.receiver == '*':
+                chan.send_to_all(message, priority)
+            else:
+                chan.send_to({members[record.receiver]}, message, priority)
+            sends += 1
+            mismatches += not exact
+        elif args.receive:
+            chan.bind(members[record.receiver])
+            if chan.receive_from({members[record.sender]}, args.timeout) is not None:
+                receives += 1
+    elapsed: float = time.perf_counter() - start
+
+    report: dict = {'traces': args.traces,
+                    'config': {key: value for key, value in vars(args).items() if key not in ('traces', 'command')},
+                    'records': len(records),
+                    'members': len(members),
+                    'sends': sends,
+                    'size_mismatches': mismatches,
+                    'receives': receives,
+                    'elapsed_s': elapsed,
+                    'trace_s': records[-1].time - records[0].time if records else 0,
+                    'max_lag_s': lag,
+                    'msgs_per_s': (sends + receives) / elapsed if elapsed > 0 else None}
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return report
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description='Inspect and replay lab_channel traces')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    dump = commands.add_parser('dump', help='print trace records')
+    dump.add_argument('traces', nargs='+')
+
+    replay = commands.add_parser('replay', help='replay the sends (and receives) of traces')
+    replay.add_argument('traces', nargs='+', help='trace files (merged by time)')
+    replay.add_argument('--speed', type=float, default=1.0, help='speedup factor, 0 for as fast as possible')
+    replay.add_argument('--no-receive', dest='receive', action='store_false', help='replay sends only')
+    replay.add_argument('--timeout', type=int, default=1, help='receive timeout in seconds')
+    replay.add_argument('--backend', default='redis', choices=('redis', 'memory', 'local'))
+    replay.add_argument('--host', default='localhost', help='redis host')
+    replay.add_argument('--port', type=int, default=6379, help='redis port')
+    replay.add_argument('--inbox', action='store_true', help='use the inbox layout')
+    replay.add_argument('--n-bits', type=int, default=16, help='id space of the replay channel')
+    args = parser.parse_args(argv)
+
+    if args.command == 'dump':
+        _dump(args)
+    else:
+        _replay(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Trace recording unit tests
+"""
+
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from lib import lab_channel, lab_codec, lab_record
+
+
+def record_messages(path, count):
+    """Record count sends in a child process (which exits without running atexit handlers)"""
+    recorder = lab_record.Recorder(path)
+    for i in range(count):
+        recorder.record(lab_record.SEND, '1', '2', "['1', '2']", b'P' + bytes(i))
+
+
+class TestRecorder(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'trace-{pid}.bin')
+
+    def test_read_records(self):
+        """Test reading back what a recorder wrote."""
+        recorder = lab_record.Recorder(self.path)
+        recorder.record(lab_record.SEND, '1', '*', "['1', '*", b'Pdata')
+        recorder.record(lab_record.RECEIVE, '1', '2', "['1', '2']", b'Jx')
+        recorder.close()
+        records = list(lab_record.read(recorder.path))
+        self.assertEqual([(r.kind, r.codec, r.size, r.sender, r.receiver) for r in records],
+                         [(b'S', b'P', 5, '1', '*'), (b'R', b'J', 2, '1', '2')])
+
+    def test_child_process_trace_is_written(self):
+        """Test that processes started by multiprocessing write their trace when they exit."""
+        for method in ('fork', 'forkserver'):
+            if method not in multiprocessing.get_all_start_methods():
+                continue
+            with self.subTest(method=method):
+                process = multiprocessing.get_context(method).Process(target=record_messages,
+                                                                      args=(self.path, 100))
+                process.start()
+                process.join()
+                records = list(lab_record.read(self.path.replace('{pid}', str(process.pid))))
+                self.assertEqual(len(records), 100)
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def record_traffic(self, path):
+        """Record messages of several codecs and sizes between two members"""
+        recorder = lab_record.Recorder(path)
+        codecs = [lab_codec.PickleCodec(), lab_codec.Compressed(threshold=0)]
+        (a, pid_a), (b, pid_b) = [self.member(recorder=recorder, codec=codec) for codec in codecs]
+        for message in ['small', bytes(300), list(range(100))]:
+            a.send_to({pid_b}, message)
+            b.receive_from({pid_a}, timeout=1)
+            b.send_to({pid_a}, message)
+            a.receive_from({pid_b}, timeout=1)
+        a.send_to_all(('all', bytes(1000)))
+        recorder.close()
+        return recorder.path
+
+    @staticmethod
+    def member(**options):
+        chan = lab_channel.Channel(backend='memory', **options)
+        pid = chan.join('node')
+        chan.bind(pid)
+        return chan, pid
+
+    @staticmethod
+    def sends(path):
+        return [(r.codec, r.size) for r in lab_record.read(path) if r.kind == lab_record.SEND]
+
+    def test_replay_keeps_codecs_and_sizes(self):
+        """Test that replayed sends have the codec and size of the recorded sends, and are received again."""
+        trace = self.record_traffic(os.path.join(self.directory, 'trace.bin'))
+        replayed = os.path.join(self.directory, 'replayed.bin')
+        output = io.StringIO()
+        with mock.patch.dict(os.environ, {lab_record.RECORD_ENV: replayed}), contextlib.redirect_stdout(output):
+            lab_record.main(['replay', '--speed', '0', '--backend', 'memory', trace])
+        lab_record._shared.pop(os.getpid()).close()
+        self.assertEqual(len({codec for codec, _ in self.sends(trace)}), 2)
+        self.assertEqual(self.sends(replayed), self.sends(trace))
+        report = json.loads(output.getvalue())
+        self.assertEqual((report['sends'], report['size_mismatches'], report['receives']), (7, 0, 6))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,499 @@
+"""
+Discrete-event simulation of lab_channel.
+
+A Simulation runs channel-based protocols (chord, mutex, 2pc, ...) with thousands of nodes in a
+single process and in virtual time: links delay messages by a configurable latency (plus random
+jitter) and lose them with a configurable probability; receive timeouts and sleeps take no real time.
+All random choices derive from one seed, so experiments are reproducible.
+
+    sim = lab_sim.Simulation(n_bits=12, latency=0.005, jitter=0.002, loss=0.01, seed=42)
+    sim.launch('ChordNode-{}', chord_node.ChordNode, count=1000, init='enter')
+    sim.launch('ChordClient', DummyChordClient, init='enter')
+    report = sim.run(until=60)
+
+Nodes are set up like lab_launch does it: all nodes are created (joining the channel with a
+SimChannel of their own), then bootstrapped, then their run methods are started as tasks.
+Tasks are cooperative: each runs in a thread, but only one runs at a time, and it runs until it
+blocks in a receive or a sleep. Then the simulation advances virtual time to the next event
+(a message delivery, a receive timeout or the end of a sleep). Simultaneous events are processed
+in a fixed order (by receiver and sender, or task name).
+
+While the simulation runs, time.time, time.sleep, time.monotonic and datetime.datetime.now/utcnow
+follow the virtual clock, so protocol code runs unchanged. The random module is seeded with the
+seed as well. Protocols iterating over sets (e.g. of member ids) depend on the string hash seed of
+the interpreter; set PYTHONHASHSEED (e.g. to 0) for identical results across interpreter runs.
+
+Nodes can crash at a given virtual time (crash), like processes terminated by a runner.
+run() ends when no events are left (all tasks finished or blocked forever), or at virtual time until,
+and returns a report: virtual and wall-clock duration, events, message counters, the results of
+the nodes' run methods, the crashed nodes and the nodes still running or blocked at the end.
+"""
+
+import datetime
+import heapq
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from . import lab_codec, lab_store
+from .lab_channel import BaseChannel
+
+# virtual time of the simulation start (seconds since the epoch)
+EPOCH = 1600000000.0
+
+# stack size of task threads (thousands of tasks with the default size would reserve gigabytes)
+STACK_SIZE = 512 * 1024
+
+
+class SimulationEnd(BaseException):
+    """Raised in blocked tasks to unwind them when the simulation ends (not caught by 'except Exception')."""
+
+
+class _Task:
+    """
+    A node activity running in a thread of its own, one task at a time.
+    """
+
+    def __init__(self, sim, name: str, function, args: tuple):
+        self.sim = sim
+        self.name: str = name
+        self.function = function
+        self.args: tuple = args
+        # released by the scheduler to let the task run
+        self.resume = threading.Semaphore(0)
+        # incremented whenever the task blocks, so stale wake-ups can be told apart
+        self.token: int = 0
+        self.timed_out: bool = False
+        self.stop: bool = False
+        self.finished: bool = False
+        self.result = None
+        self.error = None
+        self.thread = threading.Thread(target=self.__main, name=name, daemon=True)
+
+    def __main(self) -> None:
+        self.resume.acquire()
+        try:
+            if not self.stop:
+                self.result = self.function(*self.args)
+        except SimulationEnd:
+            pass
+        except Exception as e:
+            self.error = e
+            self.sim.logger.exception("Task %s failed.", self.name)
+        finally:
+            self.finished = True
+            self.sim.baton.release()
+
+
+class Simulation:
+    """
+    Event loop, virtual clock and network of a simulated channel.
+    """
+
+    def __init__(self, n_bits: int = 5, latency=0.001, jitter: float = 0.0, loss: float = 0.0, seed: int = 0,
+                 codec=None):
+        """
+        :param n_bits: number of bits for member ids
+        :param latency: one-way link latency in seconds, or a function (sender, receiver, rng) -> seconds
+        :param jitter: maximum random extra latency in seconds (uniformly distributed)
+        :param loss: probability of a message getting lost
+        :param seed: seed of all random choices
+        :param codec: message codec (messages are copied by encoding, like on a real channel)
+        """
+        self.n_bits: int = n_bits
+        self.latency = latency
+        self.jitter: float = jitter
+        self.loss: float = loss
+        self.seed: int = seed
+        self.random = random.Random(seed)
+        self.codec = codec if codec is not None else lab_codec.PickleCodec()
+        # membership sets, accessible as chan.channel like the store of a real channel
+        self.store = lab_store.MemoryStore()
+        # virtual time in seconds since the simulation start
+        self.now: float = 0.0
+        # heap of (time, order key, sequence number, callback)
+        self.events: list = []
+        self.sequence: int = 0
+        # delivered messages by receiver: deques of (sender, data) for the high and the normal lane
+        self.mailboxes = {}
+        # blocked receives by receiver: (task, sender set or None)
+        self.waiting = {}
+        # arrival time of the last message per link, keeping links FIFO despite jitter
+        self.last_arrival = {}
+        # nodes to launch: (name, node class, bootstrap method, bootstrap arguments)
+        self.nodes: list = []
+        self.tasks: list = []
+        self.crashed: list = []
+        # the running task (None while the scheduler runs)
+        self.current = None
+        # held by the scheduler or the running task
+        self.baton = threading.Semaphore(0)
+        self.counters = {'sent': 0, 'delivered': 0, 'lost': 0, 'undeliverable': 0, 'bytes': 0, 'events': 0}
+        self.logger = logging.getLogger('vs2lab.sim.Simulation')
+
+    def time(self) -> float:
+        """
+        :return: virtual time in seconds since the epoch
+        """
+        return EPOCH + self.now
+
+    def channel(self):
+        """
+        Create a channel of this simulation (one per node, like one Channel per process).
+        :return: SimChannel
+        """
+        return SimChannel(self)
+
+    def schedule(self, delay: float, key: str, callback) -> None:
+        """
+        Schedule an event.
+        :param delay: virtual seconds from now
+        :param key: order of simultaneous events
+        :param callback: function called at the event time
+        :return: None
+        """
+        self.sequence += 1
+        heapq.heappush(self.events, (self.now + delay, key, self.sequence, callback))
+
+    def launch(self, name: str, node_class, count: int = 1, init: str = 'init', init_args: tuple = ()) -> list:
+        """
+        Add nodes (see lab_launch.Launcher.add).
+        :param name: node name ('{}' is replaced by the index of the node)
+        :param node_class: class of node (joins the channel when created)
+        :param count: number of nodes
+        :param init: name of the bootstrap method of the nodes
+        :param init_args: arguments of the bootstrap method
+        :return: list of node names
+        """
+        names: list = [name.format(i) for i in range(count)]
+        self.nodes.extend((node_name, node_class, init, tuple(init_args)) for node_name in names)
+        return names
+
+    def crash(self, name: str, at: float) -> None:
+        """
+        Let a node crash: its task stops at a virtual time, while it stays a member of the channel
+        (like a terminated process).
+        :param name: node name
+        :param at: virtual seconds since the simulation start
+        :return: None
+        """
+        def stop():
+            for task in self.tasks:
+                if task.name == name and not task.finished:
+                    task.stop = True
+                    self.crashed.append(name)
+                    self.__switch(task)
+        self.schedule(at - self.now, name, stop)
+
+    def spawn(self, name: str, function, *args) -> _Task:
+        """
+        Start a task.
+        :param name: task name
+        :param function: function run by the task
+        :param args: arguments of the function
+        :return: task
+        """
+        task = _Task(self, name, function, args)
+        self.tasks.append(task)
+        task.thread.start()
+        self.schedule(0, name, lambda: self.__switch(task))
+        return task
+
+    def __switch(self, task: _Task) -> None:
+        """
+        Run a task until it blocks or finishes.
+        """
+        if task.finished:
+            return
+        self.current = task
+        task.resume.release()
+        self.baton.acquire()
+        self.current = None
+
+    def __task(self) -> _Task:
+        task = self.current
+        assert task is not None and task.thread is threading.current_thread(), 'blocking call outside a simulated task'
+        return task
+
+    def __block(self, task: _Task, timeout: float, receiver: str = None) -> bool:
+        """
+        Suspend the running task until woken up or timed out.
+        :param task: running task
+        :param timeout: virtual seconds, 0 or None to wait until woken up
+        :param receiver: member id the task waits for messages of (if any)
+        :return: True if woken up, False if timed out
+        """
+        task.token += 1
+        token: int = task.token
+        task.timed_out = False
+        if timeout:
+            def expire():
+                if task.token == token:
+                    task.timed_out = True
+                    if receiver is not None and self.waiting.get(receiver, (None,))[0] is task:
+                        del self.waiting[receiver]
+                    self.__switch(task)
+            self.schedule(timeout, task.name, expire)
+        self.baton.release()
+        task.resume.acquire()
+        if task.stop:
+            raise SimulationEnd()
+        return not task.timed_out
+
+    def __wake(self, task: _Task) -> None:
+        token: int = task.token
+        self.schedule(0, task.name, lambda: self.__switch(task) if task.token == token else None)
+
+    def sleep(self, seconds: float) -> None:
+        """
+        Suspend the running task for some virtual time.
+        :param seconds: virtual seconds
+        :return: None
+        """
+        task = self.__task()
+        if seconds > 0:
+            self.__block(task, seconds)
+
+    def transmit(self, sender: str, receiver: str, data: bytes, priority: int) -> None:
+        """
+        Send a message over the simulated link from sender to receiver.
+        :param sender: member id of the sender
+        :param receiver: member id of the receiver
+        :param data: encoded message
+        :param priority: lane of the message
+        :return: None
+        """
+        self.counters['sent'] += 1
+        self.counters['bytes'] += len(data)
+        if self.loss and self.random.random() < self.loss:
+            self.counters['lost'] += 1
+            return
+        if callable(self.latency):
+            delay: float = self.latency(sender, receiver, self.random)
+        else:
+            delay: float = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        link = (sender, receiver)
+        arrival: float = max(self.now + delay, self.last_arrival.get(link, 0.0))
+        self.last_arrival[link] = arrival
+        self.schedule(arrival - self.now, receiver + ' ' + sender,
+                      lambda: self.__deliver(sender, receiver, data, priority))
+
+    def __deliver(self, sender: str, receiver: str, data: bytes, priority: int) -> None:
+        mailbox = self.mailboxes.get(receiver)
+        if mailbox is None:
+            # the receiver left the channel
+            self.counters['undeliverable'] += 1
+            return
+        self.counters['delivered'] += 1
+        mailbox[0 if priority == BaseChannel.HIGH else 1].append((sender, data))
+        waiting = self.waiting.get(receiver)
+        if waiting is not None and (waiting[1] is None or sender in waiting[1]):
+            del self.waiting[receiver]
+            self.__wake(waiting[0])
+
+    def receive(self, receiver: str, senders, max_count: int, timeout) -> list:
+        """
+        Take delivered messages, blocking the running task until one arrives or the timeout expires.
+        :param receiver: member id of the receiver
+        :param senders: set of sender ids or None for any sender
+        :param max_count: maximum number of messages
+        :param timeout: virtual seconds, 0 or None to block until a message arrives
+        :return: list of (sender, data) pairs, empty on timeout
+        """
+        timed_out: bool = False
+        while True:
+            received: list = []
+            for lane in self.mailboxes[receiver]:
+                for item in list(lane):
+                    if len(received) == max_count:
+                        break
+                    if senders is None or item[0] in senders:
+                        lane.remove(item)
+                        received.append(item)
+            if received or timed_out:
+                return received
+            task = self.__task()
+            self.waiting[receiver] = (task, senders)
+            # a message arriving with the timeout is still taken
+            timed_out = not self.__block(task, timeout, receiver)
+
+    def run(self, until: float = None) -> dict:
+        """
+        Set up the launched nodes and run the simulation.
+        :param until: virtual seconds to simulate at most (default: until no events are left)
+        :return: report
+        """
+        patches: list = self.__patch()
+        stack_size: int = threading.stack_size(STACK_SIZE)
+        random.seed(self.seed)
+        start: float = time.perf_counter()
+        try:
+            # create all nodes (joining the channel), bootstrap them, then run them
+            nodes: list = [(name, node_class(self.channel()), init, init_args)
+                           for name, node_class, init, init_args in self.nodes]
+            for _, node, init, init_args in nodes:
+                getattr(node, init)(*init_args)
+            for name, node, *_ in nodes:
+                self.spawn(name, node.run)
+
+            while self.events and (until is None or self.events[0][0] <= until):
+                self.now, _, _, callback = heapq.heappop(self.events)
+                self.counters['events'] += 1
+                callback()
+            if until is not None and self.events:
+                self.now = until
+
+            # unwind the tasks that are still blocked
+            unfinished: list = [task for task in self.tasks if not task.finished]
+            for task in unfinished:
+                task.stop = True
+                task.resume.release()
+                self.baton.acquire()
+        finally:
+            threading.stack_size(stack_size)
+            for owner, attribute, value in patches:
+                setattr(owner, attribute, value)
+
+        report: dict = {'seed': self.seed,
+                        'nodes': len(self.nodes),
+                        'virtual_s': self.now,
+                        'wall_s': time.perf_counter() - start,
+                        'messages': dict(self.counters),
+                        'results': {task.name: task.result for task in self.tasks if task.result is not None},
+                        'errors': {task.name: repr(task.error) for task in self.tasks if task.error is not None},
+                        'crashed': self.crashed,
+                        'unfinished': [task.name for task in unfinished]}
+        self.logger.info("Simulated %.3fs with %d nodes in %.3fs (%d events, %d messages, %d lost).",
+                         report['virtual_s'], report['nodes'], report['wall_s'], self.counters['events'],
+                         self.counters['sent'], self.counters['lost'])
+        return report
+
+    def __patch(self) -> list:
+        """
+        Let the clock functions of time and datetime follow the virtual clock.
+        :return: list of (owner, attribute, original value) to restore
+        """
+        sim = self
+        sleep = time.sleep
+
+        def virtual_sleep(seconds):
+            task = sim.current
+            if task is not None and task.thread is threading.current_thread():
+                sim.sleep(seconds)
+            else:
+                sleep(seconds)
+
+        class VirtualDatetime(datetime.datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.datetime.fromtimestamp(sim.time(), tz)
+
+            @classmethod
+            def utcnow(cls):
+                return datetime.datetime.utcfromtimestamp(sim.time())
+
+        patches: list = [(time, 'time', lambda: sim.time()),
+                         (time, 'time_ns', lambda: int(sim.time() * 1e9)),
+                         (time, 'monotonic', lambda: sim.now),
+                         (time, 'sleep', virtual_sleep),
+                         (datetime, 'datetime', VirtualDatetime)]
+        originals: list = [(owner, attribute, getattr(owner, attribute)) for owner, attribute, _ in patches]
+        for owner, attribute, value in patches:
+            setattr(owner, attribute, value)
+        return originals
+
+
+class SimChannel(BaseChannel):
+    """
+    Channel of a simulated node, with the API of lab_channel.Channel.
+
+    Like a real channel, it is bound to one member (bind) and copies messages by encoding them.
+    Membership sets are kept in a store that can be accessed as chan.channel (e.g. smembers).
+    Messages are delivered in arrival order, high priority messages first. Receive timeouts and
+    timeout 0 (block until a message arrives) behave like those of Channel, in virtual time.
+    """
+
+    def __init__(self, sim: Simulation):
+        super().__init__(sim.n_bits, codec=sim.codec)
+        self.sim: Simulation = sim
+        self.channel = sim.store
+        self.pid = None
+
+    def bind(self, pid: str) -> int:
+        self.pid = pid
+        return 0
+
+    def join(self, subgroup: str) -> str:
+        """
+        Join as a member with a random unused id (see Channel.join).
+        """
+        members: set = self._decode_set(self.channel.smembers('members'))
+        assert len(members) < self.MAXPROC, 'no free member id'
+        new_pid: str = str(self.sim.random.randrange(self.MAXPROC))
+        while new_pid in members:
+            new_pid = str(self.sim.random.randrange(self.MAXPROC))
+        self.channel.sadd('members', new_pid)
+        self.channel.sadd(subgroup, new_pid)
+        self.sim.mailboxes[new_pid] = (deque(), deque())
+        self.logger.info("Member %s joining %s.", new_pid, subgroup)
+        return new_pid
+
+    def leave(self, subgroup: str) -> None:
+        pid: str = self.pid
+        assert self.exists(pid), 'member unknown'
+        self.logger.info("Member %s leaving %s", pid, subgroup)
+        self.pid = None
+        self.channel.srem('members', pid)
+        self.channel.srem(subgroup, pid)
+        self.sim.mailboxes.pop(pid, None)
+
+    def exists(self, pid: str) -> bool:
+        return self.channel.sismember('members', pid)
+
+    def subgroup(self, subgroup: str) -> set:
+        return self._decode_set(self.channel.smembers(subgroup))
+
+    def send_to(self, destination_set, message: object, priority: int = BaseChannel.NORMAL) -> None:
+        """
+        Send a message to a set of members (see Channel.send_to).
+        """
+        assert all(type(k) is str for k in destination_set), 'type error'
+        caller: str = self.pid
+        assert self.exists(caller), 'unknown sender'
+        # a fixed order keeps random choices (loss, jitter) independent of set iteration order
+        destinations: list = sorted(destination_set)
+        assert all(self.exists(destination) for destination in destinations), 'unknown receiver'
+        self.logger.debug("%s sends %s to %s", caller, message, destinations)
+        data = self.codec.encode(message)
+        for destination in destinations:
+            self.sim.transmit(caller, destination, data, priority)
+
+    def send_to_all(self, message: object, priority: int = BaseChannel.NORMAL) -> None:
+        self.send_to(self._decode_set(self.channel.smembers('members')), message, priority)
+
+    def __receive(self, senders, max_count: int, timeout) -> list:
+        # validate like Channel, so protocol bugs surface the same way
+        assert self.pid is not None and self.exists(self.pid), 'unknown receiver'
+        if senders is not None:
+            assert all(self.exists(sender) for sender in senders), 'unknown sender'
+        return [(sender, lab_codec.decode(data))
+                for sender, data in self.sim.receive(self.pid, senders, max_count, timeout)]
+
+    def receive_from_any(self, timeout: int = 0) -> tuple:
+        received: list = self.__receive(None, 1, timeout)
+        return received[0] if received else None
+
+    def receive_from(self, sender_set, timeout: int = 0) -> tuple:
+        received: list = self.__receive(set(sender_set), 1, timeout)
+        return received[0] if received else None
+
+    def receive_many(self, max_count: int, timeout: int = 0) -> list:
+        return self.__receive(None, max_count, timeout)
+
+    def receive_from_many(self, sender_set, max_count: int, timeout: int = 0) -> list:
+        return self.__receive(set(sender_set), max_count, timeout)
+
+    def flush(self) -> None:
+        pass
@@ -0,0 +1,117 @@
+"""
+Simulation unit tests
+"""
+
+import datetime
+import time
+import unittest
+
+from lib import lab_sim
+
+
+class Echo:
+    """Node answering every message until it has been idle for 10 (virtual) seconds"""
+
+    def __init__(self, chan):
+        self.chan = chan
+        self.chan.bind(self.chan.join('echo'))
+
+    def init(self):
+        pass
+
+    def run(self):
+        count = 0
+        while True:
+            received = self.chan.receive_from_any(timeout=10)
+            if received is None:
+                return count
+            self.chan.send_to({received[0]}, received[1])
+            count += 1
+
+
+class Client:
+    """Node sending numbered requests once a second, returning (virtual send time, round trip or None) per request"""
+
+    def __init__(self, chan):
+        self.chan = chan
+        self.chan.bind(self.chan.join('client'))
+
+    def init(self, count=5):
+        self.count = count
+
+    def run(self):
+        echo = self.chan.subgroup('echo').pop()
+        results = []
+        for i in range(self.count):
+            time.sleep(1)
+            sent = time.time()
+            self.chan.send_to({echo}, i)
+            received = self.chan.receive_from({echo}, timeout=0.5)
+            results.append((round(sent - lab_sim.EPOCH, 6),
+                            None if received is None else round(time.time() - sent, 6)))
+        return results
+
+
+class TestSimulation(unittest.TestCase):
+
+    @staticmethod
+    def simulate(count=5, crash=None, **options):
+        sim = lab_sim.Simulation(**options)
+        sim.launch('Echo', Echo)
+        sim.launch('Client', Client, init_args=(count,))
+        if crash is not None:
+            sim.crash('Echo', crash)
+        return sim.run()
+
+    def test_same_seed_same_run(self):
+        """Test that runs with the same seed (and random latency and loss) have the same outcome."""
+        runs = [self.simulate(count=50, latency=0.05, jitter=0.1, loss=0.3, seed=seed) for seed in (7, 7, 8)]
+        outcomes = [(run['results'], run['messages'], run['virtual_s']) for run in runs]
+        self.assertEqual(outcomes[0], outcomes[1])
+        self.assertNotEqual(outcomes[0], outcomes[2])
+
+    def test_virtual_time(self):
+        """Test that sleeps and receive timeouts advance the virtual clock without taking real time."""
+        report = self.simulate(latency=0.1)
+        # a second of sleep and a round trip of 2 * 0.1 seconds per request
+        self.assertEqual(report['results']['Client'], [(round(1 + 1.2 * i, 6), 0.2) for i in range(5)])
+        # the echo node stops 10 seconds after the last request
+        self.assertAlmostEqual(report['virtual_s'], 15.9)
+        self.assertLess(report['wall_s'], 5)
+
+    def test_latency_function_and_loss(self):
+        """Test per-link latencies and that lost messages time out."""
+        report = self.simulate(latency=lambda sender, receiver, rng: 0.2)
+        self.assertEqual([rtt for _, rtt in report['results']['Client']], [0.4] * 5)
+        report = self.simulate(latency=0.01, loss=1.0)
+        self.assertEqual([rtt for _, rtt in report['results']['Client']], [None] * 5)
+        self.assertEqual(report['results']['Echo'], 0)
+        self.assertEqual((report['messages']['sent'], report['messages']['lost']), (5, 5))
+
+    def test_crash(self):
+        """Test that a crashed node stops answering and is reported."""
+        report = self.simulate(crash=2.5)
+        self.assertEqual([rtt is not None for _, rtt in report['results']['Client']], [True, True, False, False, False])
+        self.assertEqual(report['crashed'], ['Echo'])
+        self.assertNotIn('Echo', report['results'])
+
+    def test_clocks_restored(self):
+        """Test that run() restores the clock functions it replaced."""
+        originals = (time.time, time.time_ns, time.monotonic, time.sleep, datetime.datetime)
+        self.simulate()
+        self.assertEqual((time.time, time.time_ns, time.monotonic, time.sleep, datetime.datetime), originals)
+        self.assertGreater(datetime.datetime.now().year, 2020)
+
+    def test_channel_validates_like_channel(self):
+        """Test that sends and receives involving unknown members fail with the assertions of Channel."""
+        sim = lab_sim.Simulation()
+        chan = sim.channel()
+        chan.bind(chan.join('node'))
+        with self.assertRaisesRegex(AssertionError, 'unknown receiver'):
+            chan.send_to({'unknown'}, 'to nobody')
+        with self.assertRaisesRegex(AssertionError, 'unknown sender'):
+            chan.receive_from({'unknown'}, timeout=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
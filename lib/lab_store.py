@@ -0,0 +1,451 @@
+"""
+Redis-free storage backends for lab_channel.
+
+MemoryStore implements the small subset of the redis client API used by the channel (sets, lists,
+blocking pops, pipelines and the channel's lua scripts) on plain python data structures.
+Values are kept and returned as bytes, like redis does, so code that accesses the store directly
+(e.g. chan.channel.smembers('node')) keeps working.
+
+Backends (selected via Channel(backend=...) or the VS2LAB_CHANNEL_BACKEND environment variable):
+
+memory
+    One MemoryStore per process, shared by all channels and threads of that process.
+    No serialization or IPC at all besides the message codec.
+local
+    One MemoryStore shared by a group of processes on the host.
+    The first channel of a process group hosts the store in a server thread of its process and
+    publishes the server address in the VS2LAB_CHANNEL_ADDRESS environment variable, which is
+    inherited by processes started afterwards (e.g. by multiprocessing). Calls travel over a
+    local (unix domain) socket, authenticated with the multiprocessing authkey of the group.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from multiprocessing.managers import BaseManager, BaseProxy
+
+# environment variable holding the address of the store server of the 'local' backend
+ADDRESS_ENV = 'VS2LAB_CHANNEL_ADDRESS'
+
+
+def _bytes(value) -> bytes:
+    # store values like redis does
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    return str(value).encode()
+
+
+def _keys(keys) -> list:
+    # redis-py accepts a single key or any iterable of keys
+    return [keys] if isinstance(keys, (str, bytes)) else list(keys)
+
+
+class StoreScript:
+    """Callable stand-in for a registered lua script, dispatching to the store implementation."""
+
+    def __init__(self, store, name: str):
+        self.store = store
+        self.name: str = name
+
+    def __call__(self, keys=(), args=(), client=None):
+        return self.store.script(self.name, list(keys), list(args))
+
+
+class StorePipeline:
+    """Buffers commands and applies them atomically on execute."""
+
+    def __init__(self, store):
+        self.store = store
+        self.commands: list = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.commands = []
+
+    def __getattr__(self, name: str):
+        def buffer(*args):
+            self.commands.append((name, args))
+            return self
+        return buffer
+
+    def execute(self) -> list:
+        commands, self.commands = self.commands, []
+        return self.store.execute(commands)
+
+
+class StoreClient:
+    """Client-side parts of the redis API, shared by MemoryStore and its proxy."""
+
+    def register_script(self, source: str) -> StoreScript:
+        # lazy import, lab_channel imports this module
+        from .lab_channel import BaseChannel
+        names = {BaseChannel.JOIN_SCRIPT: 'join',
+                 BaseChannel.SEND_SCRIPT: 'send',
+                 BaseChannel.SEND_ALL_SCRIPT: 'send_all',
+                 BaseChannel.DRAIN_SCRIPT: 'drain',
+                 BaseChannel.PUSH_SCRIPT: 'push'}
+        assert source in names, 'script not supported by store'
+        return StoreScript(self, names[source])
+
+    def pipeline(self, transaction: bool = True) -> StorePipeline:
+        return StorePipeline(self)
+
+
+class MemoryStore(StoreClient):
+    """
+    Thread-safe in-memory implementation of the redis commands used by the channel.
+    """
+
+    def __init__(self):
+        self.data = {}
+        # expiry times of keys with a ttl
+        self.expiry = {}
+        self.lock = threading.Lock()
+        # signalled whenever a list grows
+        self.pushed = threading.Condition(self.lock)
+
+    # --- plain commands (called with the lock held) ---
+
+    def _set(self, key: str) -> set:
+        return self.data.setdefault(key, set())
+
+    def _list(self, key: str) -> deque:
+        return self.data.setdefault(key, deque())
+
+    def _sadd(self, key: str, *values) -> int:
+        members = self._set(key)
+        size = len(members)
+        members.update(_bytes(value) for value in values)
+        return len(members) - size
+
+    def _srem(self, key: str, *values) -> int:
+        members = self.data.get(key, set())
+        size = len(members)
+        members.difference_update(_bytes(value) for value in values)
+        return size - len(members)
+
+    def _rpush(self, key: str, *values) -> int:
+        queue = self._list(key)
+        queue.extend(_bytes(value) for value in values)
+        self.pushed.notify_all()
+        return len(queue)
+
+    def _lpop(self, key: str):
+        queue = self.data.get(key)
+        if not queue:
+            return None
+        value = queue.popleft()
+        if not queue:
+            # like redis, an emptied list ceases to exist (including its ttl)
+            self.expiry.pop(key, None)
+        return value
+
+    def _llen(self, key: str) -> int:
+        return len(self.data.get(key, ()))
+
+    def _ltrim(self, key: str, start: int, stop: int) -> bool:
+        # only the negative indices used by the channel (keep the last -start elements)
+        assert start < 0 and stop == -1, 'only trimming to the tail is supported'
+        queue = self.data.get(key)
+        while queue and len(queue) > -start:
+            queue.popleft()
+        return True
+
+    def _expire(self, key: str, seconds: int) -> bool:
+        if not self.data.get(key):
+            return False
+        self.expiry[key] = time.time() + seconds
+        return True
+
+    def _delete(self, *keys) -> int:
+        for key in keys:
+            self.expiry.pop(key, None)
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def _purge(self) -> None:
+        # drop expired keys (lazily, before commands that touch queues)
+        if self.expiry:
+            now = time.time()
+            for key in [key for key, deadline in self.expiry.items() if deadline <= now]:
+                self._delete(key)
+
+    @staticmethod
+    def _publish(channel: str, message) -> int:
+        # there are no subscribers (member caches require redis)
+        return 0
+
+    # --- redis API ---
+
+    def sadd(self, key: str, *values) -> int:
+        with self.lock:
+            return self._sadd(key, *values)
+
+    def srem(self, key: str, *values) -> int:
+        with self.lock:
+            return self._srem(key, *values)
+
+    def smembers(self, key: str) -> set:
+        with self.lock:
+            return set(self.data.get(key, ()))
+
+    def sismember(self, key: str, value) -> bool:
+        with self.lock:
+            return _bytes(value) in self.data.get(key, ())
+
+    def smismember(self, key: str, values) -> list:
+        with self.lock:
+            members = self.data.get(key, ())
+            return [int(_bytes(value) in members) for value in values]
+
+    def scard(self, key: str) -> int:
+        with self.lock:
+            return len(self.data.get(key, ()))
+
+    def rpush(self, key: str, *values) -> int:
+        with self.lock:
+            return self._rpush(key, *values)
+
+    def lpop(self, key: str):
+        with self.lock:
+            return self._lpop(key)
+
+    def llen(self, key: str) -> int:
+        with self.lock:
+            return len(self.data.get(key, ()))
+
+    def expire(self, key: str, seconds: int) -> bool:
+        with self.lock:
+            self._purge()
+            return self._expire(key, seconds)
+
+    def publish(self, channel: str, message) -> int:
+        return self._publish(channel, message)
+
+    def delete(self, *keys) -> int:
+        with self.lock:
+            return self._delete(*keys)
+
+    def keys(self, pattern: str = '*') -> list:
+        assert pattern == '*', 'only the * pattern is supported'
+        with self.lock:
+            return [key.encode() for key, value in self.data.items() if value]
+
+    def flushall(self) -> bool:
+        with self.lock:
+            self.data.clear()
+            self.expiry.clear()
+        return True
+
+    def blpop(self, keys, timeout: float = 0):
+        """
+        Pop the first element of the first non-empty list, waiting up to timeout seconds (0: forever).
+        """
+        keys = _keys(keys)
+        deadline = time.time() + timeout if timeout else None
+        with self.lock:
+            while True:
+                self._purge()
+                for key in keys:
+                    value = self._lpop(key)
+                    if value is not None:
+                        return key.encode(), value
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.pushed.wait(remaining)
+
+    def execute(self, commands: list) -> list:
+        """
+        Apply buffered pipeline commands atomically.
+        """
+        with self.lock:
+            self._purge()
+            return [getattr(self, '_' + name)(*args) for name, args in commands]
+
+    # --- channel scripts (see the lua sources in lab_channel.BaseChannel) ---
+
+    def script(self, name: str, keys: list, args: list):
+        with self.lock:
+            self._purge()
+            return getattr(self, '_script_' + name)(keys, args)
+
+    def _script_join(self, keys: list, args: list):
+        for candidate in args[2:]:
+            if self._sadd(keys[0], candidate) == 1:
+                self._sadd(keys[1], candidate)
+                return _bytes(candidate)
+        return None
+
+    def _script_push(self, keys: list, args: list) -> bytes:
+        message, capacity, overflow, ttl = args[0], int(args[1]), args[2], int(args[3])
+        if capacity > 0 and overflow != 'drop':
+            if any(self._llen(key) >= capacity for key in keys):
+                return b'queue full'
+        for key in keys:
+            self._rpush(key, message)
+            if capacity > 0 and overflow == 'drop':
+                self._ltrim(key, -capacity, -1)
+            if ttl > 0:
+                self._expire(key, ttl)
+        return b'OK'
+
+    def _script_send(self, keys: list, args: list) -> bytes:
+        members = self.data.get(keys[0], ())
+        if _bytes(args[1]) not in members:
+            return b'unknown sender'
+        if not all(_bytes(destination) in members for destination in args[5:]):
+            return b'unknown receiver'
+        return self._script_push(keys[1:], [args[0]] + args[2:5])
+
+    def _script_send_all(self, keys: list, args: list) -> bytes:
+        members = self.data.get(keys[0], ())
+        if _bytes(args[1]) not in members:
+            return b'unknown sender'
+        queues: list = [args[5] + member.decode() + args[6] for member in members]
+        return self._script_push(queues, [args[0]] + args[2:5])
+
+    def _script_drain(self, keys: list, args: list) -> list:
+        result: list = []
+        remaining = int(args[0])
+        leading = int(args[1]) if len(args) > 1 else 0
+        ttl = int(args[2]) if len(args) > 2 else 0
+        # drain the leading (high priority) queues first
+        for group in (keys[:leading], keys[leading:]):
+            active = True
+            while active and remaining > 0:
+                active = False
+                for key in group:
+                    if remaining > 0:
+                        value = self._lpop(key)
+                        if value is not None:
+                            result += [key.encode(), value]
+                            remaining -= 1
+                            active = True
+                            if ttl > 0:
+                                self._expire(key, ttl)
+        return result
+
+
+class StoreProxy(StoreClient, BaseProxy):
+    """Proxy of a MemoryStore hosted by the store server (one connection per thread)."""
+
+    _exposed_ = ('sadd', 'srem', 'smembers', 'sismember', 'smismember', 'scard', 'rpush', 'lpop', 'llen', 'expire',
+                 'publish', 'delete', 'keys', 'flushall', 'blpop', 'execute', 'script')
+
+    def sadd(self, key, *values):
+        return self._callmethod('sadd', (key,) + values)
+
+    def srem(self, key, *values):
+        return self._callmethod('srem', (key,) + values)
+
+    def smembers(self, key):
+        return self._callmethod('smembers', (key,))
+
+    def sismember(self, key, value):
+        return self._callmethod('sismember', (key, value))
+
+    def smismember(self, key, values):
+        return self._callmethod('smismember', (key, list(values)))
+
+    def scard(self, key):
+        return self._callmethod('scard', (key,))
+
+    def rpush(self, key, *values):
+        return self._callmethod('rpush', (key,) + values)
+
+    def lpop(self, key):
+        return self._callmethod('lpop', (key,))
+
+    def llen(self, key):
+        return self._callmethod('llen', (key,))
+
+    def expire(self, key, seconds):
+        return self._callmethod('expire', (key, seconds))
+
+    def publish(self, channel, message):
+        return self._callmethod('publish', (channel, message))
+
+    def delete(self, *keys):
+        return self._callmethod('delete', keys)
+
+    def keys(self, pattern='*'):
+        return self._callmethod('keys', (pattern,))
+
+    def flushall(self):
+        return self._callmethod('flushall')
+
+    def blpop(self, keys, timeout=0):
+        return self._callmethod('blpop', (_keys(keys), timeout))
+
+    def execute(self, commands):
+        return self._callmethod('execute', (commands,))
+
+    def script(self, name, keys, args):
+        return self._callmethod('script', (name, keys, args))
+
+
+# the store of this process (memory backend, or local backend if this process hosts the server)
+_store = MemoryStore()
+
+
+def _get_store() -> MemoryStore:
+    return _store
+
+
+class StoreManager(BaseManager):
+    """Manager serving the store of the 'local' backend."""
+
+
+StoreManager.register('store', callable=_get_store, proxytype=StoreProxy)
+
+# explicit context for store managers (the default context would fix the start method of the application)
+_CONTEXT = multiprocessing.get_context('spawn')
+
+# store server hosted by this process and connected proxies, by os pid (proxies do not survive fork)
+_server = None
+_proxies = {}
+
+
+def serve() -> str:
+    """
+    Serve the store of this process to other processes from a background thread ('local' backend).
+    The server runs in a thread rather than a server process, so the application can still choose
+    its start method.
+    :return: address of the store server
+    """
+    global _server
+    _server = StoreManager(ctx=_CONTEXT).get_server()
+    # serve_forever accepts connections in a thread of its own and waits for a shutdown request;
+    # in a daemon thread it neither blocks the caller nor ends the process (its final sys.exit
+    # only ends that thread)
+    threading.Thread(target=_server.serve_forever, name='vs2lab-store-server', daemon=True).start()
+    return _server.address
+
+
+def connect(backend: str):
+    """
+    Get the store for a channel backend.
+    :param backend: 'memory' or 'local'
+    :return: store object with a redis-like API
+    """
+    if backend == 'memory':
+        return _store
+    assert backend == 'local', 'unknown channel backend ' + backend
+
+    proxy = _proxies.get(os.getpid())
+    if proxy is None:
+        address = os.environ.get(ADDRESS_ENV)
+        if address is None:
+            # first channel of the process group: serve the store and publish the address to
+            # processes started later
+            address = serve()
+            os.environ[ADDRESS_ENV] = address
+        manager = StoreManager(address=address, ctx=_CONTEXT)
+        manager.connect()
+        proxy = manager.store()
+        _proxies[os.getpid()] = proxy
+    return proxy
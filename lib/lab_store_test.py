@@ -0,0 +1,37 @@
+"""
+Store unit tests
+"""
+
+import unittest
+
+from lib import lab_store
+
+
+def exchange(address, key):
+    """Connect a child process to the store server, pop the parent's value and answer"""
+    manager = lab_store.StoreManager(address=address, ctx=lab_store._CONTEXT)
+    manager.connect()
+    store = manager.store()
+    value = store.lpop(key)
+    store.rpush(key + ':reply', value + b' back')
+
+
+class TestServe(unittest.TestCase):
+
+    def test_serve_to_other_process(self):
+        """Test that a spawned process shares the store served by this process."""
+        address = lab_store.serve()
+        manager = lab_store.StoreManager(address=address, ctx=lab_store._CONTEXT)
+        manager.connect()
+        store = manager.store()
+        store.rpush('test-serve', b'ping')
+        process = lab_store._CONTEXT.Process(target=exchange, args=(address, 'test-serve'))
+        process.start()
+        process.join(30)
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(store.lpop('test-serve:reply'), b'ping back')
+        self.assertEqual(store.llen('test-serve'), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()